@@ -6,33 +6,108 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
-from config import BOT_TOKEN
+from config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_MAX_WAITING,
+)
 from database.db import init_db, close_db
-from handlers import common, people, notes
+from handlers import (
+    admin,
+    common,
+    export,
+    importer,
+    notes,
+    people,
+    search,
+    similar,
+    tags,
+    todos,
+)
+from middlewares.ownership import OwnershipMiddleware
+from middlewares.scheduler import UpdateScheduler
+from middlewares.users import UserUpsertMiddleware
+from services import analysis_queue, mood_charts
+from services import similar as similar_service
+from services import export as export_service
+from services import importer as import_service
+from services.fsm_storage import create_fsm_storage
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
 
-async def main():
-    # Инициализация бота
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher()
+def setup_dispatcher() -> Dispatcher:
+    # Состояния диалогов переживают рестарт (FSM_STORAGE, по умолчанию — БД).
+    dp = Dispatcher(storage=create_fsm_storage())
+
+    # Апдейты пользователя — по очереди, всего — не больше лимита. Ставим
+    # перед FSM-middleware, чтобы состояние читалось под замком пользователя.
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(UpdateScheduler())
+    dp.update.outer_middleware(dp.fsm)
+
+    # Строка users создаётся/обновляется до хендлеров (раз в TTL на пользователя).
+    dp.update.outer_middleware(UserUpsertMiddleware())
+
+    # Проверка владельца встреч/заметок из кэша (параметр ownership хендлеров).
+    # Внутренние middleware корневого роутера действуют на все вложенные.
+    ownership = OwnershipMiddleware()
+    dp.message.middleware(ownership)
+    dp.callback_query.middleware(ownership)
 
     # Регистрация роутеров
+    dp.include_router(admin.router)
     dp.include_router(common.router)
+    dp.include_router(search.router)
+    dp.include_router(export.router)
+    dp.include_router(importer.router)
+    dp.include_router(todos.router)
+    dp.include_router(tags.router)
+    dp.include_router(similar.router)
     dp.include_router(people.router)
     dp.include_router(notes.router)
+    return dp
+
+
+async def main():
+    # Инициализация бота
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = setup_dispatcher()
 
     # Инициализация БД
     await init_db()
     logging.info("Database initialized")
 
+    # Фоновые воркеры AI-анализа (очередь в таблице analysis_jobs)
+    await analysis_queue.start_workers(bot)
+    # Процессы рендера графиков поднимаются в фоне, старт бота не ждёт.
+    mood_charts.start()
+
     try:
-        # Запуск поллинга
-        logging.info("Starting bot...")
-        await dp.start_polling(bot)
+        logging.info("Starting bot (%s)...", BOT_MODE)
+        if BOT_MODE == "webhook":
+            # AICODE-NOTE: Локальный импорт — aiohttp-сервер нужен только
+            # в режиме вебхука.
+            from webhook import run_webhook
+
+            await run_webhook(bot, dp)
+        else:
+            # Запуск поллинга. Пока в работе столько апдейтов, новые не
+            # забираем — они подождут в Telegram.
+            await dp.start_polling(
+                bot,
+                tasks_concurrency_limit=SCHEDULER_MAX_CONCURRENCY + SCHEDULER_MAX_WAITING,
+            )
     finally:
+        await analysis_queue.stop_workers()
+        await export_service.stop()
+        await import_service.stop()
+        mood_charts.shutdown()
+        similar_service.close()
+        # Дописываем буфер состояний FSM, пока БД открыта
+        await dp.storage.close()
         # Закрытие соединения с БД при остановке
         await close_db()
         logging.info("Database connection closed")
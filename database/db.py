@@ -1,13 +1,129 @@
 from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
 from config import DATABASE_URL
+from database.models import MeetingNote
+from services.search import ensure_search_index
+from utils.text import make_snippet
+
+# AICODE-NOTE: generate_schemas создаёт только недостающие таблицы и не делает
+# ALTER. Новые колонки в уже существующих таблицах добавляем здесь:
+# (таблица, колонка, DDL колонки). Для новой БД колонки уже есть — пропуск.
+COLUMN_MIGRATIONS = [
+    (
+        "meeting_notes",
+        "analysis_status",
+        "VARCHAR(16) NOT NULL DEFAULT 'done'",
+    ),
+    ("meeting_notes", "prompt_fingerprint", "VARCHAR(16)"),
+    ("meeting_notes", "is_stale", "BOOL NOT NULL DEFAULT FALSE"),
+    ("analysis_jobs", "back_callback", "VARCHAR(64)"),
+    ("analysis_jobs", "priority", "SMALLINT NOT NULL DEFAULT 0"),
+    ("people", "notes_count", "INT NOT NULL DEFAULT 0"),
+    ("meeting_notes", "snippet", "VARCHAR(32)"),
+    ("analysis_jobs", "claimed_by", "VARCHAR(64)"),
+    ("people", "mood_version", "INT NOT NULL DEFAULT 0"),
+]
+
+
+async def _backfill_snippets(batch_size: int = 500):
+    while True:
+        rows = await (
+            MeetingNote.filter(snippet__isnull=True)
+            .limit(batch_size)
+            .values_list("id", "raw_text")
+        )
+        if not rows:
+            return
+        async with in_transaction():
+            for note_id, raw_text in rows:
+                await MeetingNote.filter(id=note_id).update(
+                    snippet=make_snippet(raw_text)
+                )
+
+
+# Заполнение только что добавленной колонки по существующим данным:
+# SQL или async-функция (если логику не выразить переносимым SQL).
+COLUMN_BACKFILLS = {
+    ("meeting_notes", "snippet"): _backfill_snippets,
+    ("people", "notes_count"): (
+        'UPDATE "people" SET "notes_count" = ('
+        'SELECT COUNT(*) FROM "meeting_notes" '
+        'WHERE "meeting_notes"."person_id" = "people"."id")'
+    ),
+}
+
+# Индексы, которые Tortoise не умеет описать в модели (порядок DESC и т.п.).
+# CREATE INDEX IF NOT EXISTS одинаково работает в SQLite и PostgreSQL.
+INDEX_MIGRATIONS = [
+    # История заметок: WHERE person_id = ? ORDER BY created_at DESC, id DESC.
+    (
+        "idx_meeting_notes_person_created",
+        "meeting_notes",
+        '"person_id", "created_at" DESC, "id" DESC',
+    ),
+    # Задачи: WHERE user_id = ? AND status = ? ORDER BY created_at DESC, id DESC.
+    (
+        "idx_action_items_user_status",
+        "action_items",
+        '"user_id", "status", "created_at" DESC, "id" DESC',
+    ),
+    # Заметки тега: WHERE tag_id = ? ORDER BY created_at DESC, note_id DESC.
+    (
+        "idx_note_tags_tag_created",
+        "note_tags",
+        '"tag_id", "created_at" DESC, "note_id" DESC',
+    ),
+]
+
+
+async def _table_columns(table: str) -> set[str]:
+    conn = Tortoise.get_connection("default")
+    if conn.capabilities.dialect == "sqlite":
+        rows = await conn.execute_query_dict(f'PRAGMA table_info("{table}")')
+        return {row["name"] for row in rows}
+
+    rows = await conn.execute_query_dict(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = $1",
+        [table],
+    )
+    return {row["column_name"] for row in rows}
+
+
+async def _apply_column_migrations():
+    conn = Tortoise.get_connection("default")
+    for table, column, ddl in COLUMN_MIGRATIONS:
+        if column in await _table_columns(table):
+            continue
+        await conn.execute_script(
+            f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}'
+        )
+        backfill = COLUMN_BACKFILLS.get((table, column))
+        if isinstance(backfill, str):
+            await conn.execute_script(backfill)
+        elif backfill:
+            await backfill()
+
+
+async def _apply_index_migrations():
+    conn = Tortoise.get_connection("default")
+    for name, table, columns in INDEX_MIGRATIONS:
+        await conn.execute_script(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({columns})'
+        )
+
 
 async def init_db():
     await Tortoise.init(
         db_url=DATABASE_URL,
         modules={'models': ['database.models']}
     )
-    # Генерация схемы (таблиц) при старте. 
+    # Генерация схемы (таблиц) при старте.
     await Tortoise.generate_schemas()
+    await _apply_column_migrations()
+    await _apply_index_migrations()
+    await ensure_search_index()
 
 async def close_db():
     await Tortoise.close_connections()
@@ -23,6 +23,13 @@ class Person(models.Model):
     # Если не задан, используется дефолтный.
     custom_prompt = fields.TextField(null=True)
 
+    # Денормализованный счётчик заметок (ведёт services/notes.py), чтобы
+    # история не делала COUNT(*) на каждой странице.
+    notes_count = fields.IntField(default=0)
+    # Растёт при каждом изменении агрегатов настроения (mood_rollups) —
+    # ключ кэша графика.
+    mood_version = fields.IntField(default=0)
+
     created_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
@@ -59,6 +66,9 @@ class MeetingNote(models.Model):
     id = fields.UUIDField(pk=True)
     person = fields.ForeignKeyField("models.Person", related_name="notes")
     raw_text = fields.TextField()
+    # Однострочное начало raw_text для списков (история), пишется вместе с
+    # текстом — списки не читают raw_text целиком.
+    snippet = fields.CharField(max_length=32, null=True)
 
     # Результат анализа AI (JSON)
     # Структура: { "mood": 5, "summary": "...", "action_items": [], "tags": [] }
@@ -68,6 +78,15 @@ class MeetingNote(models.Model):
     # хотя они могут дублироваться в JSON
     stress_level = fields.IntField(null=True)
 
+    # Статус AI-анализа: pending (в очереди), done, failed.
+    analysis_status = fields.CharField(max_length=16, default="done")
+
+    # AICODE-NOTE: Отпечаток промпта (системный + кастомный + модель), с
+    # которым получен ai_summary. is_stale — промпт человека с тех пор
+    # изменился, разбор будет пересчитан (лениво при просмотре или в фоне).
+    prompt_fingerprint = fields.CharField(max_length=16, null=True)
+    is_stale = fields.BooleanField(default=False, index=True)
+
     created_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
@@ -76,3 +95,241 @@ class MeetingNote(models.Model):
 
     def __str__(self):
         return f"Note for {self.person_id} at {self.created_at}"
+
+
+class MoodRollup(models.Model):
+    """
+    Агрегат настроения (stress_level) по встрече за день или неделю.
+    Ведёт services/mood_rollups.py; учитываются только заметки с оценкой.
+    """
+
+    id = fields.IntField(pk=True)
+    person = fields.ForeignKeyField("models.Person", related_name="mood_rollups")
+    # d — день, w — неделя (с понедельника). Границы — по UTC.
+    period = fields.CharField(max_length=1)
+    period_start = fields.DateField()
+    count = fields.IntField()
+    # Сумма оценок: среднее = total / count, недели складываются из дней.
+    total = fields.IntField()
+    min_mood = fields.IntField()
+    max_mood = fields.IntField()
+    last_mood = fields.IntField()
+    last_at = fields.DatetimeField()
+
+    class Meta:
+        table = "mood_rollups"
+        unique_together = (
+            ("person", "period", "period_start"),
+        )
+
+    def __str__(self):
+        return f"Mood {self.period} {self.period_start} for {self.person_id}"
+
+
+class MoodChart(models.Model):
+    """
+    file_id последнего отправленного графика настроения встречи: повторный
+    показ той же версии данных не загружает картинку заново.
+    """
+
+    person = fields.OneToOneField("models.Person", related_name="mood_chart", pk=True)
+    version = fields.IntField()
+    file_id = fields.CharField(max_length=255)
+
+    class Meta:
+        table = "mood_charts"
+
+
+class DigestPartial(models.Model):
+    """
+    Выжимка заметок встречи за неделю (с понедельника, по UTC) для
+    дайджеста: повторный дайджест не перечитывает старые недели. Ведёт
+    services/digests.py; строка удаляется, когда заметки недели меняются.
+    """
+
+    id = fields.IntField(pk=True)
+    person = fields.ForeignKeyField("models.Person", related_name="digest_partials")
+    week_start = fields.DateField()
+    # Сколько заметок было в неделе при сборке выжимки.
+    notes_count = fields.IntField()
+    # Отпечаток промпта выжимки и модели (services/llm.digest_fingerprint).
+    fingerprint = fields.CharField(max_length=16)
+    summary = fields.JSONField()
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "digest_partials"
+        unique_together = (
+            ("person", "week_start"),
+        )
+
+    def __str__(self):
+        return f"Digest week {self.week_start} for {self.person_id}"
+
+
+class ActionItem(models.Model):
+    """
+    Задача из разбора заметки (ai_summary["action_items"]) отдельной строкой:
+    список задач по всем встречам — один запрос по индексу
+    (user_id, status, created_at). Ведёт services/action_items.py.
+    """
+
+    id = fields.IntField(pk=True)
+    note = fields.ForeignKeyField(
+        "models.MeetingNote",
+        related_name="todos",
+        on_delete=fields.CASCADE,
+        index=True,
+    )
+    person = fields.ForeignKeyField(
+        "models.Person",
+        related_name="todos",
+        on_delete=fields.CASCADE,
+    )
+    user = fields.ForeignKeyField(
+        "models.User",
+        related_name="todos",
+        on_delete=fields.CASCADE,
+    )
+    # Порядок задачи в разборе.
+    position = fields.SmallIntField(default=0)
+    text = fields.TextField()
+    # open / done
+    status = fields.CharField(max_length=8, default="open")
+    # Дата заметки (встречи), а не момент разбора.
+    created_at = fields.DatetimeField()
+
+    class Meta:
+        table = "action_items"
+
+    def __str__(self):
+        return self.text
+
+
+class Tag(models.Model):
+    """
+    Хештег пользователя из разборов заметок. Имя — нормализованное, без «#».
+    notes_count ведёт services/tags.py при каждой записи разбора.
+    """
+
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField(
+        "models.User",
+        related_name="tags",
+        on_delete=fields.CASCADE,
+    )
+    name = fields.CharField(max_length=64)
+    notes_count = fields.IntField(default=0)
+
+    class Meta:
+        table = "tags"
+        unique_together = (
+            ("user", "name"),
+        )
+
+    def __str__(self):
+        return f"#{self.name}"
+
+
+class NoteTag(models.Model):
+    """
+    Связь заметка — тег (многие ко многим). created_at — дата заметки:
+    заметки тега листаются по индексу (tag_id, created_at, note_id).
+    """
+
+    id = fields.IntField(pk=True)
+    note = fields.ForeignKeyField(
+        "models.MeetingNote",
+        related_name="tag_links",
+        on_delete=fields.CASCADE,
+    )
+    tag = fields.ForeignKeyField(
+        "models.Tag",
+        related_name="note_links",
+        on_delete=fields.CASCADE,
+    )
+    created_at = fields.DatetimeField()
+
+    class Meta:
+        table = "note_tags"
+        unique_together = (
+            ("note", "tag"),
+        )
+
+
+class AnalysisCacheEntry(models.Model):
+    # AICODE-NOTE: key — sha256 от (нормализованный текст, полный системный
+    # промпт, модель). Одинаковый вход -> тот же результат без вызова API.
+    key = fields.CharField(max_length=64, pk=True)
+    model = fields.CharField(max_length=64)
+    result = fields.JSONField()
+    hits = fields.IntField(default=0)
+    created_at = fields.DatetimeField(auto_now_add=True, index=True)
+    last_used_at = fields.DatetimeField(auto_now_add=True, index=True)
+
+    class Meta:
+        table = "analysis_cache"
+
+    def __str__(self):
+        return f"Analysis cache {self.key[:12]}"
+
+
+class AnalysisJob(models.Model):
+    """
+    Задача фонового AI-анализа заметки (очередь в БД, переживает рестарт).
+    """
+
+    id = fields.IntField(pk=True)
+    note = fields.ForeignKeyField(
+        "models.MeetingNote",
+        related_name="analysis_jobs",
+        on_delete=fields.CASCADE,
+    )
+    # Куда доставить результат: сообщение бота, которое нужно отредактировать.
+    chat_id = fields.BigIntField(null=True)
+    message_id = fields.BigIntField(null=True)
+    title = fields.CharField(max_length=64, default="Заметка сохранена")
+    # callback_data кнопки «назад» у доставленного результата (если открыто
+    # из истории).
+    back_callback = fields.CharField(max_length=64, null=True)
+
+    # Меньше — важнее: 0 — пользователь ждёт, 10 — фоновый пересчёт.
+    priority = fields.SmallIntField(default=0)
+    status = fields.CharField(max_length=16, default="pending", index=True)
+    # Процесс, который выполняет задачу (host:WORKER_ID или host:pid<pid>) —
+    # воркер supervisor.py при рестарте сразу возвращает в очередь свои
+    # прерванные задачи. Остальные возвращаются,
+    # когда истекла аренда (updated_at старше ANALYSIS_LEASE_SECONDS).
+    claimed_by = fields.CharField(max_length=64, null=True)
+    attempts = fields.IntField(default=0)
+    next_run_at = fields.DatetimeField(index=True)
+    last_error = fields.TextField(null=True)
+
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "analysis_jobs"
+
+    def __str__(self):
+        return f"Analysis job {self.id} for {self.note_id} ({self.status})"
+
+
+class FsmRecord(models.Model):
+    """
+    Состояние FSM aiogram (services/fsm_storage.py): переживает рестарт и
+    доступно любому процессу бота.
+    """
+
+    # Ключ DefaultKeyBuilder: fsm:<bot_id>:<chat_id>:<user_id>
+    key = fields.CharField(max_length=255, pk=True)
+    state = fields.CharField(max_length=255, null=True)
+    data = fields.JSONField(default=dict)
+    # Брошенные состояния удаляются после этого момента.
+    expires_at = fields.DatetimeField(index=True)
+
+    class Meta:
+        table = "fsm_states"
+
+    def __str__(self):
+        return f"FSM {self.key}: {self.state}"
@@ -0,0 +1,26 @@
+import html
+
+from aiogram import Router, types
+from aiogram.filters import Command
+
+from config import ADMIN_IDS
+from services import metrics
+
+router = Router()
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    """
+    Служебные метрики (очередь анализа, кэши и т.п.). Только для ADMIN_IDS.
+    """
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    lines = ["📊 <b>Статистика</b>"]
+    for source, values in (await metrics.collect()).items():
+        lines.append(f"\n<b>{html.escape(source)}</b>")
+        for key, value in values.items():
+            lines.append(f"{html.escape(str(key))}: {html.escape(str(value))}")
+
+    await message.answer("\n".join(lines))
@@ -1,34 +1,19 @@
 from aiogram import F, Router, types
 from aiogram.filters import Command, CommandStart
 
-from database.models import Person, User
+from handlers.todos import build_todos_page
 from keyboards.main_menu import MAIN_MENU_BUTTONS, get_main_menu_keyboard
+from services import people_cache
 
 router = Router()
 
 
 @router.message(CommandStart())
 async def cmd_start(message: types.Message):
+    # Строку users создаёт и обновляет middlewares/users.py.
     user_id = message.from_user.id
-    username = message.from_user.username
     full_name = message.from_user.full_name
 
-    # Создаем или обновляем пользователя в БД
-    user, created = await User.get_or_create(
-        id=user_id,
-        defaults={
-            "username": username,
-            "full_name": full_name,
-        },
-    )
-
-    # Если пользователь уже был, обновляем данные (например, если сменил ник)
-    if not created:
-        if user.username != username or user.full_name != full_name:
-            user.username = username
-            user.full_name = full_name
-            await user.save()
-
     welcome_text = (
         f"Привет, {full_name}!\n\n"
         "Я помогу быстро сохранять заметки по 1‑1/встречам и показывать "
@@ -39,8 +24,7 @@ async def cmd_start(message: types.Message):
 
     await message.answer(welcome_text, reply_markup=get_main_menu_keyboard())
 
-    people_count = await Person.filter(user_id=user_id).count()
-    if people_count == 0:
+    if not (await people_cache.get(user_id)).people:
         await message.answer(
             "Похоже, у тебя пока нет ни одной встречи.\n"
             "Нажми **📅 Встречи** → **➕ Добавить новую** или введи команду "
@@ -58,7 +42,12 @@ async def cmd_help(message: types.Message):
         "<b>Команды</b>:\n"
         "/start — перезапустить приветствие\n"
         "/my_team — список встреч\n"
-        "/add_person — добавить встречу\n\n"
+        "/add_person — добавить встречу\n"
+        "/search слова — поиск по заметкам\n"
+        "/todos — открытые задачи по всем встречам\n"
+        "/tags — теги заметок и заметки по тегу\n"
+        "/export — выгрузить все заметки (JSONL, CSV, Markdown)\n"
+        "/import — загрузить заметки из файла\n\n"
         "<b>Как добавить заметку</b>:\n"
         "📅 Встречи → выбрать встречу → 📝 Добавить заметку\n"
     )
@@ -76,9 +65,8 @@ async def main_menu_router(message: types.Message):
         # Показываем список встреч (там же можно добавить заметку через
         # действия).
         # Дублируем логику /my_team, чтобы меню работало без знания команд.
-        user_id = message.from_user.id
-        people = await Person.filter(user_id=user_id).all()
-        if not people:
+        cached = await people_cache.get(message.from_user.id)
+        if not cached.people:
             await message.answer(
                 "У вас пока нет встреч. Нажмите /add_person или "
                 "добавьте через кнопку ниже.",
@@ -86,36 +74,34 @@ async def main_menu_router(message: types.Message):
             )
             return
 
-        # AICODE-NOTE: Локальный импорт, чтобы избежать циклических импортов.
-        from keyboards.people_kb import get_people_keyboard
-
         await message.answer(
             "📅 <b>Ваши встречи:</b>\nВыберите встречу для работы:",
-            reply_markup=get_people_keyboard(people),
+            reply_markup=cached.markup,
         )
         return
 
     if label == "🕘 История":
         # Быстрый вход: показываем список встреч, далее история доступна из
         # действий.
-        user_id = message.from_user.id
-        people = await Person.filter(user_id=user_id).all()
-        if not people:
+        cached = await people_cache.get(message.from_user.id)
+        if not cached.people:
             await message.answer(
                 "Пока нет встреч и заметок. Добавь встречу через /add_person.",
                 reply_markup=get_main_menu_keyboard(),
             )
             return
 
-        # AICODE-NOTE: Локальный импорт, чтобы избежать циклических импортов.
-        from keyboards.people_kb import get_people_keyboard
-
         await message.answer(
             "🕘 Выберите встречу, чтобы посмотреть историю заметок:",
-            reply_markup=get_people_keyboard(people),
+            reply_markup=cached.markup,
         )
         return
 
+    if label == "📋 Задачи":
+        text, kb = await build_todos_page(message.from_user.id)
+        await message.answer(text, reply_markup=kb)
+        return
+
     if label == "⚙️ Настройки":
         await message.answer(
             "⚙️ <b>Настройки</b>\n\n"
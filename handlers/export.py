@@ -0,0 +1,47 @@
+from aiogram import F, Router, types
+from aiogram.filters import Command, CommandObject
+
+from keyboards.export_kb import get_export_formats_keyboard
+from services import export
+
+router = Router()
+
+
+def _start(bot, chat_id: int, user_id: int, fmt: str) -> str:
+    if not export.start_export(bot, chat_id, user_id, fmt):
+        return "⏳ Экспорт уже готовится — пришлю файл, когда он будет готов."
+    return (
+        f"⏳ Готовлю экспорт ({export.FORMATS[fmt]}). "
+        "Пришлю архив отдельным сообщением, бот пока доступен."
+    )
+
+
+@router.message(Command("export"))
+async def cmd_export(message: types.Message, command: CommandObject):
+    fmt = (command.args or "").strip().lower()
+    if fmt in export.FORMATS:
+        await message.answer(
+            _start(message.bot, message.chat.id, message.from_user.id, fmt)
+        )
+        return
+
+    await message.answer(
+        "📦 Экспорт всех заметок. Выберите формат:",
+        reply_markup=get_export_formats_keyboard(),
+    )
+
+
+@router.callback_query(F.data.startswith("export:"))
+async def callback_export(callback: types.CallbackQuery):
+    """
+    callback_data: export:<format>
+    """
+    fmt = callback.data.split(":", 1)[1]
+    if fmt not in export.FORMATS:
+        await callback.answer("Некорректная команда", show_alert=True)
+        return
+
+    await callback.message.edit_text(
+        _start(callback.bot, callback.message.chat.id, callback.from_user.id, fmt)
+    )
+    await callback.answer()
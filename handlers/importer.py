@@ -0,0 +1,64 @@
+from aiogram import F, Router, types
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+
+from keyboards.people_kb import get_cancel_keyboard
+from services import importer
+
+router = Router()
+
+
+class ImportState(StatesGroup):
+    waiting_for_file = State()
+
+
+@router.message(Command("import"))
+async def cmd_import(message: types.Message, state: FSMContext):
+    await message.answer(
+        "📥 Пришлите файл с заметками — в тех же форматах, что и /export:\n"
+        "• <b>JSONL</b> — строки с полями person, raw_text, created_at;\n"
+        "• <b>CSV</b> — колонки person, raw_text, created_at;\n"
+        "• <b>Markdown</b> — «# Встреча», под ней «## 2024-03-01 10:00» и текст.\n"
+        "Можно сжать gzip (.gz), до 20 МБ. Встречи создаются по названию, "
+        "AI-разбор пройдёт в фоне.",
+        reply_markup=get_cancel_keyboard(),
+    )
+    await state.set_state(ImportState.waiting_for_file)
+
+
+@router.message(ImportState.waiting_for_file, F.document)
+async def process_import_file(message: types.Message, state: FSMContext):
+    document = message.document
+    fmt = importer.detect_format(document.file_name)
+    if fmt is None:
+        await message.answer(
+            "Не знаю такой формат. Нужен файл .jsonl, .csv или .md (можно .gz)."
+        )
+        return
+    if document.file_size and document.file_size > importer.MAX_FILE_BYTES:
+        await message.answer("Файл больше 20 МБ — разбейте его на части.")
+        return
+
+    await state.clear()
+    progress = await message.answer("⏳ Загружаю файл…")
+    started = importer.start_import(
+        message.bot,
+        message.chat.id,
+        progress.message_id,
+        message.from_user.id,
+        document.file_id,
+        fmt,
+    )
+    if not started:
+        await progress.edit_text(
+            "⏳ Предыдущий импорт ещё идёт — пришлите файл, когда он закончится."
+        )
+
+
+@router.message(ImportState.waiting_for_file)
+async def process_import_not_file(message: types.Message):
+    await message.answer(
+        "Пришлите файл документом или нажмите «Отмена».",
+        reply_markup=get_cancel_keyboard(),
+    )
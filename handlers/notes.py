@@ -5,49 +5,64 @@ from aiogram import Router, types, F
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from tortoise.expressions import Q, Subquery
+
 from database.models import Person, MeetingNote
-from keyboards.history_kb import get_history_keyboard
+from keyboards.history_kb import (
+    CURSOR_AT,
+    CURSOR_NEWER,
+    CURSOR_OLDER,
+    SEARCH_ANCHOR,
+    SIMILAR_ANCHOR,
+    TAG_ANCHOR,
+    get_history_keyboard,
+    history_page_callback,
+    search_page_callback,
+    similar_callback,
+    tag_page_callback,
+)
 from keyboards.people_kb import (
     get_cancel_keyboard,
     get_person_actions_keyboard,
 )
 from keyboards.note_kb import get_note_actions_keyboard
-from services.llm import analyze_note
+from middlewares.ownership import Ownership
+from services import analysis_queue
+from services.notes import (
+    ANALYSIS_DONE,
+    ANALYSIS_PENDING,
+    create_note,
+    delete_note,
+    update_note_text,
+)
+from utils.callback_data import pack_uuid, unpack_uuid
 
 router = Router()
 
 HISTORY_PAGE_SIZE = 5
 
-PROMPT_DISABLED_PREFIX = "[DISABLED]\n"
-
-
-def _effective_custom_prompt(custom_prompt: str | None) -> str | None:
-    if not custom_prompt:
-        return None
-    if custom_prompt.startswith(PROMPT_DISABLED_PREFIX):
-        return None
-    return custom_prompt
-
-
-def _meeting_tag(name: str) -> str:
-    raw = (name or "").strip().replace(" ", "_")
-    safe = "".join(ch if (ch.isalnum() or ch in "_-") else "_" for ch in raw)
-    return f"#{safe}" if safe else "#meeting"
-
 
 def _render_note_report(
     *,
     title: str,
     meeting_name: str,
     raw_text: str,
-    analysis: dict,
+    analysis: dict | None,
 ) -> str:
+    """
+    analysis=None — анализ ещё в очереди, показываем только исходный текст.
+    """
     raw_preview = html.escape(raw_text or "")
     text = (
         f"✅ <b>{title}: {meeting_name}</b>\n\n"
         f"📝 <b>Исходный текст:</b>\n"
         f"<pre>{raw_preview}</pre>\n\n"
         f"🤖 <b>Разбор:</b>\n"
+    )
+    if analysis is None:
+        return text + "⏳ AI‑разбор готовится, сообщение обновится само."
+
+    text += (
         f"Mood: {analysis.get('mood_text', 'N/A')} "
         f"({analysis.get('mood', '-')}/10)\n"
         f"Summary: {analysis.get('summary', '-')}\n"
@@ -71,47 +86,133 @@ def _render_note_report(
     return text
 
 
-def _truncate_one_line(text: str, max_len: int = 28) -> str:
-    one_line = " ".join((text or "").split())
-    if len(one_line) <= max_len:
-        return one_line
-    return one_line[: max_len - 1] + "…"
+# Колонки, которые рисует список истории. raw_text и ai_summary не читаем:
+# объём страницы не зависит от длины заметок.
+HISTORY_FIELDS = ("id", "created_at", "snippet", "stress_level")
+
+
+async def _fetch_history_notes(
+    person_id: int,
+    page: int,
+    cursor: str | None,
+) -> tuple[list[dict], int, bool, bool]:
+    """
+    Keyset-пагинация по (created_at DESC, id DESC) — индекс
+    idx_meeting_notes_person_created, стоимость не зависит от номера страницы.
+    Возвращает (строки HISTORY_FIELDS, номер страницы, есть_новее, есть_старше).
+    """
+    query = MeetingNote.filter(person_id=person_id)
+    newest_first = ("-created_at", "-id")
+
+    op, anchor_id = None, None
+    if cursor:
+        try:
+            op, anchor_id = cursor[0], unpack_uuid(cursor[1:])
+        except ValueError:
+            op = None
+
+    if op not in (CURSOR_AT, CURSOR_OLDER, CURSOR_NEWER):
+        notes = await (
+            query.order_by(*newest_first)
+            .limit(HISTORY_PAGE_SIZE + 1)
+            .values(*HISTORY_FIELDS)
+        )
+        return notes[:HISTORY_PAGE_SIZE], 0, False, len(notes) > HISTORY_PAGE_SIZE
+
+    # AICODE-NOTE: created_at опорной заметки берём подзапросом в том же
+    # SQL, а не отдельным запросом. Если её удалили — страница пустая, и
+    # вызывающий код покажет первую. Отдельное условие created_at <= / >=
+    # нужно, чтобы БД искала по диапазону индекса, а не сканировала его с
+    # начала (одно OR-условие индекс по диапазону не использует).
+    anchor_created = Subquery(
+        MeetingNote.filter(id=anchor_id).values("created_at")
+    )
+
+    if op == CURSOR_NEWER:
+        notes = await (
+            query.filter(created_at__gte=anchor_created)
+            .filter(Q(created_at__gt=anchor_created) | Q(id__gt=anchor_id))
+            .order_by("created_at", "id")
+            .limit(HISTORY_PAGE_SIZE + 1)
+            .values(*HISTORY_FIELDS)
+        )
+        if len(notes) < HISTORY_PAGE_SIZE:
+            # Новее неполная страница — значит, это начало истории.
+            return await _fetch_history_notes(person_id, 0, None)
+        has_newer = len(notes) > HISTORY_PAGE_SIZE
+        notes = list(reversed(notes[:HISTORY_PAGE_SIZE]))
+        return notes, (page if has_newer else 0), has_newer, True
+
+    id_filter = {"id__lte" if op == CURSOR_AT else "id__lt": anchor_id}
+    notes = await (
+        query.filter(created_at__lte=anchor_created)
+        .filter(Q(created_at__lt=anchor_created) | Q(**id_filter))
+        .order_by(*newest_first)
+        .limit(HISTORY_PAGE_SIZE + 1)
+        .values(*HISTORY_FIELDS)
+    )
+    return (
+        notes[:HISTORY_PAGE_SIZE],
+        page,
+        page > 0,
+        len(notes) > HISTORY_PAGE_SIZE,
+    )
+
+
+async def _legacy_page_cursor(person_id: int, page: int) -> str | None:
+    """
+    Кнопки в старых сообщениях содержат только номер страницы.
+    """
+    if page <= 0:
+        return None
+    note_id = await (
+        MeetingNote.filter(person_id=person_id)
+        .order_by("-created_at", "-id")
+        .offset(page * HISTORY_PAGE_SIZE)
+        .first()
+        .values_list("id", flat=True)
+    )
+    return CURSOR_AT + pack_uuid(note_id) if note_id else None
 
 
 async def _build_history_page(
     *,
     user_id: int,
     person_id: int,
-    page: int,
+    page: int = 0,
+    cursor: str | None = None,
 ) -> tuple[str, types.InlineKeyboardMarkup] | tuple[str, None]:
-    person = await Person.get_or_none(id=person_id)
-    if not person or person.user_id != user_id:
+    person = await Person.get_or_none(id=person_id, user_id=user_id).only(
+        "id", "name", "notes_count"
+    )
+    if not person:
         return "Встреча не найдена.", None
 
-    total = await MeetingNote.filter(person_id=person_id).count()
-    if total == 0:
+    if person.notes_count <= 0:
         return f"📭 У <b>{person.name}</b> пока нет заметок.", None
 
-    pages = max(1, math.ceil(total / HISTORY_PAGE_SIZE))
-    page = max(0, min(page, pages - 1))
-    offset = page * HISTORY_PAGE_SIZE
-
-    notes = (
-        await MeetingNote.filter(person_id=person_id)
-        .offset(offset)
-        .limit(HISTORY_PAGE_SIZE)
+    notes, page, has_newer, has_older = await _fetch_history_notes(
+        person_id, page, cursor
     )
+    if not notes and cursor:
+        notes, page, has_newer, has_older = await _fetch_history_notes(
+            person_id, 0, None
+        )
+    if not notes:
+        return f"📭 У <b>{person.name}</b> пока нет заметок.", None
 
     note_buttons: list[tuple[str, str]] = []
     for note in notes:
-        date_str = note.created_at.strftime("%d.%m")
-        snippet = _truncate_one_line(note.raw_text)
-        mood = note.stress_level if note.stress_level is not None else "-"
-        note_buttons.append((f"📅 {date_str} ({mood}/10) {snippet}", str(note.id)))
-
-    has_prev = page > 0
-    has_next = page < pages - 1
-
+        date_str = note["created_at"].strftime("%d.%m")
+        mood = note["stress_level"] if note["stress_level"] is not None else "-"
+        note_buttons.append(
+            (
+                f"📅 {date_str} ({mood}/10) {note['snippet'] or ''}",
+                pack_uuid(note["id"]),
+            )
+        )
+
+    pages = max(page + 1, math.ceil(person.notes_count / HISTORY_PAGE_SIZE))
     text = (
         f"📜 <b>История: {person.name}</b>\n"
         f"Страница {page + 1}/{pages}\n\n"
@@ -121,8 +222,9 @@ async def _build_history_page(
         person_id=person_id,
         page=page,
         note_buttons=note_buttons,
-        has_prev=has_prev,
-        has_next=has_next,
+        anchor=note_buttons[0][1],
+        prev_cursor=note_buttons[0][1] if has_newer else None,
+        next_cursor=note_buttons[-1][1] if has_older else None,
     )
     return text, kb
 
@@ -133,17 +235,21 @@ class NoteState(StatesGroup):
 
 
 @router.callback_query(F.data.startswith("add_note:"))
-async def callback_add_note(callback: types.CallbackQuery, state: FSMContext):
+async def callback_add_note(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    ownership: Ownership,
+):
     person_id = int(callback.data.split(":")[1])
 
-    # Сохраняем ID человека в state data
-    await state.update_data(person_id=person_id)
-
-    person = await Person.get_or_none(id=person_id)
+    person = await ownership.person(person_id)
     if not person:
         await callback.answer("Встреча не найдена", show_alert=True)
         return
 
+    # Сохраняем ID человека в state data
+    await state.update_data(person_id=person_id)
+
     await callback.message.answer(
         f"Напишите заметку для <b>{person.name}</b>:",
         reply_markup=get_cancel_keyboard(),
@@ -152,7 +258,11 @@ async def callback_add_note(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(NoteState.waiting_for_text)
-async def process_note_text(message: types.Message, state: FSMContext):
+async def process_note_text(
+    message: types.Message,
+    state: FSMContext,
+    ownership: Ownership,
+):
     if not message.text:
         await message.answer("Пожалуйста, введите текст заметки.")
         return
@@ -160,49 +270,36 @@ async def process_note_text(message: types.Message, state: FSMContext):
     data = await state.get_data()
     person_id = data.get("person_id")
 
-    person = await Person.get_or_none(id=person_id)
+    # Для create_note достаточно id и name из кэша.
+    person = await ownership.person(person_id)
     if not person:
         await message.answer("Ошибка: встреча не найдена.")
         await state.clear()
         return
 
-    # Отправляем сообщение об ожидании
-    processing_msg = await message.answer("⏳ Сохраняю и анализирую заметку...")
-
-    # Анализируем с помощью AI
-    analysis = await analyze_note(
-        message.text,
-        custom_prompt=_effective_custom_prompt(person.custom_prompt),
-    )
-
-    # AICODE-NOTE: В тегах оставляем только название встречи для поиска.
-    analysis["tags"] = [_meeting_tag(person.name)]
-
-    # Сохраняем заметку
-    note = await MeetingNote.create(
-        person=person,
-        raw_text=message.text,
-        ai_summary=analysis,
-        stress_level=analysis.get("mood"),
-    )
-
-    summary_text = _render_note_report(
-        title="Заметка сохранена",
-        meeting_name=person.name,
-        raw_text=message.text,
-        analysis=analysis,
-    )
+    # AICODE-NOTE: Заметку сохраняем сразу, AI-анализ выполняет фоновая
+    # очередь (services/analysis_queue.py) и сама обновит это сообщение.
+    note = await create_note(person, message.text)
+    await state.clear()
 
-    # Удаляем сообщение "Анализирую..." и отправляем результат
-    await processing_msg.delete()
-    await message.answer(
-        summary_text,
+    processing_msg = await message.answer(
+        _render_note_report(
+            title="Заметка сохранена",
+            meeting_name=person.name,
+            raw_text=message.text,
+            analysis=None,
+        ),
         reply_markup=get_note_actions_keyboard(
             note_id=str(note.id),
             person_id=person_id,
         ),
     )
-    await state.clear()
+    await analysis_queue.enqueue(
+        note.id,
+        chat_id=processing_msg.chat.id,
+        message_id=processing_msg.message_id,
+        title="Заметка сохранена",
+    )
 
 
 @router.callback_query(F.data == "cancel_action")
@@ -213,7 +310,11 @@ async def callback_cancel(callback: types.CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("note_edit:"))
-async def callback_note_edit(callback: types.CallbackQuery, state: FSMContext):
+async def callback_note_edit(
+    callback: types.CallbackQuery,
+    state: FSMContext,
+    ownership: Ownership,
+):
     """
     Переходим в режим правки сырого текста заметки.
     callback_data: note_edit:<note_uuid>
@@ -224,13 +325,12 @@ async def callback_note_edit(callback: types.CallbackQuery, state: FSMContext):
         return
 
     note_id = parts[1]
-    note = await MeetingNote.get_or_none(id=note_id).prefetch_related("person")
-    if not note:
+    if not await ownership.note_person_id(note_id):
         await callback.answer("Заметка не найдена", show_alert=True)
         return
 
     await state.set_state(NoteState.editing_text)
-    await state.update_data(note_id=str(note.id))
+    await state.update_data(note_id=note_id)
 
     await callback.message.answer(
         "✏️ Отправьте исправленный текст заметки одним сообщением.\n"
@@ -241,7 +341,11 @@ async def callback_note_edit(callback: types.CallbackQuery, state: FSMContext):
 
 
 @router.message(NoteState.editing_text)
-async def process_note_edit(message: types.Message, state: FSMContext):
+async def process_note_edit(
+    message: types.Message,
+    state: FSMContext,
+    ownership: Ownership,
+):
     if not message.text:
         await message.answer("Пожалуйста, отправьте текстом.")
         return
@@ -253,44 +357,41 @@ async def process_note_edit(message: types.Message, state: FSMContext):
         await state.clear()
         return
 
-    note = await MeetingNote.get_or_none(id=note_id).prefetch_related("person")
+    person = await ownership.person(await ownership.note_person_id(note_id))
+    note = await MeetingNote.get_or_none(id=note_id) if person else None
     if not note:
         await message.answer("Заметка не найдена.")
         await state.clear()
         return
 
-    processing_msg = await message.answer("⏳ Обновляю и пересчитываю AI‑разбор...")
-
-    note.raw_text = message.text
-    analysis = await analyze_note(
-        message.text,
-        custom_prompt=_effective_custom_prompt(note.person.custom_prompt),
-    )
-    analysis["tags"] = [_meeting_tag(note.person.name)]
-    note.ai_summary = analysis
-    note.stress_level = analysis.get("mood")
-    await note.save()
-
-    summary_text = _render_note_report(
-        title="Заметка обновлена",
-        meeting_name=note.person.name,
-        raw_text=message.text,
-        analysis=analysis,
-    )
+    await update_note_text(note, message.text)
+    await state.clear()
 
-    await processing_msg.delete()
-    await message.answer(
-        summary_text,
+    processing_msg = await message.answer(
+        _render_note_report(
+            title="Заметка обновлена",
+            meeting_name=person.name,
+            raw_text=message.text,
+            analysis=None,
+        ),
         reply_markup=get_note_actions_keyboard(
             note_id=str(note.id),
             person_id=note.person_id,
         ),
     )
-    await state.clear()
+    await analysis_queue.enqueue(
+        note.id,
+        chat_id=processing_msg.chat.id,
+        message_id=processing_msg.message_id,
+        title="Заметка обновлена",
+    )
 
 
 @router.callback_query(F.data.startswith("note_reanalyze:"))
-async def callback_note_reanalyze(callback: types.CallbackQuery):
+async def callback_note_reanalyze(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     """
     Пересчитываем AI по текущему raw_text, чтобы можно было поправить промпт
     и обновить разбор без редактирования текста.
@@ -302,34 +403,39 @@ async def callback_note_reanalyze(callback: types.CallbackQuery):
         return
 
     note_id = parts[1]
-    note = await MeetingNote.get_or_none(id=note_id).prefetch_related("person")
+    person = await ownership.person(await ownership.note_person_id(note_id))
+    note = (
+        await MeetingNote.get_or_none(id=note_id).only("id", "person_id", "raw_text")
+        if person
+        else None
+    )
     if not note:
         await callback.answer("Заметка не найдена", show_alert=True)
         return
 
     await callback.answer("⏳ Пересчитываю…")
-    analysis = await analyze_note(
-        note.raw_text,
-        custom_prompt=_effective_custom_prompt(note.person.custom_prompt),
-    )
-    analysis["tags"] = [_meeting_tag(note.person.name)]
-    note.ai_summary = analysis
-    note.stress_level = analysis.get("mood")
-    await note.save()
-
     summary_text = _render_note_report(
         title="AI‑разбор обновлён",
-        meeting_name=note.person.name,
+        meeting_name=person.name,
         raw_text=note.raw_text,
-        analysis=analysis,
+        analysis=None,
     )
+    try:
+        await callback.message.edit_text(
+            summary_text,
+            reply_markup=get_note_actions_keyboard(
+                note_id=str(note.id),
+                person_id=note.person_id,
+            ),
+        )
+    except TelegramBadRequest:
+        pass
 
-    await callback.message.edit_text(
-        summary_text,
-        reply_markup=get_note_actions_keyboard(
-            note_id=str(note.id),
-            person_id=note.person_id,
-        ),
+    await analysis_queue.enqueue(
+        note.id,
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.message_id,
+        title="AI‑разбор обновлён",
     )
 
 
@@ -356,19 +462,33 @@ async def callback_history(callback: types.CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("history_page:"))
-async def callback_history_page(callback: types.CallbackQuery):
+async def callback_history_page(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
+    """
+    callback_data: history_page:<person_id>:<page>[:<cursor>]
+    """
     parts = callback.data.split(":")
-    if len(parts) != 3:
+    if len(parts) not in (3, 4):
         await callback.answer("Некорректная команда", show_alert=True)
         return
 
     person_id = int(parts[1])
     page = int(parts[2])
+    if not await ownership.owns_person(person_id):
+        await callback.answer("Встреча не найдена", show_alert=True)
+        return
+    if len(parts) == 4:
+        cursor = parts[3]
+    else:
+        cursor = await _legacy_page_cursor(person_id, page)
 
     text, kb = await _build_history_page(
         user_id=callback.from_user.id,
         person_id=person_id,
         page=page,
+        cursor=cursor,
     )
     if not kb:
         await callback.answer("Нет заметок", show_alert=True)
@@ -381,31 +501,49 @@ async def callback_history_page(callback: types.CallbackQuery):
 @router.callback_query(F.data.startswith("note_view:"))
 async def callback_note_view(callback: types.CallbackQuery):
     """
-    Открываем конкретную заметку из истории.
-    callback_data: note_view:<note_uuid>:<person_id>:<page>
+    Открываем конкретную заметку из истории или поиска.
+    callback_data: note_view:<note_id22>:<page>:<anchor_id22>
+    (из поиска: note_view:<note_id22>:<page>:s, по тегу — :t<tag_id>,
+    из похожих — :r<source_id22>)
+    (в старых сообщениях: note_view:<note_uuid>:<person_id>:<page>)
     """
     parts = callback.data.split(":")
     if len(parts) != 4:
         await callback.answer("Некорректная команда", show_alert=True)
         return
 
-    note_id = parts[1]
-    person_id = int(parts[2])
-    page = int(parts[3])
-
-    person = await Person.get_or_none(id=person_id)
-    if not person or person.user_id != callback.from_user.id:
-        await callback.answer("Встреча не найдена", show_alert=True)
+    try:
+        note_id = unpack_uuid(parts[1])
+    except ValueError:
+        await callback.answer("Некорректная команда", show_alert=True)
         return
 
-    note = await MeetingNote.get_or_none(id=note_id)
-    if not note or note.person_id != person_id:
+    note = await MeetingNote.get_or_none(id=note_id).select_related("person")
+    if not note or note.person.user_id != callback.from_user.id:
         await callback.answer("Заметка не найдена", show_alert=True)
         return
 
+    person = note.person
+    person_id = person.id
+    if parts[3] == SEARCH_ANCHOR:
+        back_callback_data = search_page_callback(int(parts[2]))
+    elif len(parts[3]) == 22:
+        page = int(parts[2])
+        back_callback_data = history_page_callback(
+            person_id, page, CURSOR_AT + parts[3]
+        )
+    elif parts[3].startswith(SIMILAR_ANCHOR) and len(parts[3]) == 23:
+        back_callback_data = similar_callback(parts[3][1:])
+    elif parts[3].startswith(TAG_ANCHOR):
+        back_callback_data = tag_page_callback(int(parts[3][1:]), int(parts[2]))
+    else:
+        back_callback_data = history_page_callback(person_id, int(parts[3]))
+
     ai = note.ai_summary or {}
     date_str = note.created_at.strftime("%d.%m.%Y %H:%M")
     raw_preview = html.escape(note.raw_text)
+    if note.analysis_status == ANALYSIS_PENDING:
+        ai = {"summary": "⏳ AI‑разбор готовится…"}
 
     text = (
         f"📝 <b>{person.name}</b>\n"
@@ -413,20 +551,38 @@ async def callback_note_view(callback: types.CallbackQuery):
         f"<pre>{raw_preview}</pre>\n\n"
         f"🤖 <b>AI:</b> {ai.get('summary', '-')}"
     )
+    # AICODE-NOTE: Разбор сделан по старому промпту — показываем его, а
+    # свежий считаем сразу (вне очереди фонового пересчёта) и подменяем
+    # сообщение, когда он готов.
+    recompute = note.is_stale and note.analysis_status == ANALYSIS_DONE
+    if recompute:
+        text += "\n\n♻️ Промпт изменился — разбор пересчитывается…"
 
     await callback.message.edit_text(
         text,
         reply_markup=get_note_actions_keyboard(
             note_id=str(note.id),
             person_id=person_id,
-            back_callback_data=f"history_page:{person_id}:{page}",
+            back_callback_data=back_callback_data,
         ),
     )
     await callback.answer()
 
+    if recompute:
+        await analysis_queue.enqueue(
+            note.id,
+            chat_id=callback.message.chat.id,
+            message_id=callback.message.message_id,
+            title="AI‑разбор обновлён",
+            back_callback=back_callback_data,
+        )
+
 
 @router.callback_query(F.data.startswith("note_delete:"))
-async def callback_note_delete(callback: types.CallbackQuery):
+async def callback_note_delete(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     """
     Удаление заметки целиком.
     callback_data: note_delete:<note_uuid>:<person_id>
@@ -439,7 +595,11 @@ async def callback_note_delete(callback: types.CallbackQuery):
     note_id = parts[1]
     person_id = int(parts[2])
 
-    deleted = await MeetingNote.filter(id=note_id).delete()
+    if await ownership.note_person_id(note_id) != person_id:
+        await callback.answer("Заметка не найдена", show_alert=True)
+        return
+
+    deleted = await delete_note(note_id)
     if deleted:
         await callback.message.edit_text("🗑️ Заметка удалена.")
     else:
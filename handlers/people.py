@@ -1,20 +1,32 @@
 import html
+import logging
 
 from aiogram import F, Router, types
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
+from aiogram.types import FSInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.models import Person, PromptTemplate, User
+from database.models import Person, PromptTemplate
 from keyboards.people_kb import (
-    get_people_keyboard,
+    get_digest_keyboard,
     get_person_actions_keyboard,
+    get_person_back_keyboard,
     get_person_prompt_keyboard,
 )
+from middlewares.ownership import Ownership
+from services import digests, mood_charts, mood_rollups, people_cache
+from services.llm_gateway import LLMError, LLMUnavailableError
+from services.notes import (
+    PROMPT_DISABLED_PREFIX,
+    mark_prompt_changed,
+    stale_progress,
+)
+from utils.text import sparkline
 
-router = Router()
+logger = logging.getLogger(__name__)
 
-PROMPT_DISABLED_PREFIX = "[DISABLED]\n"
+router = Router()
 
 
 def _parse_custom_prompt(custom_prompt: str | None) -> tuple[bool, str | None]:
@@ -31,6 +43,12 @@ def _parse_custom_prompt(custom_prompt: str | None) -> tuple[bool, str | None]:
     return True, custom_prompt
 
 
+def _format_stale_notice(stale: int) -> str:
+    if not stale:
+        return ""
+    return f"\n♻️ Разборов по старому промпту: {stale}, пересчитаю в фоне."
+
+
 def _format_prompt_preview(prompt_text: str | None) -> str:
     if not prompt_text:
         return "<i>(пусто)</i>"
@@ -67,19 +85,10 @@ async def process_name(message: types.Message, state: FSMContext):
     name = message.text.strip()
     user_id = message.from_user.id
 
-    # Получаем пользователя из БД
-    user = await User.get_or_none(id=user_id)
-    if not user:
-        # Редкий случай, если пользователь не нажимал /start
-        user = await User.create(
-            id=user_id,
-            username=message.from_user.username,
-            full_name=message.from_user.full_name,
-        )
-
     try:
-        # Пытаемся создать
-        await Person.create(user=user, name=name)
+        # Пытаемся создать (пользователя уже создал middlewares/users.py)
+        await Person.create(user_id=user_id, name=name)
+        people_cache.invalidate(user_id)
         await message.answer(
             f"✅ Встреча <b>{name}</b> добавлена."
         )
@@ -93,11 +102,10 @@ async def process_name(message: types.Message, state: FSMContext):
 
 @router.message(Command("my_team"))
 async def cmd_my_team(message: types.Message):
-    user_id = message.from_user.id
-    # Получаем список людей пользователя
-    people = await Person.filter(user_id=user_id).all()
+    # Список встреч и клавиатура — из кэша (services/people_cache.py).
+    cached = await people_cache.get(message.from_user.id)
 
-    if not people:
+    if not cached.people:
         await message.answer(
             "У вас пока нет встреч. Используйте /add_person, "
             "чтобы добавить."
@@ -106,14 +114,17 @@ async def cmd_my_team(message: types.Message):
 
     await message.answer(
         "📅 <b>Ваши встречи:</b>\nВыберите встречу для работы:",
-        reply_markup=get_people_keyboard(people),
+        reply_markup=cached.markup,
     )
 
 
 @router.callback_query(F.data.startswith("person_select:"))
-async def callback_person_select(callback: types.CallbackQuery):
+async def callback_person_select(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     person_id = int(callback.data.split(":")[1])
-    person = await Person.get_or_none(id=person_id)
+    person = await ownership.person(person_id)
 
     if not person:
         await callback.answer("Встреча не найдена", show_alert=True)
@@ -130,15 +141,204 @@ async def callback_person_select(callback: types.CallbackQuery):
     await callback.answer()
 
 
+def _format_trends(name: str, trends: dict) -> str:
+    total = trends["total"]
+    if total is None:
+        return (
+            f"📈 <b>Динамика: {html.escape(name)}</b>\n\n"
+            f"За последние {mood_rollups.TRENDS_WEEKS} недель нет заметок с оценкой."
+        )
+
+    weeks = [stats.mean if stats else None for stats in trends["weeks"]]
+    days = [stats.mean if stats else None for stats in trends["days"]]
+    return (
+        f"📈 <b>Динамика: {html.escape(name)}</b>\n\n"
+        f"Недели ({mood_rollups.TRENDS_WEEKS}): <code>{sparkline(weeks)}</code>\n"
+        f"Дни ({mood_rollups.TRENDS_DAYS}): <code>{sparkline(days)}</code>\n\n"
+        f"Среднее: {total.mean:.1f}/10 · мин {total.min_mood} · макс {total.max_mood}\n"
+        f"Последняя оценка: {total.last_mood}/10 "
+        f"({total.last_at.strftime('%d.%m')})\n"
+        f"Заметок с оценкой: {total.count}"
+    )
+
+
+@router.callback_query(F.data.startswith("trends:"))
+async def callback_trends(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
+    """
+    callback_data: trends:<person_id>
+    """
+    person_id = int(callback.data.split(":")[1])
+    person = await ownership.person(person_id)
+    if not person:
+        await callback.answer("Встреча не найдена", show_alert=True)
+        return
+
+    text = _format_trends(person.name, await mood_rollups.trends(person_id))
+    try:
+        await callback.message.edit_text(
+            text, reply_markup=get_person_back_keyboard(person_id)
+        )
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("mood_chart:"))
+async def callback_mood_chart(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
+    """
+    callback_data: mood_chart:<person_id>
+    """
+    person_id = int(callback.data.split(":")[1])
+    person = await ownership.person(person_id)
+    if not person:
+        await callback.answer("Встреча не найдена", show_alert=True)
+        return
+    # Первый рендер может занять секунду — снимаем «часики» сразу.
+    await callback.answer()
+
+    caption = f"📈 Настроение: {html.escape(person.name)}"
+    try:
+        chart = await mood_charts.get_chart(person_id, person.name)
+        if chart and chart.file_id:
+            try:
+                await callback.message.answer_photo(chart.file_id, caption=caption)
+                return
+            except TelegramBadRequest:
+                # file_id от другого бота или устарел — загружаем картинку.
+                chart = await mood_charts.get_chart(
+                    person_id, person.name, use_file_id=False
+                )
+        if chart:
+            sent = await callback.message.answer_photo(
+                FSInputFile(chart.path), caption=caption
+            )
+    except Exception:
+        # «Часики» уже сняты — без ответа пользователь не узнает об ошибке.
+        logger.exception("Mood chart for person %s failed", person_id)
+        await callback.message.answer(
+            "❌ Не удалось построить график, попробуйте позже.",
+            reply_markup=get_person_back_keyboard(person_id),
+        )
+        return
+
+    if not chart:
+        await callback.message.answer(
+            "Пока нет заметок с оценкой — графику не из чего строиться.",
+            reply_markup=get_person_back_keyboard(person_id),
+        )
+        return
+
+    await mood_charts.remember_file_id(person_id, chart.version, sent.photo[-1].file_id)
+
+
+def _format_points(title: str, items) -> str:
+    items = [str(item) for item in (items or []) if item]
+    if not items:
+        return ""
+    lines = "\n".join(f"• {html.escape(item)}" for item in items)
+    return f"\n\n<b>{title}</b>\n{lines}"
+
+
+def _format_digest(name: str, digest: digests.Digest) -> str:
+    result = digest.result
+    text = (
+        f"🗂 <b>Дайджест: {html.escape(name)}</b>\n"
+        f"<i>Последние {digest.weeks} нед., заметок: {digest.notes_count}</i>\n\n"
+        f"{html.escape(str(result.get('summary') or '—'))}"
+    )
+    if result.get("mood_trend"):
+        text += f"\n\n<b>Настроение:</b> {html.escape(str(result['mood_trend']))}"
+    text += _format_points("Темы", result.get("themes"))
+    text += _format_points("Договорённости", result.get("action_items"))
+    text += _format_points("Обсудить на 1-1", result.get("talking_points"))
+    return text
+
+
+@router.callback_query(F.data.startswith("digest:"))
+async def callback_digest(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
+    """
+    callback_data: digest:<person_id>
+    """
+    person_id = int(callback.data.split(":")[1])
+    person = await ownership.person(person_id)
+    if not person:
+        await callback.answer("Встреча не найдена", show_alert=True)
+        return
+
+    try:
+        await callback.message.edit_text(
+            f"🗂 <b>Дайджест: {html.escape(person.name)}</b>\n\n"
+            "Выжимка заметок перед встречей. За какой период?",
+            reply_markup=get_digest_keyboard(person_id, digests.DIGEST_WEEKS),
+        )
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("digest_run:"))
+async def callback_digest_run(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
+    """
+    callback_data: digest_run:<person_id>:<недель>
+    """
+    _, person_id, weeks = callback.data.split(":")
+    person_id, weeks = int(person_id), int(weeks)
+    person = await ownership.person(person_id)
+    if not person or weeks not in digests.DIGEST_WEEKS:
+        await callback.answer("Встреча не найдена", show_alert=True)
+        return
+    # Первый дайджест читает все недели периода — снимаем «часики» сразу.
+    await callback.answer()
+    try:
+        await callback.message.edit_text(
+            f"⏳ Собираю дайджест за {weeks} нед.…"
+        )
+    except TelegramBadRequest:
+        pass
+
+    try:
+        digest = await digests.build_digest(person_id, weeks)
+    except LLMUnavailableError:
+        text = "⚠️ AI сейчас недоступен, попробуйте через пару минут."
+    except LLMError:
+        text = "❌ Не удалось собрать дайджест, попробуйте позже."
+    else:
+        if digest is None:
+            text = f"За последние {weeks} нед. нет заметок — дайджест не из чего собрать."
+        else:
+            text = _format_digest(person.name, digest)
+
+    try:
+        await callback.message.edit_text(
+            text, reply_markup=get_person_back_keyboard(person_id)
+        )
+    except TelegramBadRequest:
+        # Сообщение с кнопкой могли удалить, пока собирался дайджест.
+        await callback.message.answer(
+            text, reply_markup=get_person_back_keyboard(person_id)
+        )
+
+
 @router.callback_query(F.data == "back_to_team")
 async def callback_back_to_team(callback: types.CallbackQuery):
-    user_id = callback.from_user.id
-    people = await Person.filter(user_id=user_id).all()
+    cached = await people_cache.get(callback.from_user.id)
 
     try:
         await callback.message.edit_text(
             "📅 <b>Ваши встречи:</b>\nВыберите встречу:",
-            reply_markup=get_people_keyboard(people),
+            reply_markup=cached.markup,
         )
     except TelegramBadRequest:
         pass
@@ -156,7 +356,10 @@ async def callback_add_person_btn(callback: types.CallbackQuery, state: FSMConte
 
 
 @router.callback_query(F.data.startswith("person_prompt:"))
-async def callback_person_prompt(callback: types.CallbackQuery):
+async def callback_person_prompt(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     """
     Показываем текущий промпт (если есть) и даём кнопки изменить/сбросить.
     callback_data: person_prompt:<person_id>
@@ -167,10 +370,10 @@ async def callback_person_prompt(callback: types.CallbackQuery):
         return
 
     person_id = int(parts[1])
-    person = await Person.get_or_none(id=person_id)
-    if not person:
+    if not await ownership.owns_person(person_id):
         await callback.answer("Встреча не найдена", show_alert=True)
         return
+    person = await Person.get(id=person_id)
 
     is_enabled, prompt_text = _parse_custom_prompt(person.custom_prompt)
     status = (
@@ -180,9 +383,17 @@ async def callback_person_prompt(callback: types.CallbackQuery):
         if prompt_text
         else "—"
     )
+    stale, analyzed = await stale_progress(person_id)
+    progress = (
+        f"♻️ Пересчёт разборов: {analyzed - stale}/{analyzed} "
+        "по текущему промпту\n"
+        if stale
+        else ""
+    )
     text = (
         f"🧠 <b>Промпт для встречи: {person.name}</b>\n"
-        f"Статус: <b>{status}</b>\n\n"
+        f"Статус: <b>{status}</b>\n"
+        f"{progress}\n"
         "<b>Текущий промпт</b>:\n"
         f"{_format_prompt_preview(prompt_text)}\n\n"
         "<i>Промпт дополняет дефолтный. Его можно временно выключить "
@@ -215,6 +426,7 @@ async def callback_person_prompt(callback: types.CallbackQuery):
 async def callback_person_prompt_set(
     callback: types.CallbackQuery,
     state: FSMContext,
+    ownership: Ownership,
 ):
     parts = callback.data.split(":")
     if len(parts) != 2:
@@ -222,10 +434,10 @@ async def callback_person_prompt_set(
         return
 
     person_id = int(parts[1])
-    person = await Person.get_or_none(id=person_id)
-    if not person:
+    if not await ownership.owns_person(person_id):
         await callback.answer("Встреча не найдена", show_alert=True)
         return
+    person = await Person.get(id=person_id)
 
     is_enabled, prompt_text = _parse_custom_prompt(person.custom_prompt)
 
@@ -246,7 +458,11 @@ async def callback_person_prompt_set(
 
 
 @router.message(PersonPromptState.waiting_for_prompt)
-async def process_person_prompt(message: types.Message, state: FSMContext):
+async def process_person_prompt(
+    message: types.Message,
+    state: FSMContext,
+    ownership: Ownership,
+):
     if not message.text:
         await message.answer("Пожалуйста, отправьте текстом.")
         return
@@ -259,38 +475,43 @@ async def process_person_prompt(message: types.Message, state: FSMContext):
         await state.clear()
         return
 
-    person = await Person.get_or_none(id=person_id)
-    if not person:
+    if not await ownership.owns_person(person_id):
         await message.answer("Встреча не найдена.")
         await state.clear()
         return
 
+    person = await Person.get(id=person_id)
     new_prompt = message.text.strip()
     if prompt_was_disabled:
         person.custom_prompt = PROMPT_DISABLED_PREFIX + new_prompt
     else:
         person.custom_prompt = new_prompt
-    await person.save()
+    await person.save(update_fields=["custom_prompt"])
+    stale = await mark_prompt_changed(person)
     await state.clear()
 
     await message.answer(
-        f"✅ Промпт для <b>{person.name}</b> обновлён.",
+        f"✅ Промпт для <b>{person.name}</b> обновлён."
+        + _format_stale_notice(stale),
         reply_markup=get_person_actions_keyboard(person_id),
     )
 
 
 @router.callback_query(F.data.startswith("person_prompt_disable:"))
-async def callback_person_prompt_disable(callback: types.CallbackQuery):
+async def callback_person_prompt_disable(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     parts = callback.data.split(":")
     if len(parts) != 2:
         await callback.answer("Некорректная команда", show_alert=True)
         return
 
     person_id = int(parts[1])
-    person = await Person.get_or_none(id=person_id)
-    if not person:
+    if not await ownership.owns_person(person_id):
         await callback.answer("Встреча не найдена", show_alert=True)
         return
+    person = await Person.get(id=person_id)
 
     is_enabled, prompt_text = _parse_custom_prompt(person.custom_prompt)
     if not prompt_text:
@@ -302,23 +523,27 @@ async def callback_person_prompt_disable(callback: types.CallbackQuery):
         return
 
     person.custom_prompt = PROMPT_DISABLED_PREFIX + prompt_text.strip()
-    await person.save()
+    await person.save(update_fields=["custom_prompt"])
+    await mark_prompt_changed(person)
     await callback.answer("⏸️ Выключено")
-    await callback_person_prompt(callback)
+    await callback_person_prompt(callback, ownership)
 
 
 @router.callback_query(F.data.startswith("person_prompt_enable:"))
-async def callback_person_prompt_enable(callback: types.CallbackQuery):
+async def callback_person_prompt_enable(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     parts = callback.data.split(":")
     if len(parts) != 2:
         await callback.answer("Некорректная команда", show_alert=True)
         return
 
     person_id = int(parts[1])
-    person = await Person.get_or_none(id=person_id)
-    if not person:
+    if not await ownership.owns_person(person_id):
         await callback.answer("Встреча не найдена", show_alert=True)
         return
+    person = await Person.get(id=person_id)
 
     is_enabled, prompt_text = _parse_custom_prompt(person.custom_prompt)
     if not prompt_text:
@@ -330,44 +555,53 @@ async def callback_person_prompt_enable(callback: types.CallbackQuery):
         return
 
     person.custom_prompt = prompt_text.strip()
-    await person.save()
+    await person.save(update_fields=["custom_prompt"])
+    await mark_prompt_changed(person)
     await callback.answer("✅ Включено")
-    await callback_person_prompt(callback)
+    await callback_person_prompt(callback, ownership)
 
 
 @router.callback_query(F.data.startswith("person_prompt_reset:"))
-async def callback_person_prompt_reset(callback: types.CallbackQuery):
+async def callback_person_prompt_reset(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     parts = callback.data.split(":")
     if len(parts) != 2:
         await callback.answer("Некорректная команда", show_alert=True)
         return
 
     person_id = int(parts[1])
-    person = await Person.get_or_none(id=person_id)
-    if not person:
+    if not await ownership.owns_person(person_id):
         await callback.answer("Встреча не найдена", show_alert=True)
         return
+    person = await Person.get(id=person_id)
 
     person.custom_prompt = None
-    await person.save()
+    await person.save(update_fields=["custom_prompt"])
+    stale = await mark_prompt_changed(person)
 
     await callback.message.edit_text(
-        f"♻️ Промпт для <b>{person.name}</b> сброшен на дефолтный.",
+        f"♻️ Промпт для <b>{person.name}</b> сброшен на дефолтный."
+        + _format_stale_notice(stale),
         reply_markup=get_person_actions_keyboard(person_id),
     )
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("person_prompt_templates:"))
-async def callback_person_prompt_templates(callback: types.CallbackQuery):
+async def callback_person_prompt_templates(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     parts = callback.data.split(":")
     if len(parts) != 2:
         await callback.answer("Некорректная команда", show_alert=True)
         return
 
     person_id = int(parts[1])
-    person = await Person.get_or_none(id=person_id)
-    if not person or person.user_id != callback.from_user.id:
+    person = await ownership.person(person_id)
+    if not person:
         await callback.answer("Встреча не найдена", show_alert=True)
         return
 
@@ -397,6 +631,7 @@ async def callback_person_prompt_templates(callback: types.CallbackQuery):
 async def callback_prompt_template_new(
     callback: types.CallbackQuery,
     state: FSMContext,
+    ownership: Ownership,
 ):
     parts = callback.data.split(":")
     if len(parts) != 2:
@@ -404,6 +639,10 @@ async def callback_prompt_template_new(
         return
 
     person_id = int(parts[1])
+    if not await ownership.owns_person(person_id):
+        await callback.answer("Встреча не найдена", show_alert=True)
+        return
+
     await state.set_state(PromptTemplateState.waiting_for_name)
     await state.update_data(person_id=person_id)
     await callback.message.answer("Введите название шаблона (например: 1-1 репорт):")
@@ -462,7 +701,10 @@ async def process_prompt_template_text(message: types.Message, state: FSMContext
 
 
 @router.callback_query(F.data.startswith("prompt_tpl_apply:"))
-async def callback_prompt_template_apply(callback: types.CallbackQuery):
+async def callback_prompt_template_apply(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     """
     callback_data: prompt_tpl_apply:<template_id>:<person_id>
     """
@@ -474,10 +716,10 @@ async def callback_prompt_template_apply(callback: types.CallbackQuery):
     template_id = int(parts[1])
     person_id = int(parts[2])
 
-    person = await Person.get_or_none(id=person_id)
-    if not person or person.user_id != callback.from_user.id:
+    if not await ownership.owns_person(person_id):
         await callback.answer("Встреча не найдена", show_alert=True)
         return
+    person = await Person.get(id=person_id)
 
     tpl = await PromptTemplate.get_or_none(id=template_id)
     if not tpl or tpl.user_id != callback.from_user.id:
@@ -485,13 +727,17 @@ async def callback_prompt_template_apply(callback: types.CallbackQuery):
         return
 
     person.custom_prompt = tpl.text
-    await person.save()
+    await person.save(update_fields=["custom_prompt"])
+    await mark_prompt_changed(person)
     await callback.answer("✅ Применено")
-    await callback_person_prompt(callback)
+    await callback_person_prompt(callback, ownership)
 
 
 @router.callback_query(F.data.startswith("prompt_tpl_delete:"))
-async def callback_prompt_template_delete(callback: types.CallbackQuery):
+async def callback_prompt_template_delete(
+    callback: types.CallbackQuery,
+    ownership: Ownership,
+):
     """
     callback_data: prompt_tpl_delete:<template_id>:<person_id>
     """
@@ -502,6 +748,9 @@ async def callback_prompt_template_delete(callback: types.CallbackQuery):
 
     template_id = int(parts[1])
     person_id = int(parts[2])
+    if not await ownership.owns_person(person_id):
+        await callback.answer("Встреча не найдена", show_alert=True)
+        return
 
     deleted = await PromptTemplate.filter(
         id=template_id,
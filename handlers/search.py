@@ -0,0 +1,136 @@
+import html
+
+from aiogram import F, Router, types
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+
+from database.models import MeetingNote
+from handlers.notes import HISTORY_FIELDS, HISTORY_PAGE_SIZE
+from keyboards.history_kb import get_search_keyboard
+from keyboards.people_kb import get_cancel_keyboard
+from services import search
+from utils.callback_data import pack_uuid
+
+router = Router()
+
+# Ключ данных FSM с последним запросом: кнопки страниц содержат только номер,
+# запрос в callback_data (64 байта) не помещается.
+SEARCH_QUERY_KEY = "search_query"
+
+
+class SearchState(StatesGroup):
+    waiting_for_query = State()
+
+
+async def _build_search_page(
+    *,
+    user_id: int,
+    query: str,
+    page: int = 0,
+) -> tuple[str, types.InlineKeyboardMarkup] | tuple[str, None]:
+    note_ids = await search.search_note_ids(
+        user_id,
+        query,
+        limit=HISTORY_PAGE_SIZE + 1,
+        offset=page * HISTORY_PAGE_SIZE,
+    )
+    has_more = len(note_ids) > HISTORY_PAGE_SIZE
+    note_ids = note_ids[:HISTORY_PAGE_SIZE]
+
+    query_html = html.escape(query)
+    if not note_ids:
+        return f"🔍 По запросу «{query_html}» ничего не найдено.", None
+
+    rows = await MeetingNote.filter(id__in=note_ids).values(
+        *HISTORY_FIELDS, "person__name"
+    )
+    by_id = {str(row["id"]): row for row in rows}
+
+    note_buttons: list[tuple[str, str]] = []
+    # Порядок — по релевантности, как вернул индекс.
+    for note_id in note_ids:
+        note = by_id.get(note_id)
+        if note is None:
+            continue
+        date_str = note["created_at"].strftime("%d.%m")
+        mood = note["stress_level"] if note["stress_level"] is not None else "-"
+        note_buttons.append(
+            (
+                f"📅 {date_str} {note['person__name']} ({mood}/10) "
+                f"{note['snippet'] or ''}",
+                pack_uuid(note["id"]),
+            )
+        )
+
+    text = (
+        f"🔍 <b>Поиск:</b> {query_html}\n"
+        f"Страница {page + 1}\n\n"
+        "Выберите заметку:"
+    )
+    kb = get_search_keyboard(page=page, note_buttons=note_buttons, has_more=has_more)
+    return text, kb
+
+
+async def _answer_search(message: types.Message, state: FSMContext, query: str):
+    await state.update_data({SEARCH_QUERY_KEY: query})
+    text, kb = await _build_search_page(user_id=message.from_user.id, query=query)
+    await message.answer(text, reply_markup=kb)
+
+
+@router.message(Command("search"))
+async def cmd_search(
+    message: types.Message,
+    command: CommandObject,
+    state: FSMContext,
+):
+    query = (command.args or "").strip()
+    if query:
+        await _answer_search(message, state, query)
+        return
+
+    await message.answer(
+        "🔍 Что ищем? Напишите слова из заметки, summary или задач:",
+        reply_markup=get_cancel_keyboard(),
+    )
+    await state.set_state(SearchState.waiting_for_query)
+
+
+@router.message(SearchState.waiting_for_query)
+async def process_search_query(message: types.Message, state: FSMContext):
+    query = (message.text or "").strip()
+    if not search.query_terms(query):
+        await message.answer("Напишите хотя бы одно слово для поиска.")
+        return
+
+    # Состояние сбрасываем, а данные (запрос) оставляем для кнопок страниц.
+    await state.set_state(None)
+    await _answer_search(message, state, query)
+
+
+@router.callback_query(F.data.startswith("search_page:"))
+async def callback_search_page(callback: types.CallbackQuery, state: FSMContext):
+    """
+    callback_data: search_page:<page>
+    """
+    parts = callback.data.split(":")
+    if len(parts) != 2 or not parts[1].isdigit():
+        await callback.answer("Некорректная команда", show_alert=True)
+        return
+
+    query = (await state.get_data()).get(SEARCH_QUERY_KEY)
+    if not query:
+        await callback.answer("Поиск устарел, повторите /search", show_alert=True)
+        return
+
+    text, kb = await _build_search_page(
+        user_id=callback.from_user.id,
+        query=query,
+        page=int(parts[1]),
+    )
+    if not kb:
+        await callback.answer("Больше ничего не найдено", show_alert=True)
+        return
+
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
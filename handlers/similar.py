@@ -0,0 +1,80 @@
+import html
+
+from aiogram import F, Router, types
+from aiogram.exceptions import TelegramBadRequest
+
+from database.models import MeetingNote
+from handlers.notes import HISTORY_FIELDS
+from keyboards.history_kb import get_similar_keyboard
+from services import similar
+from utils.callback_data import pack_uuid, unpack_uuid
+
+router = Router()
+
+
+async def _build_similar_page(user_id: int, source: dict):
+    matches = await similar.similar_notes(user_id, source["id"])
+    rows = await MeetingNote.filter(
+        id__in=[note_id for note_id, _ in matches],
+        person__user_id=user_id,
+    ).values(*HISTORY_FIELDS, "person__name")
+    by_id = {row["id"]: row for row in rows}
+
+    note_buttons: list[tuple[str, str]] = []
+    for note_id, score in matches:
+        note = by_id.get(note_id)
+        if note is None:
+            continue
+        date_str = note["created_at"].strftime("%d.%m.%y")
+        note_buttons.append(
+            (
+                f"{round(score * 100)}% · {date_str} {note['person__name']} "
+                f"{note['snippet'] or ''}",
+                pack_uuid(note["id"]),
+            )
+        )
+
+    title = (
+        f"🔍 <b>Похожие на заметку</b> "
+        f"{html.escape(source['person__name'])} · "
+        f"{source['created_at'].strftime('%d.%m.%Y')}"
+    )
+    if note_buttons:
+        text = f"{title}\n\nПо всем встречам, самые близкие — первыми:"
+    else:
+        text = f"{title}\n\nПохожих заметок не нашлось."
+    kb = get_similar_keyboard(
+        source_id22=pack_uuid(source["id"]),
+        note_buttons=note_buttons,
+    )
+    return text, kb
+
+
+@router.callback_query(F.data.startswith("similar:"))
+async def callback_similar(callback: types.CallbackQuery):
+    """
+    callback_data: similar:<note_id22>
+    """
+    try:
+        note_id = unpack_uuid(callback.data.split(":", 1)[1])
+    except ValueError:
+        await callback.answer("Некорректная команда", show_alert=True)
+        return
+
+    user_id = callback.from_user.id
+    source = await (
+        MeetingNote.filter(id=note_id, person__user_id=user_id)
+        .first()
+        .values("id", "created_at", "person__name")
+    )
+    if source is None:
+        await callback.answer("Заметка не найдена", show_alert=True)
+        return
+    # Первый поиск собирает индекс пользователя — снимаем «часики» сразу.
+    await callback.answer()
+
+    text, kb = await _build_similar_page(user_id, source)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest:
+        pass
@@ -0,0 +1,127 @@
+import math
+
+from aiogram import F, Router, types
+from aiogram.filters import Command
+
+from database.models import MeetingNote
+from handlers.notes import HISTORY_FIELDS, HISTORY_PAGE_SIZE
+from keyboards.history_kb import get_tag_notes_keyboard
+from keyboards.tags_kb import get_tags_keyboard
+from services import tags
+from utils.callback_data import pack_uuid
+
+router = Router()
+
+TAGS_PAGE_SIZE = 10
+
+
+async def _build_tags_page(user_id: int, page: int = 0):
+    rows = await tags.user_tags(
+        user_id,
+        limit=TAGS_PAGE_SIZE + 1,
+        offset=page * TAGS_PAGE_SIZE,
+    )
+    if not rows:
+        return "🏷 Тегов пока нет — они появятся после AI-разбора заметок.", None
+
+    kb = get_tags_keyboard(
+        page=page,
+        tag_buttons=[
+            (f"#{row['name']} ({row['notes_count']})", row["id"])
+            for row in rows[:TAGS_PAGE_SIZE]
+        ],
+        has_more=len(rows) > TAGS_PAGE_SIZE,
+    )
+    return f"🏷 <b>Теги</b>\nСтраница {page + 1}\n\nВыберите тег:", kb
+
+
+async def _build_tag_notes_page(user_id: int, tag_id: int, page: int = 0):
+    tag = await tags.get_user_tag(user_id, tag_id)
+    if tag is None:
+        return "Тег не найден.", None
+
+    note_ids = await tags.tag_note_ids(
+        tag_id,
+        limit=HISTORY_PAGE_SIZE + 1,
+        offset=page * HISTORY_PAGE_SIZE,
+    )
+    has_more = len(note_ids) > HISTORY_PAGE_SIZE
+    note_ids = note_ids[:HISTORY_PAGE_SIZE]
+    if not note_ids:
+        return f"📭 С тегом #{tag.name} заметок нет.", None
+
+    rows = await MeetingNote.filter(id__in=note_ids).values(
+        *HISTORY_FIELDS, "person__name"
+    )
+    by_id = {str(row["id"]): row for row in rows}
+
+    note_buttons: list[tuple[str, str]] = []
+    for note_id in note_ids:
+        note = by_id.get(note_id)
+        if note is None:
+            continue
+        date_str = note["created_at"].strftime("%d.%m")
+        mood = note["stress_level"] if note["stress_level"] is not None else "-"
+        note_buttons.append(
+            (
+                f"📅 {date_str} {note['person__name']} ({mood}/10) "
+                f"{note['snippet'] or ''}",
+                pack_uuid(note["id"]),
+            )
+        )
+
+    pages = max(page + 1, math.ceil(tag.notes_count / HISTORY_PAGE_SIZE))
+    text = (
+        f"🏷 <b>#{tag.name}</b>: {tag.notes_count}\n"
+        f"Страница {page + 1}/{pages}\n\n"
+        "Выберите заметку:"
+    )
+    kb = get_tag_notes_keyboard(
+        tag_id=tag_id,
+        page=page,
+        note_buttons=note_buttons,
+        has_more=has_more,
+    )
+    return text, kb
+
+
+@router.message(Command("tags"))
+async def cmd_tags(message: types.Message):
+    text, kb = await _build_tags_page(message.from_user.id)
+    await message.answer(text, reply_markup=kb)
+
+
+@router.callback_query(F.data.startswith("tags:"))
+async def callback_tags_page(callback: types.CallbackQuery):
+    """
+    callback_data: tags:<page>
+    """
+    parts = callback.data.split(":")
+    if len(parts) != 2 or not parts[1].isdigit():
+        await callback.answer("Некорректная команда", show_alert=True)
+        return
+
+    text, kb = await _build_tags_page(callback.from_user.id, int(parts[1]))
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("tag:"))
+async def callback_tag_notes(callback: types.CallbackQuery):
+    """
+    callback_data: tag:<tag_id>:<page>
+    """
+    parts = callback.data.split(":")
+    if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+        await callback.answer("Некорректная команда", show_alert=True)
+        return
+
+    text, kb = await _build_tag_notes_page(
+        callback.from_user.id, int(parts[1]), int(parts[2])
+    )
+    if not kb:
+        await callback.answer(text, show_alert=True)
+        return
+
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
@@ -0,0 +1,128 @@
+import html
+
+from aiogram import F, Router, types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+
+from keyboards.todos_kb import VIEW_DONE, VIEW_OPEN, get_todos_keyboard
+from services import action_items
+from utils.text import make_snippet
+
+router = Router()
+
+TODOS_PAGE_SIZE = 8
+
+_VIEW_STATUS = {
+    VIEW_OPEN: action_items.STATUS_OPEN,
+    VIEW_DONE: action_items.STATUS_DONE,
+}
+
+
+async def build_todos_page(
+    user_id: int,
+    view: str = VIEW_OPEN,
+    page: int = 0,
+) -> tuple[str, types.InlineKeyboardMarkup | None]:
+    status = _VIEW_STATUS[view]
+    total = await action_items.count(user_id, status)
+    # Страница могла опустеть после переключения последней задачи.
+    page = min(page, max(0, (total - 1) // TODOS_PAGE_SIZE))
+    items = await action_items.page(
+        user_id,
+        status,
+        limit=TODOS_PAGE_SIZE,
+        offset=page * TODOS_PAGE_SIZE,
+    )
+
+    title = "📋 <b>Открытые задачи</b>" if view == VIEW_OPEN else "☑️ <b>Выполненные задачи</b>"
+    if not items:
+        empty = (
+            "Открытых задач нет 🎉"
+            if view == VIEW_OPEN
+            else "Выполненных задач пока нет."
+        )
+        # Из пустого списка всё равно можно перейти к другому.
+        kb = get_todos_keyboard(view=view, page=0, item_buttons=[], has_more=False)
+        return f"{title}\n\n{empty}", kb
+
+    lines = [f"{title}: {total}", f"Страница {page + 1}", ""]
+    item_buttons: list[tuple[str, int]] = []
+    mark = "⬜" if view == VIEW_OPEN else "✅"
+    for number, item in enumerate(items, start=page * TODOS_PAGE_SIZE + 1):
+        date_str = item["created_at"].strftime("%d.%m")
+        lines.append(
+            f"{number}. <b>{html.escape(item['person__name'])}</b> · {date_str} — "
+            f"{html.escape(item['text'])}"
+        )
+        item_buttons.append((f"{mark} {number}. {make_snippet(item['text'])}", item["id"]))
+
+    hint = (
+        "Нажмите на задачу, чтобы отметить выполненной."
+        if view == VIEW_OPEN
+        else "Нажмите на задачу, чтобы вернуть её в открытые."
+    )
+    lines.extend(["", hint])
+    kb = get_todos_keyboard(
+        view=view,
+        page=page,
+        item_buttons=item_buttons,
+        has_more=total > (page + 1) * TODOS_PAGE_SIZE,
+    )
+    return "\n".join(lines), kb
+
+
+@router.message(Command("todos"))
+async def cmd_todos(message: types.Message):
+    text, kb = await build_todos_page(message.from_user.id)
+    await message.answer(text, reply_markup=kb)
+
+
+def _parse_view_page(view: str, page: str) -> tuple[str, int] | None:
+    if view not in _VIEW_STATUS or not page.isdigit():
+        return None
+    return view, int(page)
+
+
+@router.callback_query(F.data.startswith("todos:"))
+async def callback_todos_page(callback: types.CallbackQuery):
+    """
+    callback_data: todos:<view>:<page>
+    """
+    parts = callback.data.split(":")
+    parsed = _parse_view_page(*parts[1:]) if len(parts) == 3 else None
+    if parsed is None:
+        await callback.answer("Некорректная команда", show_alert=True)
+        return
+
+    text, kb = await build_todos_page(callback.from_user.id, *parsed)
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("todo:"))
+async def callback_todo_toggle(callback: types.CallbackQuery):
+    """
+    callback_data: todo:<item_id>:<view>:<page>
+    """
+    parts = callback.data.split(":")
+    parsed = _parse_view_page(*parts[2:]) if len(parts) == 4 else None
+    if parsed is None or not parts[1].isdigit():
+        await callback.answer("Некорректная команда", show_alert=True)
+        return
+
+    view, page = parsed
+    status = (
+        action_items.STATUS_DONE if view == VIEW_OPEN else action_items.STATUS_OPEN
+    )
+    if not await action_items.set_status(callback.from_user.id, int(parts[1]), status):
+        await callback.answer("Задача не найдена (заметку могли разобрать заново)", show_alert=True)
+    else:
+        await callback.answer(
+            "✅ Выполнено" if status == action_items.STATUS_DONE else "↩️ Снова открыта"
+        )
+
+    text, kb = await build_todos_page(callback.from_user.id, view, page)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest:
+        pass
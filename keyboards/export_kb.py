@@ -0,0 +1,13 @@
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from services.export import FORMATS
+
+
+def get_export_formats_keyboard() -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for fmt, title in FORMATS.items():
+        # callback_data: export:<format>
+        builder.button(text=title, callback_data=f"export:{fmt}")
+    builder.adjust(len(FORMATS))
+    return builder.as_markup()
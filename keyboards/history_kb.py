@@ -1,52 +1,186 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+# Курсор страницы истории: <op><note_id22>, где op —
+#   a — страница начинается с этой заметки (включительно),
+#   o — заметки старше этой (следующая страница),
+#   n — заметки новее этой (предыдущая страница).
+CURSOR_AT = "a"
+CURSOR_OLDER = "o"
+CURSOR_NEWER = "n"
 
-def get_history_keyboard(
-    *,
+
+def history_page_callback(
     person_id: int,
     page: int,
+    cursor: str | None = None,
+) -> str:
+    """
+    callback_data: history_page:<person_id>:<page>[:<cursor>]
+    """
+    data = f"history_page:{person_id}:{page}"
+    return f"{data}:{cursor}" if cursor else data
+
+
+def get_notes_list_keyboard(
+    *,
     note_buttons: list[tuple[str, str]],
-    has_prev: bool,
-    has_next: bool,
+    prev_callback: str | None,
+    next_callback: str | None,
+    back_button: tuple[str, str],
 ) -> InlineKeyboardMarkup:
     """
-    note_buttons: список (button_text, note_id)
+    Список заметок: по кнопке на заметку, навигация, кнопка возврата.
+    note_buttons и back_button — пары (текст, callback_data).
     """
     builder = InlineKeyboardBuilder()
 
-    for text, note_id in note_buttons:
-        builder.row(
-            InlineKeyboardButton(
-                text=text,
-                callback_data=f"note_view:{note_id}:{person_id}:{page}",
-            )
-        )
+    for text, callback_data in note_buttons:
+        builder.row(InlineKeyboardButton(text=text, callback_data=callback_data))
 
     nav_row = []
-    if has_prev:
+    if prev_callback:
         nav_row.append(
-            InlineKeyboardButton(
-                text="⬅️ Назад",
-                callback_data=f"history_page:{person_id}:{page - 1}",
-            )
+            InlineKeyboardButton(text="⬅️ Назад", callback_data=prev_callback)
         )
-    if has_next:
+    if next_callback:
         nav_row.append(
-            InlineKeyboardButton(
-                text="Вперёд ➡️",
-                callback_data=f"history_page:{person_id}:{page + 1}",
-            )
+            InlineKeyboardButton(text="Вперёд ➡️", callback_data=next_callback)
         )
 
     if nav_row:
         builder.row(*nav_row)
 
-    builder.row(
-        InlineKeyboardButton(
-            text="👤 К человеку",
-            callback_data=f"person_select:{person_id}",
-        )
-    )
+    text, callback_data = back_button
+    builder.row(InlineKeyboardButton(text=text, callback_data=callback_data))
     return builder.as_markup()
 
+
+def get_history_keyboard(
+    *,
+    person_id: int,
+    page: int,
+    note_buttons: list[tuple[str, str]],
+    anchor: str,
+    prev_cursor: str | None,
+    next_cursor: str | None,
+) -> InlineKeyboardMarkup:
+    """
+    note_buttons: список (button_text, note_id22).
+    anchor — id22 первой заметки страницы (для возврата из заметки),
+    prev_cursor/next_cursor — id22 крайних заметок или None.
+    """
+    return get_notes_list_keyboard(
+        note_buttons=[
+            (text, f"note_view:{note_id}:{page}:{anchor}")
+            for text, note_id in note_buttons
+        ],
+        prev_callback=(
+            history_page_callback(person_id, page - 1, CURSOR_NEWER + prev_cursor)
+            if prev_cursor
+            else None
+        ),
+        next_callback=(
+            history_page_callback(person_id, page + 1, CURSOR_OLDER + next_cursor)
+            if next_cursor
+            else None
+        ),
+        back_button=("👤 К человеку", f"person_select:{person_id}"),
+    )
+
+
+# Заметка, открытая из поиска: note_view:<note_id22>:<page>:s — кнопка
+# «Назад» ведёт на ту же страницу результатов.
+SEARCH_ANCHOR = "s"
+
+
+def search_page_callback(page: int) -> str:
+    """
+    callback_data: search_page:<page>. Сам запрос хранится в данных FSM.
+    """
+    return f"search_page:{page}"
+
+
+def get_search_keyboard(
+    *,
+    page: int,
+    note_buttons: list[tuple[str, str]],
+    has_more: bool,
+) -> InlineKeyboardMarkup:
+    """
+    note_buttons: список (button_text, note_id22).
+    """
+    return get_notes_list_keyboard(
+        note_buttons=[
+            (text, f"note_view:{note_id}:{page}:{SEARCH_ANCHOR}")
+            for text, note_id in note_buttons
+        ],
+        prev_callback=search_page_callback(page - 1) if page > 0 else None,
+        next_callback=search_page_callback(page + 1) if has_more else None,
+        back_button=("📅 К встречам", "back_to_team"),
+    )
+
+
+# Заметка, открытая из списка по тегу: note_view:<note_id22>:<page>:t<tag_id>.
+TAG_ANCHOR = "t"
+
+
+def tag_page_callback(tag_id: int, page: int) -> str:
+    """
+    callback_data: tag:<tag_id>:<page>
+    """
+    return f"tag:{tag_id}:{page}"
+
+
+def get_tag_notes_keyboard(
+    *,
+    tag_id: int,
+    page: int,
+    note_buttons: list[tuple[str, str]],
+    has_more: bool,
+) -> InlineKeyboardMarkup:
+    """
+    note_buttons: список (button_text, note_id22).
+    """
+    return get_notes_list_keyboard(
+        note_buttons=[
+            (text, f"note_view:{note_id}:{page}:{TAG_ANCHOR}{tag_id}")
+            for text, note_id in note_buttons
+        ],
+        prev_callback=tag_page_callback(tag_id, page - 1) if page > 0 else None,
+        next_callback=tag_page_callback(tag_id, page + 1) if has_more else None,
+        # tags:<page> — список тегов (keyboards/tags_kb.py).
+        back_button=("🏷 К тегам", "tags:0"),
+    )
+
+
+# Заметка, открытая из похожих: note_view:<note_id22>:0:r<source_id22>,
+# «Назад» — снова к похожим на исходную заметку. Из списка похожих
+# исходная заметка открывается как из истории — со страницы, где она первая.
+SIMILAR_ANCHOR = "r"
+
+
+def similar_callback(note_id22: str) -> str:
+    """
+    callback_data: similar:<note_id22>
+    """
+    return f"similar:{note_id22}"
+
+
+def get_similar_keyboard(
+    *,
+    source_id22: str,
+    note_buttons: list[tuple[str, str]],
+) -> InlineKeyboardMarkup:
+    """
+    note_buttons: список (button_text, note_id22).
+    """
+    return get_notes_list_keyboard(
+        note_buttons=[
+            (text, f"note_view:{note_id}:0:{SIMILAR_ANCHOR}{source_id22}")
+            for text, note_id in note_buttons
+        ],
+        prev_callback=None,
+        next_callback=None,
+        back_button=("📝 К заметке", f"note_view:{source_id22}:0:{source_id22}"),
+    )
@@ -5,6 +5,7 @@ MAIN_MENU_BUTTONS = (
     "➕ Заметка",
     "📅 Встречи",
     "🕘 История",
+    "📋 Задачи",
     "⚙️ Настройки",
     "❓ Помощь",
 )
@@ -22,9 +23,12 @@ def get_main_menu_keyboard() -> ReplyKeyboardMarkup:
             ],
             [
                 KeyboardButton(text="🕘 История"),
+                KeyboardButton(text="📋 Задачи"),
+            ],
+            [
                 KeyboardButton(text="⚙️ Настройки"),
+                KeyboardButton(text="❓ Помощь"),
             ],
-            [KeyboardButton(text="❓ Помощь")],
         ],
         resize_keyboard=True,
         input_field_placeholder="Выберите действие…",
@@ -1,6 +1,8 @@
 from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from utils.callback_data import pack_uuid
+
 
 def get_note_actions_keyboard(
     note_id: str,
@@ -17,14 +19,12 @@ def get_note_actions_keyboard(
         text="🗑️ Удалить",
         callback_data=f"note_delete:{note_id}:{person_id}",
     )
+    builder.button(text="🔍 Похожие", callback_data=f"similar:{pack_uuid(note_id)}")
     if back_callback_data:
         builder.button(text="🔙 К истории", callback_data=back_callback_data)
     builder.button(
         text="👤 К человеку",
         callback_data=f"person_select:{person_id}",
     )
-    if back_callback_data:
-        builder.adjust(2, 2, 1)
-    else:
-        builder.adjust(2, 1, 1)
+    builder.adjust(2, 2, 1, 1)
     return builder.as_markup()
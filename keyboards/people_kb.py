@@ -21,12 +21,34 @@ def get_person_actions_keyboard(person_id: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="📝 Добавить заметку", callback_data=f"add_note:{person_id}")
     builder.button(text="📜 История", callback_data=f"history:{person_id}")
+    builder.button(text="📈 Динамика", callback_data=f"trends:{person_id}")
+    builder.button(text="🖼 График", callback_data=f"mood_chart:{person_id}")
+    builder.button(text="🗂 Дайджест", callback_data=f"digest:{person_id}")
     builder.button(text="🧠 Промпт", callback_data=f"person_prompt:{person_id}")
     builder.button(text="🔙 Назад", callback_data="back_to_team")
     builder.adjust(1)
     return builder.as_markup()
 
 
+def get_person_back_keyboard(person_id: int) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔙 Назад", callback_data=f"person_select:{person_id}")
+    return builder.as_markup()
+
+
+def get_digest_keyboard(person_id: int, weeks_options: tuple[int, ...]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for weeks in weeks_options:
+        # callback_data: digest_run:<person_id>:<недель>
+        builder.button(
+            text=f"{weeks} нед.",
+            callback_data=f"digest_run:{person_id}:{weeks}",
+        )
+    builder.button(text="🔙 Назад", callback_data=f"person_select:{person_id}")
+    builder.adjust(len(weeks_options), 1)
+    return builder.as_markup()
+
+
 def get_person_prompt_keyboard(
     person_id: int,
     *,
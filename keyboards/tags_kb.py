@@ -0,0 +1,27 @@
+from aiogram.types import InlineKeyboardMarkup
+
+from keyboards.history_kb import get_notes_list_keyboard, tag_page_callback
+
+
+def tags_page_callback(page: int) -> str:
+    """
+    callback_data: tags:<page>
+    """
+    return f"tags:{page}"
+
+
+def get_tags_keyboard(
+    *,
+    page: int,
+    tag_buttons: list[tuple[str, int]],
+    has_more: bool,
+) -> InlineKeyboardMarkup:
+    """
+    tag_buttons: список (button_text, tag_id). Тег открывает его заметки.
+    """
+    return get_notes_list_keyboard(
+        note_buttons=[(text, tag_page_callback(tag_id, 0)) for text, tag_id in tag_buttons],
+        prev_callback=tags_page_callback(page - 1) if page > 0 else None,
+        next_callback=tags_page_callback(page + 1) if has_more else None,
+        back_button=("📅 К встречам", "back_to_team"),
+    )
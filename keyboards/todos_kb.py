@@ -0,0 +1,39 @@
+from aiogram.types import InlineKeyboardMarkup
+
+from keyboards.history_kb import get_notes_list_keyboard
+
+# Вид списка задач в callback_data: o — открытые, d — выполненные.
+VIEW_OPEN = "o"
+VIEW_DONE = "d"
+
+
+def todos_page_callback(view: str, page: int) -> str:
+    """
+    callback_data: todos:<view>:<page>
+    """
+    return f"todos:{view}:{page}"
+
+
+def get_todos_keyboard(
+    *,
+    view: str,
+    page: int,
+    item_buttons: list[tuple[str, int]],
+    has_more: bool,
+) -> InlineKeyboardMarkup:
+    """
+    item_buttons: список (button_text, item_id). Кнопка задачи переключает
+    её статус: todo:<item_id>:<view>:<page>.
+    """
+    other = VIEW_DONE if view == VIEW_OPEN else VIEW_OPEN
+    return get_notes_list_keyboard(
+        note_buttons=[
+            (text, f"todo:{item_id}:{view}:{page}") for text, item_id in item_buttons
+        ],
+        prev_callback=todos_page_callback(view, page - 1) if page > 0 else None,
+        next_callback=todos_page_callback(view, page + 1) if has_more else None,
+        back_button=(
+            "☑️ Выполненные" if other == VIEW_DONE else "📋 Открытые",
+            todos_page_callback(other, 0),
+        ),
+    )
@@ -0,0 +1,91 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from database.models import Person
+from services import metrics, people_cache
+
+# AICODE-NOTE: Проверка «встреча/заметка принадлежит пользователю» идёт
+# через кэш services/people_cache.py: встречи пользователя — множество id,
+# заметка -> встреча — отдельный LRU. Хендлеры получают объект Ownership
+# параметром `ownership` и не ходят в БД ради сравнения person.user_id.
+
+_stats = {"checks": 0, "denied": 0, "reloads": 0}
+
+
+class Ownership:
+    """
+    Права текущего пользователя. Список встреч загружается лениво, при
+    первой проверке, — апдейты без проверок кэш не трогают.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._people: dict[int, Person] | None = None
+        self._reloaded = False
+
+    async def _load(self) -> dict[int, Person]:
+        if self._people is None:
+            cached = await people_cache.get(self.user_id)
+            self._people = {person.id: person for person in cached.people}
+        return self._people
+
+    async def person(self, person_id: int | None) -> Person | None:
+        """
+        Встреча пользователя из кэша (только id, user_id, name) или None.
+        Для изменений встречу нужно загрузить из БД.
+        """
+        _stats["checks"] += 1
+        if person_id is None:
+            _stats["denied"] += 1
+            return None
+
+        people = await self._load()
+        if person_id not in people and not self._reloaded:
+            # Встречу могли создать в другом процессе в пределах TTL —
+            # перечитываем один раз на апдейт, прежде чем отказать.
+            self._reloaded = True
+            _stats["reloads"] += 1
+            people_cache.invalidate(self.user_id)
+            self._people = None
+            people = await self._load()
+
+        person = people.get(person_id)
+        if person is None:
+            _stats["denied"] += 1
+        return person
+
+    async def owns_person(self, person_id: int | None) -> bool:
+        return await self.person(person_id) is not None
+
+    async def note_person_id(self, note_id) -> int | None:
+        """
+        person_id заметки, если она принадлежит пользователю, иначе None.
+        """
+        person_id = await people_cache.note_person_id(note_id)
+        if person_id is None:
+            _stats["checks"] += 1
+            _stats["denied"] += 1
+            return None
+        return person_id if await self.owns_person(person_id) else None
+
+
+class OwnershipMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is not None:
+            data["ownership"] = Ownership(user.id)
+        return await handler(event, data)
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+metrics.register("ownership", stats)
@@ -0,0 +1,198 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update, User
+
+from config import (
+    SCHEDULER_DEFER_SECONDS,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_MAX_WAITING,
+    SCHEDULER_USER_QUEUE_LIMIT,
+)
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _UserLane:
+    __slots__ = ("lock", "pending", "deferred")
+
+    def __init__(self):
+        # asyncio.Lock будит ожидающих в порядке очереди — апдейты
+        # пользователя выполняются в порядке поступления.
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        # Сообщения, ждущие места в полной очереди. Освободившееся место
+        # передаётся первому из них, а не уменьшает pending.
+        self.deferred: deque[asyncio.Future] = deque()
+
+
+class UpdateScheduler(BaseMiddleware):
+    """
+    Внешняя middleware на dp.update.
+
+    AICODE-NOTE: Стоит перед FSMContextMiddleware (см. bot.setup_dispatcher):
+    состояние FSM читается уже под замком пользователя, поэтому два быстрых
+    сообщения не проходят оба как «текст заметки». Апдейты разных
+    пользователей идут параллельно, но не больше max_concurrency сразу.
+    Сообщение при полной очереди пользователя ждёт места до defer_seconds
+    (длинную заметку Telegram режет на несколько сообщений) — места
+    раздаются ожидающим по очереди, новые апдейты их не обгоняют. Кнопки
+    сбрасываются сразу.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+        user_queue_limit: int = SCHEDULER_USER_QUEUE_LIMIT,
+        max_waiting: int = SCHEDULER_MAX_WAITING,
+        defer_seconds: float = SCHEDULER_DEFER_SECONDS,
+    ):
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._user_queue_limit = user_queue_limit
+        self._max_waiting = max_waiting
+        self._defer_seconds = defer_seconds
+        self._lanes: dict[int, _UserLane] = {}
+        self._waiting = 0
+        self._active = 0
+        self._deferring = 0
+        self._stats = {
+            "processed": 0,
+            "deferred": 0,
+            "shed_user": 0,
+            "shed_global": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+        metrics.register("scheduler", self.stats)
+
+    async def _shed(self, event: TelegramObject, reason: str) -> None:
+        self._stats[f"shed_{reason}"] += 1
+        logger.warning("Update shed (%s)", reason)
+        if not isinstance(event, Update):
+            return
+        try:
+            if event.callback_query:
+                # Кнопка иначе «крутится» до таймаута Telegram.
+                await event.callback_query.answer("⏳ Слишком много действий, подождите")
+            elif event.message:
+                # Сообщение — обычно текст заметки: молча терять его нельзя.
+                await event.message.answer(
+                    "⏳ Слишком много сообщений, отправьте ещё раз"
+                )
+        except TelegramAPIError:
+            pass
+
+    def _release(self, user_id: int, lane: _UserLane) -> None:
+        """
+        Освобождает место в очереди пользователя: первому отложенному
+        сообщению, если такое есть.
+        """
+        while lane.deferred:
+            waiter = lane.deferred.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        lane.pending -= 1
+        if lane.pending == 0:
+            self._lanes.pop(user_id, None)
+
+    async def _defer(self, user_id: int, lane: _UserLane) -> bool:
+        """
+        Ставит сообщение в очередь за местом, не дольше defer_seconds.
+        True — место получено (pending уже учтён).
+        """
+        self._stats["deferred"] += 1
+        self._deferring += 1
+        waiter = asyncio.get_running_loop().create_future()
+        lane.deferred.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self._defer_seconds)
+        except BaseException:
+            if waiter.done():
+                # Место уже передано нам — отдаём его следующему.
+                self._release(user_id, lane)
+            raise
+        finally:
+            self._deferring -= 1
+            if not waiter.done():
+                waiter.cancel()
+                lane.deferred.remove(waiter)
+        return not waiter.cancelled()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if self._waiting >= self._max_waiting:
+            await self._shed(event, "global")
+            return None
+
+        user: User | None = data.get("event_from_user")
+        lane = None
+        if user is not None:
+            lane = self._lanes.get(user.id)
+            if lane is None:
+                lane = self._lanes[user.id] = _UserLane()
+            # Пока есть отложенные сообщения, новые апдейты встают за ними.
+            if lane.pending < self._user_queue_limit and not lane.deferred:
+                lane.pending += 1
+            elif not (
+                isinstance(event, Update)
+                and event.message
+                and await self._defer(user.id, lane)
+            ):
+                await self._shed(event, "user")
+                return None
+
+        self._waiting += 1
+        waiting = True
+        queued_at = time.monotonic()
+        try:
+            async with lane.lock if lane else contextlib.nullcontext():
+                async with self._slots:
+                    self._waiting -= 1
+                    waiting = False
+                    waited_ms = (time.monotonic() - queued_at) * 1000
+                    self._stats["wait_ms_total"] += waited_ms
+                    self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited_ms)
+
+                    self._active += 1
+                    try:
+                        return await handler(event, data)
+                    finally:
+                        self._active -= 1
+                        self._stats["processed"] += 1
+        finally:
+            if waiting:
+                self._waiting -= 1
+            if lane is not None:
+                self._release(user.id, lane)
+
+    def stats(self) -> dict:
+        processed = self._stats["processed"]
+        return {
+            "active": self._active,
+            "max_concurrency": self._max_concurrency,
+            "waiting": self._waiting,
+            "busy_users": len(self._lanes),
+            "deferring": self._deferring,
+            "deferred": self._stats["deferred"],
+            "processed": processed,
+            "shed_user": self._stats["shed_user"],
+            "shed_global": self._stats["shed_global"],
+            "wait_ms_avg": (
+                round(self._stats["wait_ms_total"] / processed, 1) if processed else None
+            ),
+            "wait_ms_max": round(self._stats["wait_ms_max"], 1),
+        }
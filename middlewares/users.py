@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TgUser
+
+from config import SEEN_USERS_CACHE_SIZE, SEEN_USERS_TTL_SECONDS
+from database.models import User
+from services import metrics
+
+# AICODE-NOTE: Строка users создаётся здесь, до любого хендлера, — хендлеры
+# считают, что пользователь есть в БД. Чтобы не писать на каждый апдейт,
+# помним недавно виденных пользователей с хэшем профиля: upsert идёт при
+# первом апдейте, по истечении TTL или если сменились username/full_name.
+
+# user_id -> (expires_at, hash профиля)
+_seen: OrderedDict[int, tuple[float, int]] = OrderedDict()
+_stats = {"hits": 0, "upserts": 0, "evicted": 0}
+
+
+def _profile_hash(user: TgUser) -> int:
+    return hash((user.username, user.full_name))
+
+
+async def ensure_user(user: TgUser) -> None:
+    profile = _profile_hash(user)
+    seen = _seen.get(user.id)
+    if seen and seen[0] > time.monotonic() and seen[1] == profile:
+        _seen.move_to_end(user.id)
+        _stats["hits"] += 1
+        return
+
+    # Один запрос INSERT ... ON CONFLICT DO UPDATE вместо get_or_create + save.
+    await User.bulk_create(
+        [User(id=user.id, username=user.username, full_name=user.full_name)],
+        on_conflict=["id"],
+        update_fields=["username", "full_name"],
+    )
+    _stats["upserts"] += 1
+
+    _seen[user.id] = (time.monotonic() + SEEN_USERS_TTL_SECONDS, profile)
+    _seen.move_to_end(user.id)
+    while len(_seen) > SEEN_USERS_CACHE_SIZE:
+        _seen.popitem(last=False)
+        _stats["evicted"] += 1
+
+
+class UserUpsertMiddleware(BaseMiddleware):
+    """
+    Внешняя middleware на dp.update: срабатывает для каждого апдейта с
+    пользователем, даже если хендлер не найден.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: TgUser | None = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            await ensure_user(user)
+        return await handler(event, data)
+
+
+def stats() -> dict:
+    return {**_stats, "size": len(_seen)}
+
+
+metrics.register("users", stats)
@@ -0,0 +1,145 @@
+from tortoise.transactions import in_transaction
+
+from database.models import ActionItem, MeetingNote
+from services import metrics
+
+# AICODE-NOTE: Задачи хранятся и в ai_summary (как их вернул LLM), и строками
+# в action_items — для списка по всем встречам без разбора JSON. Строки
+# переписываются при каждой записи разбора (services/notes.apply_analysis)
+# в той же транзакции; отметка «сделано» переживает повторный разбор, если
+# текст задачи не изменился.
+
+STATUS_OPEN = "open"
+STATUS_DONE = "done"
+
+REBUILD_BATCH_SIZE = 500
+
+_stats = {"synced_notes": 0, "toggled": 0}
+
+
+def _texts(action_items) -> list[str]:
+    texts = (str(item).strip() for item in action_items or [])
+    return [text for text in texts if text]
+
+
+def _build(note_id, person_id: int, user_id: int, created_at, texts, done: set[str]):
+    return [
+        ActionItem(
+            note_id=note_id,
+            person_id=person_id,
+            user_id=user_id,
+            position=position,
+            text=text,
+            status=STATUS_DONE if text in done else STATUS_OPEN,
+            created_at=created_at,
+        )
+        for position, text in enumerate(texts)
+    ]
+
+
+async def sync(note: MeetingNote, action_items) -> None:
+    """
+    Переписывает задачи заметки по разбору. note.person должен быть загружен.
+    Вызывается внутри транзакции записи разбора.
+    """
+    done = set(
+        await ActionItem.filter(note_id=note.id, status=STATUS_DONE).values_list(
+            "text", flat=True
+        )
+    )
+    await ActionItem.filter(note_id=note.id).delete()
+    items = _build(
+        note.id,
+        note.person_id,
+        note.person.user_id,
+        note.created_at,
+        _texts(action_items),
+        done,
+    )
+    if items:
+        await ActionItem.bulk_create(items)
+    _stats["synced_notes"] += 1
+
+
+async def forget(note_id) -> None:
+    # ON DELETE CASCADE в SQLite работает только с PRAGMA foreign_keys —
+    # удаляем явно, как и поисковый индекс.
+    await ActionItem.filter(note_id=note_id).delete()
+
+
+async def page(user_id: int, status: str, *, limit: int, offset: int = 0) -> list[dict]:
+    """
+    Задачи пользователя со статусом status, от новых встреч к старым.
+    """
+    return await (
+        ActionItem.filter(user_id=user_id, status=status)
+        .order_by("-created_at", "-id")
+        .offset(offset)
+        .limit(limit)
+        .values("id", "text", "created_at", "person__name")
+    )
+
+
+async def count(user_id: int, status: str) -> int:
+    return await ActionItem.filter(user_id=user_id, status=status).count()
+
+
+async def set_status(user_id: int, item_id: int, status: str) -> bool:
+    """
+    False — задачи нет или она чужая.
+    """
+    updated = await ActionItem.filter(id=item_id, user_id=user_id).update(status=status)
+    if updated:
+        _stats["toggled"] += 1
+    return bool(updated)
+
+
+async def rebuild() -> int:
+    """
+    Пересобирает задачи по разборам всех заметок (для базы, где разборы были
+    до таблицы action_items). Отметки «сделано» сохраняются. Возвращает число
+    задач.
+    """
+    total = 0
+    last_id = None
+    while True:
+        query = MeetingNote.filter(ai_summary__isnull=False).order_by("id")
+        if last_id is not None:
+            query = query.filter(id__gt=last_id)
+        rows = await query.limit(REBUILD_BATCH_SIZE).values(
+            "id", "person_id", "person__user_id", "created_at", "ai_summary"
+        )
+        if not rows:
+            return total
+        note_ids = [row["id"] for row in rows]
+        done: dict[str, set[str]] = {}
+        for note_id, text in await ActionItem.filter(
+            note_id__in=note_ids, status=STATUS_DONE
+        ).values_list("note_id", "text"):
+            done.setdefault(str(note_id), set()).add(text)
+
+        items = []
+        for row in rows:
+            items.extend(
+                _build(
+                    row["id"],
+                    row["person_id"],
+                    row["person__user_id"],
+                    row["created_at"],
+                    _texts((row["ai_summary"] or {}).get("action_items")),
+                    done.get(str(row["id"]), set()),
+                )
+            )
+        async with in_transaction():
+            await ActionItem.filter(note_id__in=note_ids).delete()
+            if items:
+                await ActionItem.bulk_create(items)
+        total += len(items)
+        last_id = rows[-1]["id"]
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+metrics.register("action_items", stats)
@@ -0,0 +1,160 @@
+import copy
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from tortoise.expressions import F
+
+from config import (
+    ANALYSIS_CACHE_LRU_SIZE,
+    ANALYSIS_CACHE_MAX_ROWS,
+    ANALYSIS_CACHE_TTL_DAYS,
+)
+from database.models import AnalysisCacheEntry
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Как часто (в записях) запускать очистку таблицы по TTL/размеру.
+EVICT_EVERY_WRITES = 100
+
+_lru: OrderedDict[str, dict] = OrderedDict()
+_writes_since_evict = 0
+_stats = {
+    "lru_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "writes": 0,
+    "evicted": 0,
+}
+
+
+def normalize_text(text: str) -> str:
+    """
+    Нормализация текста для ключа кэша: юникод NFC, единые переводы строк,
+    без хвостовых пробелов и пустых строк по краям.
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def make_key(text: str, system_prompt: str, model: str) -> str:
+    digest = hashlib.sha256()
+    for part in (normalize_text(text), system_prompt, model):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _lru_put(key: str, result: dict) -> None:
+    _lru[key] = result
+    _lru.move_to_end(key)
+    while len(_lru) > ANALYSIS_CACHE_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def get(key: str) -> dict | None:
+    """
+    Возвращает копию закэшированного результата или None.
+    """
+    cached = _lru.get(key)
+    if cached is not None:
+        _lru.move_to_end(key)
+        _stats["lru_hits"] += 1
+        return copy.deepcopy(cached)
+
+    try:
+        entry = await AnalysisCacheEntry.get_or_none(key=key)
+        if entry and entry.created_at < _now() - timedelta(
+            days=ANALYSIS_CACHE_TTL_DAYS
+        ):
+            await entry.delete()
+            entry = None
+        if entry:
+            await AnalysisCacheEntry.filter(key=key).update(
+                hits=F("hits") + 1,
+                last_used_at=_now(),
+            )
+    except Exception as e:
+        # AICODE-NOTE: Кэш — оптимизация. Ошибка БД не должна ломать анализ.
+        logger.warning("Analysis cache read failed: %s", e)
+        entry = None
+
+    if not entry:
+        _stats["misses"] += 1
+        return None
+
+    _stats["db_hits"] += 1
+    _lru_put(key, entry.result)
+    return copy.deepcopy(entry.result)
+
+
+async def put(key: str, model: str, result: dict) -> None:
+    global _writes_since_evict
+
+    _lru_put(key, copy.deepcopy(result))
+    try:
+        await AnalysisCacheEntry.update_or_create(
+            key=key,
+            defaults={
+                "model": model,
+                "result": result,
+                "created_at": _now(),
+                "last_used_at": _now(),
+            },
+        )
+    except Exception as e:
+        logger.warning("Analysis cache write failed: %s", e)
+        return
+
+    _stats["writes"] += 1
+    _writes_since_evict += 1
+    if _writes_since_evict >= EVICT_EVERY_WRITES:
+        _writes_since_evict = 0
+        try:
+            await evict()
+        except Exception as e:
+            # Результат уже в кэше — сбой чистки не должен ломать анализ.
+            logger.warning("Analysis cache eviction failed: %s", e)
+
+
+async def evict() -> int:
+    """
+    Удаляет записи старше TTL и самые давно использованные сверх лимита.
+    """
+    deleted = await AnalysisCacheEntry.filter(
+        created_at__lt=_now() - timedelta(days=ANALYSIS_CACHE_TTL_DAYS)
+    ).delete()
+
+    overflow = await AnalysisCacheEntry.all().count() - ANALYSIS_CACHE_MAX_ROWS
+    if overflow > 0:
+        stale_keys = await (
+            AnalysisCacheEntry.all()
+            .order_by("last_used_at")
+            .limit(overflow)
+            .values_list("key", flat=True)
+        )
+        deleted += await AnalysisCacheEntry.filter(key__in=stale_keys).delete()
+
+    _stats["evicted"] += deleted
+    return deleted
+
+
+def stats() -> dict:
+    lookups = _stats["lru_hits"] + _stats["db_hits"] + _stats["misses"]
+    hits = _stats["lru_hits"] + _stats["db_hits"]
+    return {
+        **_stats,
+        "lru_size": len(_lru),
+        "hit_rate": round(hits / lookups, 3) if lookups else None,
+    }
+
+
+metrics.register("analysis_cache", stats)
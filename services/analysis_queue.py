@@ -0,0 +1,567 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from tortoise.expressions import Q, Subquery
+
+from config import (
+    ANALYSIS_MAX_ATTEMPTS,
+    ANALYSIS_POLL_SECONDS,
+    ANALYSIS_RETRY_BASE_SECONDS,
+    ANALYSIS_RETRY_MAX_SECONDS,
+    ANALYSIS_STREAMING,
+    ANALYSIS_SWEEP_BATCH,
+    ANALYSIS_SWEEP_SECONDS,
+    ANALYSIS_BACKGROUND_WORKERS,
+    ANALYSIS_LEASE_SECONDS,
+    ANALYSIS_WORKERS,
+    WORKER_ID,
+)
+from database.models import AnalysisJob, MeetingNote
+from services import metrics
+from services.llm import analyze_note, analyze_note_stream, prompt_fingerprint
+from services.llm_gateway import LLMUnavailableError, gateway
+from services.notes import (
+    ANALYSIS_DONE,
+    ANALYSIS_FAILED,
+    FAILED_ANALYSIS,
+    apply_analysis,
+    effective_custom_prompt,
+)
+from utils.message_editor import ThrottledEditor
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_FAILED = "failed"
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# AICODE-NOTE: Захваченная задача арендуется: пока она выполняется, воркер
+# раз в треть ANALYSIS_LEASE_SECONDS обновляет её updated_at. Задачу с
+# истёкшей арендой (процесс упал, контейнер пересоздан с другим hostname)
+# любой процесс возвращает в очередь — _lease_loop и старт воркеров.
+
+# Кто выполняет задачу. Под supervisor.py (задан WORKER_ID) тег стабилен
+# между рестартами воркера — свои прерванные задачи он забирает сразу при
+# старте. Без WORKER_ID на хосте может работать несколько процессов (реплики
+# вебхука): тег уникален для процесса, его задачи после падения возвращает
+# только истечение аренды.
+if WORKER_ID is not None:
+    WORKER_TAG = f"{socket.gethostname()}:{WORKER_ID}"[-64:]
+else:
+    WORKER_TAG = f"{socket.gethostname()}:pid{os.getpid()}"[-64:]
+
+_wakeup = asyncio.Event()
+# Фоновые задачи (пересчёт, импорт) занимают не больше
+# ANALYSIS_BACKGROUND_WORKERS воркеров процесса — остальные всегда свободны
+# для заметок, которые ждёт пользователь.
+_background_slots = asyncio.Semaphore(max(1, min(ANALYSIS_BACKGROUND_WORKERS, ANALYSIS_WORKERS)))
+_workers: list[asyncio.Task] = []
+# Служебные циклы (аренда, пересчёт) — не воркеры анализа.
+_maintenance: list[asyncio.Task] = []
+# Доставка результата (финальная правка может ждать окно троттлинга)
+# идёт отдельными задачами, чтобы не держать воркер.
+_deliveries: set[asyncio.Task] = set()
+_stats = {
+    "processed": 0,
+    "retried": 0,
+    "deferred": 0,
+    "failed": 0,
+    "swept": 0,
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(
+        ANALYSIS_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)),
+        ANALYSIS_RETRY_MAX_SECONDS,
+    )
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def enqueue(
+    note_id,
+    *,
+    chat_id: int | None = None,
+    message_id: int | None = None,
+    title: str = "Заметка сохранена",
+    back_callback: str | None = None,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> AnalysisJob:
+    """
+    Ставит заметку в очередь на анализ. Если по заметке уже есть ожидающая
+    задача — обновляем её (анализ всё равно берёт актуальный raw_text).
+    """
+    job = await AnalysisJob.filter(note_id=note_id, status=JOB_PENDING).first()
+    if job:
+        if chat_id is not None:
+            job.chat_id = chat_id
+            job.message_id = message_id
+            job.title = title
+            job.back_callback = back_callback
+        # Фоновая задача, которую ждёт пользователь, становится срочной.
+        job.priority = min(job.priority, priority)
+        job.next_run_at = _now()
+        await job.save()
+    else:
+        job = await AnalysisJob.create(
+            note_id=note_id,
+            chat_id=chat_id,
+            message_id=message_id,
+            title=title,
+            back_callback=back_callback,
+            priority=priority,
+            next_run_at=_now(),
+        )
+    _wakeup.set()
+    return job
+
+
+async def enqueue_many(note_ids: list, *, priority: int = PRIORITY_BACKGROUND) -> None:
+    """
+    Задачи для пачки новых заметок (импорт): одним INSERT, без доставки
+    результата в чат.
+    """
+    now = _now()
+    await AnalysisJob.bulk_create(
+        [
+            AnalysisJob(note_id=note_id, priority=priority, next_run_at=now)
+            for note_id in note_ids
+        ]
+    )
+    _wakeup.set()
+
+
+def _is_background(job: AnalysisJob) -> bool:
+    return job.priority >= PRIORITY_BACKGROUND
+
+
+async def _claim_next_job() -> AnalysisJob | None:
+    # Слот для фоновой задачи резервируем до запроса: между проверкой и
+    # захватом другие воркеры тоже успевают выбирать задачи.
+    background = not _background_slots.locked()
+    if background:
+        await _background_slots.acquire()
+    job = None
+    try:
+        job = await _claim(background)
+    finally:
+        if background and (job is None or not _is_background(job)):
+            _background_slots.release()
+    return job
+
+
+async def _claim(background: bool) -> AnalysisJob | None:
+    query = AnalysisJob.filter(status=JOB_PENDING, next_run_at__lte=_now())
+    if not background:
+        query = query.filter(priority__lt=PRIORITY_BACKGROUND)
+    candidates = await (
+        query.order_by("priority", "next_run_at", "id")
+        .limit(ANALYSIS_WORKERS)
+        .values_list("id", flat=True)
+    )
+    for job_id in candidates:
+        # AICODE-NOTE: Условный UPDATE — атомарный захват задачи, даже если
+        # очередь разбирают несколько процессов.
+        claimed = await AnalysisJob.filter(
+            id=job_id,
+            status=JOB_PENDING,
+        ).update(status=JOB_RUNNING, claimed_by=WORKER_TAG, updated_at=_now())
+        if claimed:
+            return await AnalysisJob.get(id=job_id)
+    return None
+
+
+def _render(job: AnalysisJob, note: MeetingNote, analysis: dict | None):
+    # AICODE-NOTE: Локальный импорт, чтобы избежать циклических импортов.
+    from handlers.notes import _render_note_report
+    from keyboards.note_kb import get_note_actions_keyboard
+
+    text = _render_note_report(
+        title=job.title,
+        meeting_name=note.person.name,
+        raw_text=note.raw_text,
+        analysis=analysis,
+    )
+    kb = get_note_actions_keyboard(
+        note_id=str(note.id),
+        person_id=note.person_id,
+        back_callback_data=job.back_callback,
+    )
+    return text, kb
+
+
+async def _deliver(
+    bot: Bot,
+    job: AnalysisJob,
+    note: MeetingNote,
+    editor: ThrottledEditor | None = None,
+) -> None:
+    if not job.chat_id:
+        return
+
+    text, kb = _render(job, note, note.ai_summary)
+    if job.message_id:
+        editor = editor or ThrottledEditor(bot, job.chat_id, job.message_id)
+        if await editor.update(text, kb, force=True):
+            return
+        # Сообщение удалено или слишком старое — отправим новое.
+        logger.info("Cannot edit message for job %s", job.id)
+
+    await bot.send_message(job.chat_id, text, reply_markup=kb)
+
+
+async def _analyze(
+    job: AnalysisJob,
+    note: MeetingNote,
+    custom_prompt: str | None,
+    editor: ThrottledEditor | None,
+) -> dict:
+    if not editor:
+        return await analyze_note(note.raw_text, custom_prompt=custom_prompt)
+
+    # Потоковый режим: показываем разбор по мере генерации, правки
+    # сообщения троттлит ThrottledEditor.
+    analysis: dict = {}
+    async for analysis in analyze_note_stream(
+        note.raw_text,
+        custom_prompt=custom_prompt,
+    ):
+        if not analysis.get("summary"):
+            continue
+        text, kb = _render(job, note, analysis)
+        await editor.update(text.rstrip() + "\n\n⏳ …", kb)
+    return analysis
+
+
+async def _run_job(bot: Bot, job: AnalysisJob) -> None:
+    note = await MeetingNote.get_or_none(id=job.note_id).prefetch_related(
+        "person"
+    )
+    if not note:
+        await job.delete()
+        return
+
+    editor = None
+    if ANALYSIS_STREAMING and job.chat_id and job.message_id:
+        editor = ThrottledEditor(bot, job.chat_id, job.message_id)
+
+    custom_prompt = effective_custom_prompt(note.person.custom_prompt)
+    analysis = await _analyze(job, note, custom_prompt, editor)
+
+    # Текст могли поправить, пока шёл анализ: тогда результат устарел, а
+    # свежую задачу уже поставил process_note_edit.
+    current = await (
+        MeetingNote.filter(id=note.id)
+        .first()
+        .values_list("raw_text", "person__custom_prompt")
+    )
+    if not current or current[0] != note.raw_text:
+        await job.delete()
+        return
+
+    # Промпт могли сменить во время анализа — тогда разбор сразу устаревший.
+    fingerprint = prompt_fingerprint(custom_prompt)
+    current_fingerprint = prompt_fingerprint(effective_custom_prompt(current[1]))
+    await apply_analysis(
+        note,
+        analysis,
+        fingerprint=fingerprint,
+        is_stale=fingerprint != current_fingerprint,
+    )
+    await job.delete()
+    _stats["processed"] += 1
+
+    task = asyncio.create_task(_deliver_safely(bot, job, note, editor))
+    _deliveries.add(task)
+    task.add_done_callback(_deliveries.discard)
+
+
+async def _heartbeat(job_id: int) -> None:
+    """
+    Продлевает аренду задачи, пока она выполняется.
+    """
+    while True:
+        await asyncio.sleep(ANALYSIS_LEASE_SECONDS / 3)
+        try:
+            await AnalysisJob.filter(
+                id=job_id,
+                status=JOB_RUNNING,
+                claimed_by=WORKER_TAG,
+            ).update(updated_at=_now())
+        except Exception as e:
+            logger.warning("Cannot extend lease of analysis job %s: %s", job_id, e)
+
+
+async def _deliver_safely(
+    bot: Bot,
+    job: AnalysisJob,
+    note: MeetingNote,
+    editor: ThrottledEditor | None,
+) -> None:
+    try:
+        await _deliver(bot, job, note, editor)
+    except TelegramAPIError as e:
+        logger.warning("Failed to deliver analysis for job %s: %s", job.id, e)
+
+
+async def _defer(job: AnalysisJob, retry_after: float) -> None:
+    """
+    Провайдер недоступен (circuit breaker открыт): откладываем задачу,
+    не расходуя попытки.
+    """
+    job.status = JOB_PENDING
+    job.next_run_at = _now() + timedelta(seconds=max(retry_after, 1.0))
+    await job.save()
+    _stats["deferred"] += 1
+
+
+async def _handle_failure(bot: Bot, job: AnalysisJob, error: Exception) -> None:
+    job.attempts += 1
+    job.last_error = str(error)
+
+    if job.attempts < ANALYSIS_MAX_ATTEMPTS:
+        job.status = JOB_PENDING
+        job.next_run_at = _now() + timedelta(seconds=_retry_delay(job.attempts))
+        await job.save()
+        _stats["retried"] += 1
+        logger.info(
+            "Analysis job %s failed (attempt %s), retry at %s: %s",
+            job.id,
+            job.attempts,
+            job.next_run_at,
+            error,
+        )
+        return
+
+    job.status = JOB_FAILED
+    await job.save()
+    _stats["failed"] += 1
+    logger.warning("Analysis job %s failed permanently: %s", job.id, error)
+
+    note = await MeetingNote.get_or_none(id=job.note_id).prefetch_related(
+        "person"
+    )
+    if not note:
+        return
+    # Пересчёт устаревшего разбора не удался — старый разбор лучше заглушки.
+    # Заметка останется is_stale, провалившаяся задача не даст фоновому
+    # пересчёту брать её снова; при просмотре будет новая попытка.
+    if not (note.is_stale and note.analysis_status == ANALYSIS_DONE):
+        await apply_analysis(
+            note,
+            {**FAILED_ANALYSIS, "error": str(error)},
+            status=ANALYSIS_FAILED,
+        )
+    try:
+        await _deliver(bot, job, note)
+    except TelegramAPIError as e:
+        logger.warning("Failed to deliver failure for job %s: %s", job.id, e)
+
+
+async def _worker_loop(bot: Bot, worker_no: int) -> None:
+    while True:
+        # Пока провайдер нездоров, задачи не берём — они подождут в очереди.
+        pause = gateway.breaker.retry_after()
+        if pause > 0:
+            await asyncio.sleep(min(pause, ANALYSIS_POLL_SECONDS))
+            continue
+
+        try:
+            job = await _claim_next_job()
+        except Exception:
+            logger.exception("Analysis worker %s: cannot claim job", worker_no)
+            job = None
+
+        if not job:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), ANALYSIS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        heartbeat = asyncio.create_task(_heartbeat(job.id))
+        try:
+            await _run_job(bot, job)
+        except asyncio.CancelledError:
+            # Задача вернётся в очередь при следующем старте.
+            raise
+        except Exception as e:
+            # Сбой записи результата ошибки (БД недоступна, «database is
+            # locked») не должен завершать воркер: задача останется running
+            # и вернётся в очередь, когда истечёт аренда.
+            try:
+                if isinstance(e, LLMUnavailableError):
+                    await _defer(job, e.retry_after)
+                else:
+                    await _handle_failure(bot, job, e)
+            except Exception:
+                logger.exception(
+                    "Analysis worker %s: cannot record failure of job %s",
+                    worker_no,
+                    job.id,
+                )
+        finally:
+            heartbeat.cancel()
+            if _is_background(job):
+                _background_slots.release()
+
+
+async def sweep_stale_notes(limit: int = ANALYSIS_SWEEP_BATCH) -> int:
+    """
+    Ставит в очередь с низким приоритетом несколько устаревших разборов.
+    Работает только когда очередь пуста и провайдер здоров, чтобы пересчёт
+    больших историй не мешал пользователям и не создавал всплеск запросов.
+    """
+    if gateway.breaker.retry_after() > 0:
+        return 0
+    # Задачи с истёкшей арендой не в счёт: их никто не выполняет.
+    busy = AnalysisJob.filter(
+        Q(status=JOB_PENDING)
+        | Q(status=JOB_RUNNING, updated_at__gte=_lease_deadline())
+    )
+    if await busy.exists():
+        return 0
+
+    # Свежие заметки смотрят чаще — пересчитываем их первыми.
+    note_ids = await (
+        MeetingNote.filter(is_stale=True, analysis_status=ANALYSIS_DONE)
+        .exclude(id__in=Subquery(AnalysisJob.all().values("note_id")))
+        .order_by("-created_at")
+        .limit(limit)
+        .values_list("id", flat=True)
+    )
+    for note_id in note_ids:
+        await enqueue(
+            note_id,
+            title="AI‑разбор обновлён",
+            priority=PRIORITY_BACKGROUND,
+        )
+    _stats["swept"] += len(note_ids)
+    return len(note_ids)
+
+
+async def _sweep_loop() -> None:
+    while True:
+        await asyncio.sleep(ANALYSIS_SWEEP_SECONDS)
+        try:
+            await sweep_stale_notes()
+        except Exception:
+            logger.exception("Stale analysis sweep failed")
+
+
+def _lease_deadline() -> datetime:
+    return _now() - timedelta(seconds=ANALYSIS_LEASE_SECONDS)
+
+
+async def requeue_expired() -> int:
+    """
+    Возвращает в очередь выполняемые задачи, аренду которых давно не
+    продлевали, — чьи бы они ни были.
+    """
+    recovered = await AnalysisJob.filter(
+        status=JOB_RUNNING,
+        updated_at__lt=_lease_deadline(),
+    ).update(status=JOB_PENDING, claimed_by=None, next_run_at=_now())
+    if recovered:
+        logger.info("Requeued %s analysis jobs with expired lease", recovered)
+        _wakeup.set()
+    return recovered
+
+
+async def _lease_loop() -> None:
+    while True:
+        await asyncio.sleep(ANALYSIS_LEASE_SECONDS / 2)
+        try:
+            await requeue_expired()
+        except Exception:
+            logger.exception("Expired analysis jobs requeue failed")
+
+
+def _running_jobs_of_this_worker():
+    if WORKER_ID is None:
+        return AnalysisJob.filter(claimed_by=WORKER_TAG, status=JOB_RUNNING)
+    # claimed_by IS NULL — задачи, захваченные до появления колонки.
+    return AnalysisJob.filter(
+        Q(claimed_by=WORKER_TAG) | Q(claimed_by__isnull=True),
+        status=JOB_RUNNING,
+    )
+
+
+async def start_workers(bot: Bot, concurrency: int = ANALYSIS_WORKERS) -> None:
+    # Задачи, которые этот воркер выполнял в момент остановки (или падения),
+    # возвращаем в очередь сразу — если тег стабилен (WORKER_ID). Чужие — только с истёкшей арендой: живые
+    # выполняют другие воркеры.
+    recovered = await _running_jobs_of_this_worker().update(status=JOB_PENDING)
+    if recovered:
+        logger.info("Recovered %s interrupted analysis jobs", recovered)
+    await requeue_expired()
+
+    for worker_no in range(concurrency):
+        _workers.append(asyncio.create_task(_worker_loop(bot, worker_no)))
+    _maintenance.append(asyncio.create_task(_lease_loop()))
+    # Фоновый пересчёт достаточно вести одному процессу.
+    if WORKER_ID in (None, "0"):
+        _maintenance.append(asyncio.create_task(_sweep_loop()))
+
+
+async def stop_workers() -> None:
+    tasks = _workers + _maintenance
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _maintenance.clear()
+    if _deliveries:
+        await asyncio.wait(_deliveries, timeout=5)
+    # Прерванные задачи сразу возвращаем в очередь.
+    await _running_jobs_of_this_worker().update(status=JOB_PENDING)
+
+
+async def queue_stats() -> dict:
+    pending = await AnalysisJob.filter(status=JOB_PENDING).count()
+    running = await AnalysisJob.filter(status=JOB_RUNNING).count()
+    failed = await AnalysisJob.filter(status=JOB_FAILED).count()
+    background = await AnalysisJob.filter(
+        status=JOB_PENDING,
+        priority__gte=PRIORITY_BACKGROUND,
+    ).count()
+    stale = await MeetingNote.filter(
+        is_stale=True,
+        analysis_status=ANALYSIS_DONE,
+    ).count()
+    oldest = await (
+        AnalysisJob.filter(status__in=[JOB_PENDING, JOB_RUNNING])
+        .order_by("created_at")
+        .first()
+        .values_list("created_at", flat=True)
+    )
+    return {
+        "pending": pending,
+        "running": running,
+        "failed": failed,
+        "background_pending": background,
+        "stale_notes": stale,
+        "oldest_job_age_s": (
+            round((_now() - oldest).total_seconds(), 1) if oldest else None
+        ),
+        # Живые задачи: упавшая задача воркера не должна выглядеть работающей.
+        "workers": sum(1 for task in _workers if not task.done()),
+        **_stats,
+    }
+
+
+metrics.register("analysis_queue", queue_stats)
@@ -0,0 +1,179 @@
+import asyncio
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, NamedTuple
+
+from database.models import DigestPartial, MeetingNote
+from services import llm, metrics
+from services.mood_rollups import week_start
+
+# AICODE-NOTE: Дайджест — иерархический map-reduce с кэшем: заметки каждой
+# недели (с понедельника, по UTC, как в mood_rollups) сжимаются в выжимку,
+# выжимка хранится строкой digest_partials. Дайджест за N недель суммирует
+# только недели без выжимки и сводит все выжимки одним reduce-запросом —
+# повторный дайджест стоит одного небольшого запроса. services/notes.py
+# удаляет выжимку недели в транзакции создания, правки и удаления заметки;
+# расхождение числа заметок недели с notes_count выжимки — тоже промах.
+
+DIGEST_WEEKS = (4, 8, 12)
+# services.notes.ANALYSIS_DONE (notes импортирует этот модуль).
+_ANALYSIS_DONE = "done"
+DEFAULT_DIGEST_WEEKS = 4
+
+_stats = {
+    "digests": 0,
+    "weeks_cached": 0,
+    "weeks_summarized": 0,
+    "invalidated": 0,
+}
+
+
+class Digest(NamedTuple):
+    result: dict
+    weeks: int
+    notes_count: int
+    # Недель, выжимки которых пришлось собрать заново.
+    summarized: int
+
+
+def _utc_week(moment: datetime) -> date:
+    return week_start(moment.astimezone(timezone.utc).date())
+
+
+def _week_bounds(start: date) -> tuple[datetime, datetime]:
+    begin = datetime.combine(start, time.min, tzinfo=timezone.utc)
+    return begin, begin + timedelta(days=7)
+
+
+async def invalidate(person_id: int, moments: Iterable[datetime]) -> None:
+    """
+    Заметки этих моментов создали, изменили или удалили — выжимки их недель
+    больше не годятся. Вызывается в транзакции записи заметки.
+    """
+    weeks = {_utc_week(moment) for moment in moments}
+    if not weeks:
+        return
+    deleted = await DigestPartial.filter(
+        person_id=person_id, week_start__in=list(weeks)
+    ).delete()
+    _stats["invalidated"] += deleted
+
+
+def source_text(raw_text: str, ai_summary: dict | None, analysis_status: str) -> str:
+    """
+    Текст заметки для недельной выжимки. Длинную заметку с готовым разбором
+    берём его выжимкой — недельный запрос не превращается в map-reduce.
+    Смена этого текста (разбор длинной заметки записан) — повод для
+    invalidate: число заметок недели при этом не меняется.
+    """
+    summary = (ai_summary or {}).get("summary")
+    if summary and analysis_status == _ANALYSIS_DONE and llm.is_long_note(raw_text):
+        return summary
+    return raw_text
+
+
+def _note_text(note: dict) -> str:
+    text = source_text(note["raw_text"], note["ai_summary"], note["analysis_status"])
+    return f"[{note['created_at'].astimezone(timezone.utc):%d.%m %H:%M}]\n{text}"
+
+
+async def _summarize_week(person_id: int, start: date, fingerprint: str) -> dict | None:
+    begin, end = _week_bounds(start)
+    notes = await (
+        MeetingNote.filter(person_id=person_id, created_at__gte=begin, created_at__lt=end)
+        .order_by("created_at")
+        .values("raw_text", "ai_summary", "analysis_status", "created_at")
+    )
+    if not notes:
+        return None
+
+    summary = await llm.summarize_period("\n\n".join(map(_note_text, notes)))
+    # Параллельный дайджест мог собрать ту же неделю — последняя запись побеждает.
+    await DigestPartial.bulk_create(
+        [
+            DigestPartial(
+                person_id=person_id,
+                week_start=start,
+                notes_count=len(notes),
+                fingerprint=fingerprint,
+                summary=summary,
+            )
+        ],
+        on_conflict=["person_id", "week_start"],
+        update_fields=["notes_count", "fingerprint", "summary", "created_at"],
+    )
+    _stats["weeks_summarized"] += 1
+    return {"notes": len(notes), **summary}
+
+
+async def build_digest(
+    person_id: int,
+    weeks: int = DEFAULT_DIGEST_WEEKS,
+    *,
+    today: date | None = None,
+) -> Digest | None:
+    """
+    Дайджест встречи за последние weeks недель (текущая — последняя).
+    None — заметок за период нет. Ошибки LLM — LLMError.
+    """
+    current = week_start(today or datetime.now(timezone.utc).date())
+    first = current - timedelta(weeks=weeks - 1)
+    begin, _ = _week_bounds(first)
+    _, end = _week_bounds(current)
+
+    moments = await MeetingNote.filter(
+        person_id=person_id, created_at__gte=begin, created_at__lt=end
+    ).values_list("created_at", flat=True)
+    counts = Counter(map(_utc_week, moments))
+    if not counts:
+        return None
+
+    fingerprint = llm.digest_fingerprint()
+    cached = {
+        row.week_start: row
+        for row in await DigestPartial.filter(
+            person_id=person_id,
+            week_start__gte=first,
+            week_start__lte=current,
+            fingerprint=fingerprint,
+        )
+    }
+    partials: dict[date, dict] = {}
+    missing = []
+    for start in sorted(counts):
+        row = cached.get(start)
+        if row and row.notes_count == counts[start]:
+            partials[start] = {"notes": row.notes_count, **row.summary}
+        else:
+            missing.append(start)
+
+    # Недели без выжимки — параллельно, лимиты держит шлюз LLM.
+    summaries = await asyncio.gather(
+        *(_summarize_week(person_id, start, fingerprint) for start in missing)
+    )
+    for start, summary in zip(missing, summaries):
+        if summary is not None:
+            partials[start] = summary
+    _stats["weeks_cached"] += len(counts) - len(missing)
+
+    ordered = [
+        {"week": start.isoformat(), **partials[start]} for start in sorted(partials)
+    ]
+    if not ordered:
+        # Заметки периода удалили, пока собирались выжимки.
+        return None
+    result = await llm.reduce_digest(ordered)
+    _stats["digests"] += 1
+    return Digest(
+        result=result,
+        weeks=weeks,
+        notes_count=sum(partial["notes"] for partial in ordered),
+        summarized=len(missing),
+    )
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+metrics.register("digests", stats)
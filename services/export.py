@@ -0,0 +1,244 @@
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import FSInputFile
+from tortoise.expressions import Q
+
+from config import EXPORT_CHUNK_SIZE, EXPORT_MAX_CONCURRENT
+from database.models import MeetingNote
+from services import metrics, people_cache
+
+logger = logging.getLogger(__name__)
+
+# AICODE-NOTE: Экспорт не держит историю в памяти: заметки читаются
+# кусками по EXPORT_CHUNK_SIZE (keyset по индексу person_id, created_at, id),
+# каждый кусок форматируется и сжимается в gzip-файл в потоке
+# (asyncio.to_thread), и только потом читается следующий. Экспорт идёт
+# фоновой задачей: хендлер отвечает сразу, а планировщик апдейтов
+# (middlewares/scheduler.py) не держит очередь пользователя до конца выгрузки.
+
+FORMATS = {
+    "jsonl": "JSON Lines",
+    "csv": "CSV",
+    "md": "Markdown",
+}
+# Лимит Telegram на отправку документа ботом.
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+EXPORT_FIELDS = (
+    "id",
+    "created_at",
+    "raw_text",
+    "ai_summary",
+    "stress_level",
+    "analysis_status",
+)
+CSV_COLUMNS = (
+    "person",
+    "created_at",
+    "mood",
+    "mood_text",
+    "summary",
+    "action_items",
+    "tags",
+    "raw_text",
+    "analysis_status",
+    "id",
+)
+
+_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+# user_id -> задача экспорта: у пользователя одна выгрузка за раз.
+_running: dict[int, asyncio.Task] = {}
+_stats = {"started": 0, "done": 0, "failed": 0, "notes": 0, "bytes": 0}
+
+
+async def iter_notes(
+    user_id: int,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[tuple[str, list[dict]]]:
+    """
+    (название встречи, до chunk_size заметок) — встречи по порядку, заметки
+    внутри встречи от старых к новым.
+    """
+    cached = await people_cache.get(user_id)
+    for person in sorted(cached.people, key=lambda p: p.name.lower()):
+        query = MeetingNote.filter(person_id=person.id)
+        last = None
+        while True:
+            page = query
+            if last is not None:
+                # created_at__gte — диапазон индекса, OR — точная граница.
+                page = page.filter(created_at__gte=last["created_at"]).filter(
+                    Q(created_at__gt=last["created_at"]) | Q(id__gt=last["id"])
+                )
+            rows = await (
+                page.order_by("created_at", "id")
+                .limit(chunk_size)
+                .values(*EXPORT_FIELDS)
+            )
+            if not rows:
+                break
+            yield person.name, rows
+            if len(rows) < chunk_size:
+                break
+            last = rows[-1]
+
+
+class ExportWriter:
+    """
+    Пишет заметки в gzip-файл в выбранном формате. Методы блокирующие —
+    вызываются через asyncio.to_thread.
+    """
+
+    def __init__(self, fmt: str, path: str):
+        self.fmt = fmt
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self._csv = None
+        self._person = None
+        if fmt == "csv":
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(CSV_COLUMNS)
+
+    def write(self, person: str, rows: list[dict]) -> None:
+        if self.fmt == "jsonl":
+            for row in rows:
+                self._file.write(json.dumps(_record(person, row), ensure_ascii=False))
+                self._file.write("\n")
+        elif self.fmt == "csv":
+            for row in rows:
+                record = _record(person, row)
+                record["action_items"] = "\n".join(record["action_items"])
+                record["tags"] = " ".join(record["tags"])
+                self._csv.writerow(record[column] for column in CSV_COLUMNS)
+        else:
+            self._write_markdown(person, rows)
+
+    def _write_markdown(self, person: str, rows: list[dict]) -> None:
+        if person != self._person:
+            self._person = person
+            self._file.write(f"# {person}\n\n")
+        for row in rows:
+            record = _record(person, row)
+            mood = record["mood"] if record["mood"] is not None else "-"
+            self._file.write(f"## {record['created_at'][:16].replace('T', ' ')} · {mood}/10\n\n")
+            self._file.write(f"{record['raw_text']}\n\n")
+            if record["summary"]:
+                self._file.write(f"**Summary:** {record['summary']}\n\n")
+            for item in record["action_items"]:
+                self._file.write(f"- [ ] {item}\n")
+            if record["action_items"]:
+                self._file.write("\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _record(person: str, row: dict) -> dict:
+    analysis = row["ai_summary"] or {}
+    return {
+        "id": str(row["id"]),
+        "person": person,
+        "created_at": row["created_at"].isoformat(),
+        "mood": row["stress_level"],
+        "mood_text": analysis.get("mood_text"),
+        "summary": analysis.get("summary"),
+        "action_items": [str(item) for item in analysis.get("action_items") or []],
+        "tags": [str(tag) for tag in analysis.get("tags") or []],
+        "raw_text": row["raw_text"],
+        "analysis_status": row["analysis_status"],
+    }
+
+
+async def write_export(user_id: int, fmt: str, path: str) -> int:
+    """
+    Пишет все заметки пользователя в path. Возвращает число заметок.
+    """
+    writer = await asyncio.to_thread(ExportWriter, fmt, path)
+    count = 0
+    try:
+        async for person, rows in iter_notes(user_id):
+            await asyncio.to_thread(writer.write, person, rows)
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return count
+
+
+async def _run(bot: Bot, chat_id: int, user_id: int, fmt: str) -> None:
+    handle, path = tempfile.mkstemp(prefix="export-", suffix=f".{fmt}.gz")
+    os.close(handle)
+    try:
+        async with _slots:
+            count = await write_export(user_id, fmt, path)
+        size = os.path.getsize(path)
+        _stats["notes"] += count
+        _stats["bytes"] += size
+
+        if not count:
+            await bot.send_message(chat_id, "📭 Заметок пока нет — экспортировать нечего.")
+        elif size > MAX_DOCUMENT_BYTES:
+            await bot.send_message(
+                chat_id,
+                "⚠️ Архив больше 50 МБ — Telegram не даст его отправить. "
+                "Попробуйте формат CSV или JSONL.",
+            )
+        else:
+            stamp = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            await bot.send_document(
+                chat_id,
+                FSInputFile(path, filename=f"notes-{stamp}.{fmt}.gz"),
+                caption=f"📦 Экспорт: {count} заметок ({FORMATS[fmt]}, gzip)",
+            )
+        _stats["done"] += 1
+    except Exception:
+        _stats["failed"] += 1
+        logger.exception("Export for user %s failed", user_id)
+        try:
+            await bot.send_message(chat_id, "❌ Не удалось подготовить экспорт, попробуйте позже.")
+        except TelegramAPIError:
+            pass
+    finally:
+        os.unlink(path)
+
+
+def start_export(bot: Bot, chat_id: int, user_id: int, fmt: str) -> bool:
+    """
+    Запускает экспорт в фоне. False — у пользователя уже идёт экспорт.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    running = _running.get(user_id)
+    if running is not None and not running.done():
+        return False
+
+    _stats["started"] += 1
+    task = asyncio.create_task(_run(bot, chat_id, user_id, fmt))
+    _running[user_id] = task
+    task.add_done_callback(lambda _: _running.pop(user_id, None))
+    return True
+
+
+async def stop() -> None:
+    """
+    Прерывает незавершённые экспорты (при остановке бота, до close_db).
+    """
+    tasks = list(_running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def stats() -> dict:
+    return {**_stats, "running": len(_running)}
+
+
+metrics.register("export", stats)
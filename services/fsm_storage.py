@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Mapping, NamedTuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+from tortoise.transactions import in_transaction
+
+from config import (
+    FSM_CACHE_SIZE,
+    FSM_FLUSH_INTERVAL_SECONDS,
+    FSM_STATE_TTL_SECONDS,
+    FSM_STORAGE,
+    FSM_WRITE_BUFFER_SIZE,
+    REDIS_URL,
+)
+from database.models import FsmRecord
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять из таблицы истёкшие состояния.
+PURGE_INTERVAL_SECONDS = 600
+
+
+class CachedState(NamedTuple):
+    state: str | None
+    data: dict[str, Any]
+    # time.time(), после которого состояние считается брошенным.
+    expires_at: float
+
+
+_EMPTY = CachedState(None, {}, math.inf)
+
+
+def _to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+class TortoiseStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states (общее подключение Tortoise).
+
+    AICODE-NOTE: Чтение — через LRU в памяти процесса (в т.ч. «состояния
+    нет»: aiogram читает состояние на каждом апдейте). Запись — write-behind:
+    изменение сразу видно в этом процессе, а в БД уходит пачкой раз в
+    FSM_FLUSH_INTERVAL_SECONDS (или раньше, если буфер заполнен). Поэтому
+    несколько процессов с этим хранилищем должны получать апдейты одного
+    пользователя в один и тот же процесс; иначе — FSM_STORAGE=redis.
+    """
+
+    def __init__(
+        self,
+        *,
+        state_ttl: float = FSM_STATE_TTL_SECONDS,
+        flush_interval: float = FSM_FLUSH_INTERVAL_SECONDS,
+        buffer_size: int = FSM_WRITE_BUFFER_SIZE,
+        cache_size: int = FSM_CACHE_SIZE,
+    ):
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._state_ttl = state_ttl
+        self._flush_interval = flush_interval
+        self._buffer_size = buffer_size
+        self._cache_size = cache_size
+
+        self._entries: OrderedDict[str, CachedState] = OrderedDict()
+        # Ключи, изменения которых ещё не записаны в БД.
+        self._dirty: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._next_purge = 0.0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "flush_errors": 0,
+            "purged": 0,
+        }
+        metrics.register("fsm_storage", self.stats)
+
+    def _remember(self, key: str, entry: CachedState) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) <= self._cache_size:
+            return
+        # Вытесняем самые старые записанные в БД; несохранённые не трогаем.
+        for old_key in list(self._entries):
+            if len(self._entries) <= self._cache_size:
+                break
+            if old_key not in self._dirty:
+                del self._entries[old_key]
+
+    async def _load(self, key: str) -> CachedState:
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return _EMPTY if cached.expires_at <= time.time() else cached
+
+        self._stats["misses"] += 1
+        row = await (
+            FsmRecord.filter(key=key, expires_at__gt=_to_datetime(time.time()))
+            .first()
+            .values("state", "data", "expires_at")
+        )
+        entry = (
+            CachedState(row["state"], row["data"] or {}, row["expires_at"].timestamp())
+            if row
+            else _EMPTY
+        )
+        # Пока шёл запрос, ключ могли изменить — новое значение важнее.
+        if key not in self._entries:
+            self._remember(key, entry)
+        return self._entries.get(key, entry)
+
+    async def _write(self, key: str, state: str | None, data: dict[str, Any]) -> None:
+        self._remember(key, CachedState(state, data, time.time() + self._state_ttl))
+        self._dirty.add(key)
+        self._ensure_flusher()
+        if self._flush_interval <= 0 or len(self._dirty) >= self._buffer_size:
+            await self.flush()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval or PURGE_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+                if time.monotonic() >= self._next_purge:
+                    self._next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+                    await self.purge_expired()
+            except Exception:
+                logger.exception("FSM storage maintenance failed")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys = list(self._dirty)
+            self._dirty.clear()
+
+            upserts: list[FsmRecord] = []
+            deletes: list[str] = []
+            for key in keys:
+                entry = self._entries[key]
+                if entry.state is None and not entry.data:
+                    # Диалог завершён (state.clear()) — строка не нужна.
+                    deletes.append(key)
+                    continue
+                upserts.append(
+                    FsmRecord(
+                        key=key,
+                        state=entry.state,
+                        data=entry.data,
+                        expires_at=_to_datetime(entry.expires_at),
+                    )
+                )
+
+            try:
+                async with in_transaction():
+                    if deletes:
+                        await FsmRecord.filter(key__in=deletes).delete()
+                    if upserts:
+                        await FsmRecord.bulk_create(
+                            upserts,
+                            on_conflict=["key"],
+                            update_fields=["state", "data", "expires_at"],
+                        )
+            except Exception:
+                # Запишем при следующем сбросе — в буфере уже актуальные значения.
+                self._dirty.update(keys)
+                self._stats["flush_errors"] += 1
+                raise
+
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(keys)
+
+    async def purge_expired(self) -> int:
+        deleted = await FsmRecord.filter(
+            expires_at__lte=_to_datetime(time.time())
+        ).delete()
+        self._stats["purged"] += deleted
+        return deleted
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key_builder.build(key)
+        current = await self._load(storage_key)
+        await self._write(
+            storage_key,
+            state.state if isinstance(state, State) else state,
+            current.data,
+        )
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._load(self._key_builder.build(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self._key_builder.build(key)
+        current = await self._load(storage_key)
+        await self._write(storage_key, current.state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._load(self._key_builder.build(key))).data)
+
+    async def close(self) -> None:
+        """
+        Останавливает фоновый сброс и дописывает буфер. Вызывать до close_db.
+        """
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("FSM storage final flush failed")
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "cached": len(self._entries),
+            "dirty": len(self._dirty),
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+        }
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Хранилище FSM по FSM_STORAGE: db (по умолчанию), redis или memory.
+    """
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+
+    if FSM_STORAGE == "redis":
+        if not REDIS_URL:
+            raise ValueError("FSM_STORAGE=redis requires REDIS_URL")
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise ValueError(
+                "FSM_STORAGE=redis requires the redis package (pip install redis)"
+            ) from e
+        # Подходит любой сервер с протоколом Redis (Valkey, KeyDB, Dragonfly).
+        return RedisStorage.from_url(
+            REDIS_URL,
+            state_ttl=FSM_STATE_TTL_SECONDS,
+            data_ttl=FSM_STATE_TTL_SECONDS,
+        )
+
+    if FSM_STORAGE != "db":
+        raise ValueError(f"Unknown FSM_STORAGE: {FSM_STORAGE}")
+    return TortoiseStorage()
@@ -0,0 +1,370 @@
+import asyncio
+import csv
+import gzip
+import html
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterator, NamedTuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from tortoise.transactions import in_transaction
+
+from config import IMPORT_BATCH_SIZE, IMPORT_MAX_CONCURRENT, IMPORT_PROGRESS_SECONDS
+from database.models import MeetingNote, Person
+from services import analysis_queue, metrics, people_cache
+from services.export import FORMATS
+from services.notes import ANALYSIS_PENDING, create_notes
+from utils.message_editor import ThrottledEditor
+
+logger = logging.getLogger(__name__)
+
+# AICODE-NOTE: Импорт — зеркало экспорта (services/export.py): те же форматы,
+# файл можно сжать gzip. Файл читается построчно в потоке (asyncio.to_thread)
+# пачками по IMPORT_BATCH_SIZE; каждая пачка — одна транзакция: недостающие
+# встречи, один INSERT заметок (services/notes.create_notes) и один INSERT
+# задач анализа. Анализ идёт через общую очередь с фоновым приоритетом —
+# воркеров для него не больше ANALYSIS_BACKGROUND_WORKERS, запросы к OpenAI
+# проходят через лимиты llm_gateway. Прогресс — правками одного сообщения.
+
+# Telegram отдаёт ботам файлы до 20 МБ (getFile).
+MAX_FILE_BYTES = 20 * 1024 * 1024
+PERSON_NAME_MAX_LENGTH = 255
+
+# Строка, с которой в Markdown экспорта начинается разбор (не часть текста).
+MD_SUMMARY_PREFIX = "**Summary:**"
+
+_MD_HEADING = re.compile(r"(#{1,2}) (.*)")
+
+# Ошибки чтения файла: битый gzip, не UTF-8, сломанный CSV.
+FILE_ERRORS = (OSError, EOFError, UnicodeDecodeError, csv.Error)
+
+_slots = asyncio.Semaphore(IMPORT_MAX_CONCURRENT)
+# user_id -> задача, которая сейчас читает файл: у пользователя один импорт
+# за раз. Слежение за анализом после импорта новый импорт не блокирует.
+_running: dict[int, asyncio.Task] = {}
+_tasks: set[asyncio.Task] = set()
+_stats = {"started": 0, "done": 0, "failed": 0, "notes": 0, "skipped": 0}
+
+
+class ImportEntry(NamedTuple):
+    person: str
+    raw_text: str
+    created_at: datetime | None
+
+
+def detect_format(filename: str | None) -> str | None:
+    """
+    Формат по имени файла: notes.jsonl, notes.csv.gz, notes.md… None — не знаем.
+    """
+    name = (filename or "").lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    fmt = name.rsplit(".", 1)[-1] if "." in name else ""
+    if fmt == "markdown":
+        fmt = "md"
+    return fmt if fmt in FORMATS else None
+
+
+def _parse_created_at(value) -> datetime | None:
+    if not value:
+        return None
+    try:
+        created_at = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at
+
+
+def _entry(person, raw_text, created_at) -> ImportEntry | None:
+    """
+    None — запись без встречи или текста, пропускается.
+    """
+    person = str(person or "").strip()[:PERSON_NAME_MAX_LENGTH]
+    raw_text = str(raw_text or "").strip()
+    if not person or not raw_text:
+        return None
+    return ImportEntry(person, raw_text, _parse_created_at(created_at))
+
+
+def _open(path: str):
+    with open(path, "rb") as file:
+        compressed = file.read(2) == b"\x1f\x8b"
+    # utf-8-sig — CSV из Excel начинается с BOM.
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def _parse_jsonl(file) -> Iterator[ImportEntry | None]:
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        if not isinstance(record, dict):
+            yield None
+            continue
+        yield _entry(record.get("person"), record.get("raw_text"), record.get("created_at"))
+
+
+def _parse_csv(file) -> Iterator[ImportEntry | None]:
+    for record in csv.DictReader(file):
+        yield _entry(record.get("person"), record.get("raw_text"), record.get("created_at"))
+
+
+def _parse_markdown(file) -> Iterator[ImportEntry | None]:
+    """
+    «# Встреча», под ней заметки «## 2024-03-01 10:00 · …» с текстом до
+    следующего заголовка. Разбор, если он есть (как в экспорте), пропускается.
+    """
+    person = None
+    created_at = None
+    body: list[str] | None = None
+    collecting = False
+    for line in file:
+        line = line.rstrip("\r\n")
+        heading = _MD_HEADING.match(line)
+        if heading:
+            if body is not None:
+                yield _entry(person, "\n".join(body), created_at)
+            if heading.group(1) == "#":
+                person, body = heading.group(2), None
+            else:
+                created_at = heading.group(2).split("·", 1)[0]
+                body, collecting = [], True
+            continue
+        if body is None:
+            continue
+        if line.startswith(MD_SUMMARY_PREFIX):
+            collecting = False
+        if collecting:
+            body.append(line)
+    if body is not None:
+        yield _entry(person, "\n".join(body), created_at)
+
+
+_PARSERS = {
+    "jsonl": _parse_jsonl,
+    "csv": _parse_csv,
+    "md": _parse_markdown,
+}
+
+
+def read_entries(path: str, fmt: str) -> Iterator[ImportEntry | None]:
+    """
+    Записи файла по одной; None — запись, которую нельзя импортировать.
+    Генератор блокирующий — пачки читаются через asyncio.to_thread.
+    """
+    with _open(path) as file:
+        yield from _PARSERS[fmt](file)
+
+
+def _next_batch(entries: Iterator, size: int) -> list:
+    return list(islice(entries, size))
+
+
+async def _ensure_people(user_id: int, names: set[str], known: dict[str, int]) -> int:
+    """
+    Создаёт недостающие встречи (имя уникально у пользователя) и дописывает
+    их id в known. Возвращает число новых встреч.
+    """
+    missing = names - known.keys()
+    if not missing:
+        return 0
+    await Person.bulk_create(
+        [Person(user_id=user_id, name=name) for name in missing],
+        ignore_conflicts=True,
+    )
+    known.update(
+        await Person.filter(user_id=user_id, name__in=list(missing)).values_list(
+            "name", "id"
+        )
+    )
+    people_cache.invalidate(user_id)
+    return len(missing)
+
+
+async def import_file(user_id: int, path: str, fmt: str, counts: dict, on_batch=None) -> None:
+    """
+    Импортирует файл пачками. counts (imported, skipped, people) обновляется
+    после каждой пачки — при ошибке в нём то, что уже сохранено.
+    """
+    known = {person.name: person.id for person in (await people_cache.get(user_id)).people}
+    entries = read_entries(path, fmt)
+    try:
+        while True:
+            batch = await asyncio.to_thread(_next_batch, entries, IMPORT_BATCH_SIZE)
+            if not batch:
+                return
+            valid = [entry for entry in batch if entry is not None]
+            counts["skipped"] += len(batch) - len(valid)
+            if valid:
+                counts["people"] += await _ensure_people(
+                    user_id, {entry.person for entry in valid}, known
+                )
+                notes = [
+                    MeetingNote(
+                        person_id=known[entry.person],
+                        raw_text=entry.raw_text,
+                        created_at=entry.created_at,
+                    )
+                    for entry in valid
+                ]
+                async with in_transaction():
+                    await create_notes(notes)
+                    await analysis_queue.enqueue_many([note.id for note in notes])
+                counts["imported"] += len(notes)
+            if on_batch:
+                await on_batch()
+    finally:
+        await asyncio.to_thread(entries.close)
+
+
+def _summary(counts: dict) -> str:
+    return (
+        f"заметок: {counts['imported']}, новых встреч: {counts['people']}, "
+        f"пропущено записей: {counts['skipped']}"
+    )
+
+
+async def _track_analysis(user_id: int, editor: ThrottledEditor, header: str) -> None:
+    """
+    Правит сообщение, пока у пользователя есть заметки в очереди анализа.
+    """
+    while True:
+        pending = await MeetingNote.filter(
+            person__user_id=user_id,
+            analysis_status=ANALYSIS_PENDING,
+        ).count()
+        if not pending:
+            await editor.update(f"{header}\n🧠 AI-разбор завершён.", force=True)
+            return
+        if not await editor.update(f"{header}\n🧠 AI-разбор в фоне: осталось {pending}."):
+            return
+        await asyncio.sleep(IMPORT_PROGRESS_SECONDS)
+
+
+async def _run(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    user_id: int,
+    file_id: str,
+    fmt: str,
+) -> None:
+    editor = ThrottledEditor(bot, chat_id, message_id, min_interval=IMPORT_PROGRESS_SECONDS)
+    counts = {"imported": 0, "skipped": 0, "people": 0}
+
+    async def on_batch():
+        # Сбой правки прогресса не должен прерывать импорт.
+        try:
+            await editor.update(f"📥 Импорт ({FORMATS[fmt]}): {_summary(counts)}…")
+        except TelegramAPIError as e:
+            logger.info("Import progress for user %s not updated: %s", user_id, e)
+
+    handle, path = tempfile.mkstemp(prefix="import-", suffix=f".{fmt}")
+    os.close(handle)
+    try:
+        async with _slots:
+            await bot.download(file_id, destination=path)
+            await import_file(user_id, path, fmt, counts, on_batch)
+    except FILE_ERRORS as e:
+        _stats["failed"] += 1
+        logger.info("Import for user %s stopped: %s", user_id, e)
+        await editor.update(
+            f"❌ Файл не удалось дочитать: {html.escape(str(e))}\n"
+            f"Сохранено до ошибки — {_summary(counts)}.",
+            force=True,
+        )
+        return
+    except Exception:
+        _stats["failed"] += 1
+        logger.exception("Import for user %s failed", user_id)
+        await editor.update(
+            "❌ Импорт прервался, попробуйте позже.\n"
+            f"Сохранено до ошибки — {_summary(counts)}.",
+            force=True,
+        )
+        return
+    finally:
+        os.unlink(path)
+        _stats["notes"] += counts["imported"]
+        _stats["skipped"] += counts["skipped"]
+        _forget(user_id, asyncio.current_task())
+
+    _stats["done"] += 1
+    header = f"✅ Импорт завершён — {_summary(counts)}."
+    if not counts["imported"]:
+        await editor.update(header, force=True)
+        return
+    await _track_analysis(user_id, editor, header)
+
+
+def _forget(user_id: int, task: asyncio.Task) -> None:
+    if _running.get(user_id) is task:
+        del _running[user_id]
+
+
+async def _run_safely(*args) -> None:
+    try:
+        await _run(*args)
+    except TelegramAPIError as e:
+        logger.warning("Import progress message failed: %s", e)
+
+
+def start_import(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    user_id: int,
+    file_id: str,
+    fmt: str,
+) -> bool:
+    """
+    Запускает импорт в фоне, прогресс — правками сообщения message_id.
+    False — у пользователя уже идёт импорт.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+    if user_id in _running:
+        return False
+
+    _stats["started"] += 1
+    task = asyncio.create_task(
+        _run_safely(bot, chat_id, message_id, user_id, file_id, fmt)
+    )
+    _running[user_id] = task
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    task.add_done_callback(lambda done: _forget(user_id, done))
+    return True
+
+
+async def stop() -> None:
+    """
+    Прерывает импорты и слежение за анализом (при остановке бота, до
+    close_db). Сохранённые пачки остаются, их анализ — в очереди.
+    """
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def stats() -> dict:
+    return {**_stats, "running": len(_running), "tracking": len(_tasks) - len(_running)}
+
+
+metrics.register("import", stats)
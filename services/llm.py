@@ -1,8 +1,33 @@
+import asyncio
+import hashlib
 import json
+import logging
+import re
+from typing import AsyncIterator
+
 from openai import AsyncOpenAI
-from config import OPENAI_API_KEY
+from config import (
+    LLM_CHUNK_THRESHOLD_TOKENS,
+    LLM_CHUNK_TOKENS,
+    LLM_EXPECTED_COMPLETION_TOKENS,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_MODEL,
+)
+from services import analysis_cache
+from services.llm_gateway import LLMError, LLMUnavailableError, gateway
+from utils.partial_json import parse_partial_json
+from utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# AICODE-NOTE: Повторы делает services/llm_gateway.py (с учётом лимитов и
+# circuit breaker), поэтому встроенные ретраи SDK отключены.
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    max_retries=0,
+)
 
 DEFAULT_SYSTEM_PROMPT = """
 Ты — эмпатичный ассистент менеджера.
@@ -29,40 +54,373 @@ DEFAULT_SYSTEM_PROMPT = """
 Отвечай ТОЛЬКО валидным JSON.
 """
 
+REDUCE_SYSTEM_PROMPT = """
+Ты — ассистент менеджера. Длинная заметка со встречи разбита на фрагменты,
+каждый фрагмент уже разобран. Объедини разборы фрагментов в один итог
+для всей заметки.
 
-async def analyze_note(text: str, custom_prompt: str = None) -> dict:
-    """
-    Анализирует текст заметки с помощью LLM.
-    """
+ВХОДНЫЕ ДАННЫЕ: JSON-массив разборов фрагментов по порядку.
+
+ВЫХОДНЫЕ ДАННЫЕ (JSON):
+{
+    "mood": int (Итоговая оценка настроения от 1 до 10),
+    "mood_text": "string" (Краткое описание настроения),
+    "summary": "string" (Выжимка всей встречи, 2-3 предложения),
+    "positive": "string" (Что порадовало. Если нет - null),
+    "negative": "string" (Что расстроило/Источник стресса. Если нет - null)
+}
+
+Отвечай ТОЛЬКО валидным JSON.
+"""
+
+PERIOD_DIGEST_PROMPT = """
+Ты — ассистент менеджера. Перед тобой все заметки со встреч (1-1) с одним
+человеком за одну неделю, по порядку. Сожми их в короткую выжимку недели —
+из таких выжимок потом собирается дайджест за несколько недель.
+
+ВХОДНЫЕ ДАННЫЕ: заметки недели, у каждой дата.
+
+ВЫХОДНЫЕ ДАННЫЕ (JSON):
+{
+    "summary": "string" (Что происходило за неделю, 1-3 предложения),
+    "mood": int (Настроение за неделю от 1 до 10. Если не понять - null),
+    "themes": ["string"] (Главные темы недели, до 5 коротких фраз),
+    "action_items": ["string"] (Задачи и договорённости недели.
+                                Если нет - пустой список)
+}
+
+Отвечай ТОЛЬКО валидным JSON.
+"""
+
+DIGEST_REDUCE_PROMPT = """
+Ты — ассистент менеджера, который готовится к встрече 1-1. Перед тобой
+выжимки заметок по неделям за последний период. Собери из них дайджест
+периода для подготовки к встрече.
+
+ВХОДНЫЕ ДАННЫЕ: JSON-массив выжимок недель от старых к новым
+(week — понедельник недели, notes — число заметок).
+
+ВЫХОДНЫЕ ДАННЫЕ (JSON):
+{
+    "summary": "string" (Главное за период, 2-4 предложения),
+    "mood_trend": "string" (Как менялось настроение. Если не понять - null),
+    "themes": ["string"] (Повторяющиеся темы, до 7 коротких фраз),
+    "action_items": ["string"] (Договорённости и задачи, которые стоит
+                                проверить на встрече),
+    "talking_points": ["string"] (О чём поговорить на ближайшей 1-1,
+                                  до 5 пунктов)
+}
+
+Отвечай ТОЛЬКО валидным JSON.
+"""
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def build_system_prompt(custom_prompt: str = None) -> str:
     if custom_prompt:
         # AICODE-NOTE: Кастомный промпт НЕ заменяет дефолтный, а дополняет его,
         # чтобы сохранялась структура ответа и требования к валидному JSON.
-        system_prompt = (
+        return (
             DEFAULT_SYSTEM_PROMPT.rstrip()
             + "\n\nДОПОЛНИТЕЛЬНЫЕ ИНСТРУКЦИИ (кастомно для человека):\n"
             + custom_prompt.strip()
         )
-    else:
-        system_prompt = DEFAULT_SYSTEM_PROMPT
+    return DEFAULT_SYSTEM_PROMPT
+
+
+def prompt_fingerprint(custom_prompt: str = None) -> str:
+    """
+    Короткий отпечаток полного системного промпта и модели: если он у заметки
+    не совпадает с текущим, её разбор сделан по старому промпту.
+    """
+    payload = f"{OPENAI_MODEL}\n{build_system_prompt(custom_prompt)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _estimate_request_tokens(system_prompt: str, text: str) -> int:
+    return (
+        estimate_tokens(system_prompt)
+        + estimate_tokens(text)
+        + LLM_EXPECTED_COMPLETION_TOKENS
+    )
 
+
+def _parse_result(content: str) -> dict:
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
+        result = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise LLMError(f"Invalid JSON from LLM: {e}") from e
+    if not isinstance(result, dict):
+        raise LLMError("LLM returned JSON that is not an object")
+    return result
+
+
+async def _complete_json(system_prompt: str, user_content: str) -> dict:
+    estimated_tokens = _estimate_request_tokens(system_prompt, user_content)
+    response = await gateway.call(
+        lambda: client.chat.completions.create(
+            model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
+                {"role": "user", "content": user_content}
             ],
             response_format={"type": "json_object"}
+        ),
+        estimated_tokens=estimated_tokens,
+    )
+    usage = getattr(response, "usage", None)
+    gateway.record_usage(
+        estimated_tokens,
+        usage.total_tokens if usage else None,
+    )
+    return _parse_result(response.choices[0].message.content)
+
+
+def _split_oversized(piece: str, max_tokens: int) -> list[str]:
+    """
+    Режет слишком длинный абзац: по строкам, затем по предложениям,
+    в крайнем случае — по словам.
+    """
+    for splitter in (lambda t: t.split("\n"), _SENTENCE_RE.split, str.split):
+        parts = [p for p in splitter(piece) if p.strip()]
+        if len(parts) > 1:
+            return _pack(parts, max_tokens, joiner="\n" if "\n" in piece else " ")
+    return [piece]
+
+
+def _pack(parts: list[str], max_tokens: int, joiner: str) -> list[str]:
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for part in parts:
+        part_tokens = estimate_tokens(part)
+        if part_tokens > max_tokens:
+            if current:
+                chunks.append(joiner.join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_oversized(part, max_tokens))
+            continue
+        if current and current_tokens + part_tokens > max_tokens:
+            chunks.append(joiner.join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += part_tokens
+    if current:
+        chunks.append(joiner.join(current))
+    return chunks
+
+
+def split_into_chunks(text: str, max_tokens: int = LLM_CHUNK_TOKENS) -> list[str]:
+    """
+    Делит текст на фрагменты не длиннее max_tokens по границам абзацев.
+    """
+    paragraphs = [p.strip() for p in _PARAGRAPH_RE.split(text) if p.strip()]
+    return _pack(paragraphs, max_tokens, joiner="\n\n")
+
+
+def _dedupe(items: list) -> list:
+    seen = set()
+    result = []
+    for item in items:
+        key = " ".join(str(item).lower().split())
+        if item and key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
+
+
+def _merge_locally(partials: list[dict], weights: list[int]) -> dict:
+    """
+    Reduce без LLM: взвешенное среднее настроения и склейка текстов.
+    Запасной путь, если reduce-запрос не удался.
+    """
+    moods = [
+        (p["mood"], w)
+        for p, w in zip(partials, weights)
+        if isinstance(p.get("mood"), (int, float))
+    ]
+    mood = (
+        round(sum(m * w for m, w in moods) / sum(w for _, w in moods))
+        if moods
+        else None
+    )
+    joined = {
+        field: " ".join(p[field] for p in partials if p.get(field)) or None
+        for field in ("summary", "positive", "negative")
+    }
+    return {
+        "mood": mood,
+        "mood_text": next(
+            (p["mood_text"] for p in reversed(partials) if p.get("mood_text")),
+            None,
+        ),
+        **joined,
+    }
+
+
+async def _analyze_chunked(text: str, system_prompt: str) -> dict:
+    """
+    Map-reduce для длинных заметок: фрагменты анализируются параллельно
+    (параллельность ограничивает шлюз), затем дешёвый reduce сводит
+    mood/summary, а action_items и tags объединяются локально.
+    """
+    chunks = split_into_chunks(text)
+    partials = await asyncio.gather(*(
+        _complete_json(
+            system_prompt,
+            f"Фрагмент {i}/{len(chunks)} длинной заметки:\n\n{chunk}",
         )
+        for i, chunk in enumerate(chunks, start=1)
+    ))
 
-        content = response.choices[0].message.content
-        return json.loads(content)
-    except Exception as e:
-        print(f"Error in analyze_note: {e}")
-        # Возвращаем заглушку в случае ошибки
-        return {
-            "mood": None,
-            "summary": "Не удалось проанализировать заметку.",
-            "action_items": [],
-            "error": str(e)
+    compact = [
+        {
+            key: partial.get(key)
+            for key in ("mood", "mood_text", "summary", "positive", "negative")
         }
+        for partial in partials
+    ]
+    try:
+        merged = await _complete_json(
+            REDUCE_SYSTEM_PROMPT,
+            json.dumps(compact, ensure_ascii=False),
+        )
+    except LLMUnavailableError:
+        raise
+    except LLMError as e:
+        logger.warning("Reduce step failed, merging locally: %s", e)
+        merged = _merge_locally(
+            compact,
+            [estimate_tokens(chunk) for chunk in chunks],
+        )
+
+    merged["action_items"] = _dedupe(
+        [item for partial in partials for item in partial.get("action_items") or []]
+    )
+    merged["tags"] = _dedupe(
+        [tag for partial in partials for tag in partial.get("tags") or []]
+    )
+    return merged
+
+
+def is_long_note(text: str) -> bool:
+    return estimate_tokens(text) > LLM_CHUNK_THRESHOLD_TOKENS
+
+
+async def analyze_note(
+    text: str,
+    custom_prompt: str = None,
+    *,
+    force: bool = False,
+) -> dict:
+    """
+    Анализирует текст заметки с помощью LLM.
+    Результат кэшируется по (текст, промпт, модель); force=True
+    игнорирует кэш и пересчитывает анализ заново.
+    Длинные заметки (> LLM_CHUNK_THRESHOLD_TOKENS) идут через map-reduce.
+    Ошибки не маскируются заглушкой: бросается LLMError
+    (LLMUnavailableError — если провайдер сейчас недоступен).
+    """
+    system_prompt = build_system_prompt(custom_prompt)
+    cache_key = analysis_cache.make_key(text, system_prompt, OPENAI_MODEL)
+
+    if not force:
+        cached = await analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    if is_long_note(text):
+        result = await _analyze_chunked(text, system_prompt)
+    else:
+        result = await _complete_json(system_prompt, text)
+
+    await analysis_cache.put(cache_key, OPENAI_MODEL, result)
+    return result
+
+
+async def analyze_note_stream(
+    text: str,
+    custom_prompt: str = None,
+    *,
+    force: bool = False,
+) -> AsyncIterator[dict]:
+    """
+    Потоковый вариант analyze_note: отдаёт частично разобранный JSON по мере
+    генерации (summary приходит раньше action_items). Последний элемент —
+    полный результат. Ошибки — как у analyze_note.
+    """
+    if is_long_note(text):
+        # Длинные заметки идут через map-reduce — отдаём сразу итог.
+        yield await analyze_note(text, custom_prompt, force=force)
+        return
+
+    system_prompt = build_system_prompt(custom_prompt)
+    cache_key = analysis_cache.make_key(text, system_prompt, OPENAI_MODEL)
+
+    if not force:
+        cached = await analysis_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    estimated_tokens = _estimate_request_tokens(system_prompt, text)
+    content = ""
+    used_tokens = None
+    async for attempt in gateway.attempts(estimated_tokens):
+        async with attempt:
+            content = ""
+            stream = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": text}
+                ],
+                response_format={"type": "json_object"},
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    used_tokens = usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                content += delta
+                yield parse_partial_json(content)
+
+    gateway.record_usage(estimated_tokens, used_tokens)
+    result = _parse_result(content)
+    await analysis_cache.put(cache_key, OPENAI_MODEL, result)
+    yield result
+
+
+def digest_fingerprint() -> str:
+    """
+    Отпечаток промпта недельной выжимки и модели: выжимки, собранные
+    с другим, в дайджест не берутся.
+    """
+    payload = f"{OPENAI_MODEL}\n{PERIOD_DIGEST_PROMPT}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+async def summarize_period(notes_text: str) -> dict:
+    """
+    Выжимка заметок одной недели (map-шаг дайджеста). Ошибки — LLMError.
+    """
+    return await _complete_json(PERIOD_DIGEST_PROMPT, notes_text)
+
+
+async def reduce_digest(partials: list[dict]) -> dict:
+    """
+    Дайджест периода из недельных выжимок — один небольшой запрос:
+    старые недели не перечитываются.
+    """
+    return await _complete_json(
+        DIGEST_REDUCE_PROMPT,
+        json.dumps(partials, ensure_ascii=False),
+    )
@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+import openai
+
+from config import (
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_RETRY_BASE_SECONDS,
+    LLM_RETRY_MAX_SECONDS,
+    LLM_TOKENS_PER_MINUTE,
+)
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Запрос к LLM не удался (после всех повторов или без права на повтор).
+    """
+
+
+class LLMUnavailableError(LLMError):
+    """
+    Провайдер признан нездоровым (circuit breaker открыт) — работу нужно
+    отложить минимум на retry_after секунд.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM provider unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket: rate_per_minute единиц в минуту, запас до capacity.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(
+            self.capacity,
+            self._level + (now - self._updated) * self.rate,
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return
+                self.waits += 1
+                await asyncio.sleep((amount - self._level) / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """
+        Доплата/возврат после ответа, когда известен реальный расход.
+        Уровень может уйти в минус — следующие запросы подождут.
+        """
+        self._refill()
+        self._level = min(self.capacity, self._level - amount)
+
+    def state(self) -> dict:
+        self._refill()
+        return {
+            "available": round(self._level, 1),
+            "capacity": self.capacity,
+            "waits": self.waits,
+        }
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def check(self) -> bool:
+        """
+        Бросает LLMUnavailableError, если запрос сейчас пускать нельзя.
+        В half_open пропускается один пробный запрос — для него True.
+        """
+        state = self.state
+        if state == self.OPEN:
+            raise LLMUnavailableError(self.retry_after())
+        if state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise LLMUnavailableError(1.0)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.trips += 1
+                logger.warning("LLM circuit breaker opened")
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_after_s": round(self.retry_after(), 1),
+            "trips": self.trips,
+        }
+
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def _retry_after_header(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class _Attempt:
+    def __init__(self, retrying: "_Retrying"):
+        self._retrying = retrying
+
+    async def __aenter__(self):
+        await self._retrying.gateway._enter(self._retrying.estimated_tokens)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        retrying = self._retrying
+        gateway = retrying.gateway
+        gateway._exit()
+
+        if exc is None:
+            gateway.breaker.record_success()
+            retrying.done = True
+            return False
+        if not isinstance(exc, Exception) or isinstance(exc, LLMError):
+            # Отмена задачи / закрытие генератора — о здоровье провайдера
+            # это ничего не говорит.
+            gateway.breaker.release_probe()
+            return False
+        if not _is_retryable(exc):
+            # Провайдер ответил: ошибка в запросе или в ответе, не в доступности.
+            gateway.breaker.record_success()
+            gateway.stats["errors"] += 1
+            raise LLMError(str(exc)) from exc
+
+        gateway.breaker.record_failure()
+        gateway.stats["retryable_errors"] += 1
+        if gateway.breaker.state == CircuitBreaker.OPEN:
+            raise LLMUnavailableError(gateway.breaker.retry_after()) from exc
+        if retrying.attempt > gateway.max_retries:
+            gateway.stats["errors"] += 1
+            raise LLMError(str(exc)) from exc
+
+        backoff = random.uniform(
+            0,
+            min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** retrying.attempt),
+        )
+        retrying.delay = max(backoff, _retry_after_header(exc) or 0.0)
+        gateway.stats["retries"] += 1
+        logger.info("LLM call failed (%s), retry in %.1fs", exc, retrying.delay)
+        return True
+
+
+class _Retrying:
+    """
+    async for attempt in gateway.attempts(tokens):
+        async with attempt:
+            ...  # один запрос к API
+    """
+
+    def __init__(self, gateway: "LLMGateway", estimated_tokens: int):
+        self.gateway = gateway
+        self.estimated_tokens = estimated_tokens
+        self.attempt = 0
+        self.delay = 0.0
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> _Attempt:
+        if self.done:
+            raise StopAsyncIteration
+        if self.attempt > 0:
+            await asyncio.sleep(self.delay)
+        self.attempt += 1
+        return _Attempt(self)
+
+
+class LLMGateway:
+    """
+    Единая точка вызовов OpenAI: лимиты запросов и токенов в минуту,
+    глобальный семафор параллельности, повторы с джиттером (учитывая
+    Retry-After) и circuit breaker.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self.stats = {
+            "calls": 0,
+            "retries": 0,
+            "retryable_errors": 0,
+            "errors": 0,
+        }
+
+    async def _enter(self, estimated_tokens: int) -> None:
+        probe = self.breaker.check()
+        # AICODE-NOTE: Отмена задачи в ожидании лимитов (таймаут планировщика,
+        # остановка воркера) не доходит до _Attempt.__aexit__: пробный запрос
+        # и взятое из бакетов возвращаем здесь, иначе breaker навсегда
+        # остаётся в half_open с «занятой» пробой.
+        taken: list[tuple[TokenBucket, float]] = []
+        try:
+            await self.requests.acquire(1)
+            taken.append((self.requests, 1))
+            await self.tokens.acquire(estimated_tokens)
+            taken.append((self.tokens, min(estimated_tokens, self.tokens.capacity)))
+            await self._semaphore.acquire()
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            for bucket, amount in taken:
+                bucket.adjust(-amount)
+            raise
+        self._in_flight += 1
+        self.stats["calls"] += 1
+
+    def _exit(self) -> None:
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    def attempts(self, estimated_tokens: int) -> _Retrying:
+        return _Retrying(self, estimated_tokens)
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        *,
+        estimated_tokens: int,
+    ) -> T:
+        async for attempt in self.attempts(estimated_tokens):
+            async with attempt:
+                return await fn()
+        raise LLMError("LLM call did not run")
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int | None) -> None:
+        if actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "breaker": self.breaker.snapshot(),
+            "requests_bucket": self.requests.state(),
+            "tokens_bucket": self.tokens.state(),
+            **self.stats,
+        }
+
+
+gateway = LLMGateway()
+
+metrics.register("llm_gateway", gateway.snapshot)
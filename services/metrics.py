@@ -0,0 +1,30 @@
+import inspect
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+MetricsSource = Callable[[], dict[str, Any] | Awaitable[dict[str, Any]]]
+
+_sources: dict[str, MetricsSource] = {}
+
+
+def register(name: str, source: MetricsSource) -> None:
+    """
+    Регистрирует источник метрик (функцию, возвращающую dict) для /stats.
+    """
+    _sources[name] = source
+
+
+async def collect() -> dict[str, dict[str, Any]]:
+    result: dict[str, dict[str, Any]] = {}
+    for name, source in _sources.items():
+        try:
+            value = source()
+            if inspect.isawaitable(value):
+                value = await value
+        except Exception as e:
+            logger.warning("Metrics source %s failed: %s", name, e)
+            value = {"error": str(e)}
+        result[name] = value
+    return result
@@ -0,0 +1,177 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from config import CHART_CACHE_DIR, CHART_RENDER_WORKERS
+from database.models import MoodChart, Person
+from services import metrics, mood_rollups
+from utils.charts import render_mood_chart, warm_up
+
+# AICODE-NOTE: График настроения кэшируется в два уровня по ключу
+# (person_id, Person.mood_version):
+#   1. file_id из Telegram (таблица mood_charts) — повторный показ не
+#      передаёт байты вовсе;
+#   2. PNG на диске (CHART_CACHE_DIR/<person_id>-<version>.png) — если
+#      file_id ещё нет (другой процесс, новый бот) или Telegram его не принял.
+# Рендер — в пуле процессов, цикл asyncio не блокируется. Новая версия
+# данных (services/notes.py после изменения агрегатов) вызывает evict.
+
+# За сколько дней до последней оценки рисуется график. Окно считается от
+# данных, а не от сегодняшней даты, — картинка зависит только от версии.
+CHART_DAYS = 90
+
+
+class ChartRef(NamedTuple):
+    version: int
+    file_id: str | None
+    path: Path | None
+
+
+_pool: ProcessPoolExecutor | None = None
+# Параллельные запросы одной версии ждут один рендер.
+_rendering: dict[tuple[int, int], asyncio.Future] = {}
+_stats = {
+    "file_id_hits": 0,
+    "disk_hits": 0,
+    "renders": 0,
+    "render_errors": 0,
+    "evictions": 0,
+    "render_ms_max": 0.0,
+}
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: дочерний процесс не наследует цикл asyncio и
+        # соединения с БД.
+        _pool = ProcessPoolExecutor(
+            max_workers=CHART_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _chart_path(person_id: int, version: int) -> Path:
+    return Path(CHART_CACHE_DIR) / f"{person_id}-{version}.png"
+
+
+def _remove_files(person_id: int, keep: Path | None = None) -> int:
+    removed = 0
+    for path in Path(CHART_CACHE_DIR).glob(f"{person_id}-*.png"):
+        if path != keep:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+async def _render(person_id: int, name: str, version: int, path: Path) -> bool:
+    """
+    False — у встречи нет оценок, рисовать нечего.
+    """
+    days = await mood_rollups.chart_days(person_id, CHART_DAYS)
+    if not days:
+        return False
+    weeks = await mood_rollups.chart_weeks(person_id, days[0][0])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(
+            _executor(),
+            render_mood_chart,
+            str(path),
+            f"Настроение: {name}",
+            days,
+            weeks,
+        )
+    except Exception:
+        _stats["render_errors"] += 1
+        raise
+    _stats["renders"] += 1
+    _stats["render_ms_max"] = max(
+        _stats["render_ms_max"], (time.monotonic() - started) * 1000
+    )
+    _remove_files(person_id, keep=path)
+    return True
+
+
+async def get_chart(person_id: int, name: str, *, use_file_id: bool = True) -> ChartRef | None:
+    """
+    Готовый график: file_id (если эта версия уже отправлялась) или путь к
+    PNG. None — у встречи нет оценок.
+    """
+    version = await (
+        Person.filter(id=person_id).first().values_list("mood_version", flat=True)
+    )
+    if version is None:
+        return None
+
+    if use_file_id:
+        cached = await MoodChart.get_or_none(person_id=person_id)
+        if cached and cached.version == version:
+            _stats["file_id_hits"] += 1
+            return ChartRef(version, cached.file_id, None)
+
+    path = _chart_path(person_id, version)
+    if path.exists():
+        _stats["disk_hits"] += 1
+        return ChartRef(version, None, path)
+
+    key = (person_id, version)
+    pending = _rendering.get(key)
+    if pending is None:
+        pending = _rendering[key] = asyncio.ensure_future(
+            _render(person_id, name, version, path)
+        )
+        pending.add_done_callback(lambda _: _rendering.pop(key, None))
+    if not await asyncio.shield(pending):
+        return None
+    return ChartRef(version, None, path)
+
+
+async def remember_file_id(person_id: int, version: int, file_id: str) -> None:
+    await MoodChart.bulk_create(
+        [MoodChart(person_id=person_id, version=version, file_id=file_id)],
+        on_conflict=["person_id"],
+        update_fields=["version", "file_id"],
+    )
+
+
+async def evict(person_id: int) -> None:
+    """
+    Данные встречи изменились: старые картинки и file_id больше не нужны.
+    """
+    _stats["evictions"] += 1
+    _remove_files(person_id)
+    await MoodChart.filter(person_id=person_id).delete()
+
+
+def start() -> None:
+    """
+    Запускает пул рендера в фоне (вызывается при старте бота).
+    """
+    for _ in range(CHART_RENDER_WORKERS):
+        _executor().submit(warm_up)
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "render_ms_max": round(_stats["render_ms_max"], 1),
+        "rendering": len(_rendering),
+    }
+
+
+metrics.register("mood_charts", stats)
@@ -0,0 +1,230 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, NamedTuple
+
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from database.models import MeetingNote, MoodRollup, Person
+
+# AICODE-NOTE: Агрегаты настроения пересчитываются по корзинам: изменилась
+# оценка заметки (разбор записан, заметка удалена) — день этой заметки
+# считается заново по её заметкам за день (индекс person_id, created_at),
+# неделя — по семи строкам дней. Так min/max остаются точными и после
+# удаления, а история целиком не читается. Вызывает services/notes.py в
+# транзакции записи заметки.
+
+PERIOD_DAY = "d"
+PERIOD_WEEK = "w"
+
+TRENDS_DAYS = 14
+TRENDS_WEEKS = 12
+REBUILD_BATCH_SIZE = 500
+
+
+class MoodStats(NamedTuple):
+    count: int
+    total: int
+    min_mood: int
+    max_mood: int
+    last_mood: int
+    last_at: datetime
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count
+
+
+def _utc_day(moment: datetime) -> date:
+    return moment.astimezone(timezone.utc).date()
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _from_moods(rows: Iterable[tuple[int, datetime]]) -> MoodStats | None:
+    """
+    rows — (оценка, created_at) по возрастанию created_at.
+    """
+    stats = None
+    for mood, created_at in rows:
+        if stats is None:
+            stats = MoodStats(1, mood, mood, mood, mood, created_at)
+            continue
+        stats = MoodStats(
+            stats.count + 1,
+            stats.total + mood,
+            min(stats.min_mood, mood),
+            max(stats.max_mood, mood),
+            mood,
+            created_at,
+        )
+    return stats
+
+
+def _merge(parts: Iterable[MoodStats]) -> MoodStats | None:
+    """
+    parts — агрегаты подряд идущих периодов по возрастанию.
+    """
+    merged = None
+    for part in parts:
+        if merged is None:
+            merged = part
+            continue
+        merged = MoodStats(
+            merged.count + part.count,
+            merged.total + part.total,
+            min(merged.min_mood, part.min_mood),
+            max(merged.max_mood, part.max_mood),
+            part.last_mood,
+            part.last_at,
+        )
+    return merged
+
+
+async def _store(person_id: int, period: str, start: date, stats: MoodStats | None) -> None:
+    if stats is None:
+        await MoodRollup.filter(
+            person_id=person_id, period=period, period_start=start
+        ).delete()
+        return
+    await MoodRollup.bulk_create(
+        [MoodRollup(person_id=person_id, period=period, period_start=start, **stats._asdict())],
+        on_conflict=["person_id", "period", "period_start"],
+        update_fields=list(MoodStats._fields),
+    )
+
+
+async def _load(
+    person_id: int,
+    period: str,
+    since: date,
+    until: date | None = None,
+) -> dict[date, MoodStats]:
+    query = MoodRollup.filter(person_id=person_id, period=period, period_start__gte=since)
+    if until is not None:
+        query = query.filter(period_start__lte=until)
+    rows = await query.order_by("period_start").values("period_start", *MoodStats._fields)
+    return {
+        row.pop("period_start"): MoodStats(**row)
+        for row in rows
+    }
+
+
+async def refresh(person_id: int, created_at: datetime) -> bool:
+    """
+    Пересчитывает день и неделю, в которые попадает заметка от created_at.
+    Возвращает True, если агрегаты изменились (тогда растёт
+    Person.mood_version — версия данных для графика).
+    """
+    day = _utc_day(created_at)
+    day_start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    moods = await (
+        MeetingNote.filter(
+            person_id=person_id,
+            created_at__gte=day_start,
+            created_at__lt=day_start + timedelta(days=1),
+            stress_level__isnull=False,
+        )
+        .order_by("created_at", "id")
+        .values_list("stress_level", "created_at")
+    )
+    stats = _from_moods(moods)
+    # Повторный разбор с той же оценкой (фоновый пересчёт) ничего не меняет.
+    if (await _load(person_id, PERIOD_DAY, day, day)).get(day) == stats:
+        return False
+    await _store(person_id, PERIOD_DAY, day, stats)
+
+    week = week_start(day)
+    days = await _load(person_id, PERIOD_DAY, week, week + timedelta(days=6))
+    await _store(person_id, PERIOD_WEEK, week, _merge(days.values()))
+    await Person.filter(id=person_id).update(mood_version=F("mood_version") + 1)
+    return True
+
+
+async def trends(person_id: int, *, today: date | None = None) -> dict:
+    """
+    Последние TRENDS_WEEKS недель и TRENDS_DAYS дней (None — нет оценок)
+    и итог за эти недели. Два запроса по индексу, не больше 26 строк.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    first_week = week_start(today) - timedelta(weeks=TRENDS_WEEKS - 1)
+    first_day = today - timedelta(days=TRENDS_DAYS - 1)
+
+    weeks = await _load(person_id, PERIOD_WEEK, first_week)
+    days = await _load(person_id, PERIOD_DAY, first_day)
+    return {
+        "weeks": [
+            weeks.get(first_week + timedelta(weeks=i)) for i in range(TRENDS_WEEKS)
+        ],
+        "days": [days.get(first_day + timedelta(days=i)) for i in range(TRENDS_DAYS)],
+        "total": _merge(weeks.values()),
+    }
+
+
+async def chart_days(person_id: int, days: int) -> list[tuple[date, float, int, int]]:
+    """
+    (день, среднее, минимум, максимум) за days дней до последнего дня с оценкой.
+    """
+    last_day = await (
+        MoodRollup.filter(person_id=person_id, period=PERIOD_DAY)
+        .order_by("-period_start")
+        .first()
+        .values_list("period_start", flat=True)
+    )
+    if last_day is None:
+        return []
+    rows = await _load(person_id, PERIOD_DAY, last_day - timedelta(days=days - 1))
+    return [
+        (day, stats.mean, stats.min_mood, stats.max_mood)
+        for day, stats in rows.items()
+    ]
+
+
+async def chart_weeks(person_id: int, since: date) -> list[tuple[date, float]]:
+    """
+    (понедельник, среднее) для недель, начиная с недели дня since.
+    """
+    rows = await _load(person_id, PERIOD_WEEK, week_start(since))
+    return [(week, stats.mean) for week, stats in rows.items()]
+
+
+async def rebuild(person_id: int | None = None) -> int:
+    """
+    Пересобирает агрегаты с нуля (по всем встречам или одной).
+    Возвращает число учтённых заметок.
+    """
+    people = Person.all() if person_id is None else Person.filter(id=person_id)
+    counted = 0
+    for pid in await people.order_by("id").values_list("id", flat=True):
+        moods = await (
+            MeetingNote.filter(person_id=pid, stress_level__isnull=False)
+            .order_by("created_at", "id")
+            .values_list("stress_level", "created_at")
+        )
+        counted += len(moods)
+
+        by_day: dict[date, list[tuple[int, datetime]]] = {}
+        for mood, created_at in moods:
+            by_day.setdefault(_utc_day(created_at), []).append((mood, created_at))
+        day_stats = {day: _from_moods(rows) for day, rows in by_day.items()}
+
+        by_week: dict[date, list[MoodStats]] = {}
+        for day, stats in day_stats.items():
+            by_week.setdefault(week_start(day), []).append(stats)
+
+        rollups = [
+            MoodRollup(person_id=pid, period=PERIOD_DAY, period_start=day, **stats._asdict())
+            for day, stats in day_stats.items()
+        ] + [
+            MoodRollup(
+                person_id=pid, period=PERIOD_WEEK, period_start=week, **_merge(parts)._asdict()
+            )
+            for week, parts in by_week.items()
+        ]
+        async with in_transaction():
+            await MoodRollup.filter(person_id=pid).delete()
+            for i in range(0, len(rollups), REBUILD_BATCH_SIZE):
+                await MoodRollup.bulk_create(rollups[i : i + REBUILD_BATCH_SIZE])
+            await Person.filter(id=pid).update(mood_version=F("mood_version") + 1)
+    return counted
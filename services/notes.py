@@ -0,0 +1,213 @@
+from collections import Counter
+from datetime import datetime, timezone
+
+from tortoise.expressions import F, Q
+from tortoise.transactions import in_transaction
+
+from database.models import MeetingNote, Person
+from services import (
+    action_items,
+    digests,
+    mood_charts,
+    mood_rollups,
+    people_cache,
+    search,
+    similar,
+    tags,
+)
+from services.llm import prompt_fingerprint
+from utils.text import make_snippet
+
+PROMPT_DISABLED_PREFIX = "[DISABLED]\n"
+
+ANALYSIS_PENDING = "pending"
+ANALYSIS_DONE = "done"
+ANALYSIS_FAILED = "failed"
+
+FAILED_ANALYSIS = {
+    "mood": None,
+    "summary": "Не удалось проанализировать заметку.",
+    "action_items": [],
+}
+
+
+def effective_custom_prompt(custom_prompt: str | None) -> str | None:
+    if not custom_prompt:
+        return None
+    if custom_prompt.startswith(PROMPT_DISABLED_PREFIX):
+        return None
+    return custom_prompt
+
+
+def person_prompt_fingerprint(person: Person) -> str:
+    return prompt_fingerprint(effective_custom_prompt(person.custom_prompt))
+
+
+def meeting_tag(name: str) -> str:
+    raw = (name or "").strip().replace(" ", "_")
+    safe = "".join(ch if (ch.isalnum() or ch in "_-") else "_" for ch in raw)
+    return f"#{safe}" if safe else "#meeting"
+
+
+async def create_note(person: Person, raw_text: str) -> MeetingNote:
+    """
+    Сохраняет заметку сразу, без ожидания LLM. Анализ ставится в очередь.
+    """
+    async with in_transaction():
+        note = await MeetingNote.create(
+            person=person,
+            raw_text=raw_text,
+            snippet=make_snippet(raw_text),
+            analysis_status=ANALYSIS_PENDING,
+        )
+        await Person.filter(id=person.id).update(
+            notes_count=F("notes_count") + 1
+        )
+        await search.index_note(note.id, person.id, raw_text, None)
+        await digests.invalidate(person.id, [note.created_at])
+    await similar.update(person.user_id, [(note.id, raw_text)])
+    return note
+
+
+async def create_notes(notes: list[MeetingNote]) -> None:
+    """
+    Пачка несохранённых заметок (импорт): один INSERT, счётчики встреч и
+    поисковый индекс — в одной транзакции. Анализ в очередь ставит вызывающий.
+    Разборов ещё нет, поэтому агрегаты настроения не меняются. Индекс похожих
+    заметок обновляется после INSERT.
+    """
+    for note in notes:
+        note.snippet = make_snippet(note.raw_text)
+        note.analysis_status = ANALYSIS_PENDING
+    now = datetime.now(timezone.utc)
+    added = Counter(note.person_id for note in notes)
+    async with in_transaction():
+        await MeetingNote.bulk_create(notes)
+        for person_id, count in added.items():
+            await Person.filter(id=person_id).update(
+                notes_count=F("notes_count") + count
+            )
+            await digests.invalidate(
+                person_id,
+                [note.created_at or now for note in notes if note.person_id == person_id],
+            )
+        await search.index_notes(notes)
+    owners = dict(
+        await Person.filter(id__in=list(added)).values_list("id", "user_id")
+    )
+    by_user: dict[int, list] = {}
+    for note in notes:
+        by_user.setdefault(owners[note.person_id], []).append((note.id, note.raw_text))
+    for user_id, items in by_user.items():
+        await similar.update(user_id, items)
+
+
+async def update_note_text(note: MeetingNote, raw_text: str) -> None:
+    note.raw_text = raw_text
+    note.snippet = make_snippet(raw_text)
+    note.analysis_status = ANALYSIS_PENDING
+    async with in_transaction():
+        await note.save(update_fields=["raw_text", "snippet", "analysis_status"])
+        # До нового разбора ищется по новому тексту и старому summary.
+        await search.index_note(note.id, note.person_id, raw_text, note.ai_summary)
+        await digests.invalidate(note.person_id, [note.created_at])
+    user_id = await Person.filter(id=note.person_id).first().values_list("user_id", flat=True)
+    await similar.update(user_id, [(note.id, raw_text)])
+
+
+async def apply_analysis(
+    note: MeetingNote,
+    analysis: dict,
+    *,
+    status: str = ANALYSIS_DONE,
+    fingerprint: str | None = None,
+    is_stale: bool = False,
+) -> None:
+    """
+    Записывает результат анализа в заметку. note.person должен быть загружен.
+    fingerprint — отпечаток промпта, с которым получен analysis.
+    """
+    # AICODE-NOTE: Тег встречи первым, за ним хештеги от LLM — нормализованные,
+    # как в таблице tags (services/tags.py).
+    analysis["tags"] = tags.note_tags(meeting_tag(note.person.name), analysis.get("tags"))
+
+    digest_text = digests.source_text(note.raw_text, note.ai_summary, note.analysis_status)
+    note.ai_summary = analysis
+    note.stress_level = analysis.get("mood")
+    note.analysis_status = status
+    note.prompt_fingerprint = fingerprint
+    note.is_stale = is_stale
+    async with in_transaction():
+        await note.save(
+            update_fields=[
+                "ai_summary",
+                "stress_level",
+                "analysis_status",
+                "prompt_fingerprint",
+                "is_stale",
+            ]
+        )
+        await search.index_note(note.id, note.person_id, note.raw_text, analysis)
+        await action_items.sync(note, analysis.get("action_items"))
+        await tags.sync(note, analysis["tags"])
+        mood_changed = await mood_rollups.refresh(note.person_id, note.created_at)
+        if digests.source_text(note.raw_text, analysis, status) != digest_text:
+            await digests.invalidate(note.person_id, [note.created_at])
+    if mood_changed:
+        await mood_charts.evict(note.person_id)
+
+
+async def mark_prompt_changed(person: Person) -> int:
+    """
+    Вызывается после любой смены промпта человека. Помечает устаревшими
+    разборы, сделанные с другим промптом, и снимает пометку с тех, чей промпт
+    снова стал актуальным (например, промпт выключили и включили обратно).
+    Возвращает число устаревших разборов.
+    """
+    fingerprint = person_prompt_fingerprint(person)
+    done = MeetingNote.filter(person_id=person.id, analysis_status=ANALYSIS_DONE)
+    await done.filter(prompt_fingerprint=fingerprint).update(is_stale=False)
+    await done.filter(
+        Q(prompt_fingerprint__isnull=True) | Q(prompt_fingerprint__not=fingerprint)
+    ).update(is_stale=True)
+    return await done.filter(is_stale=True).count()
+
+
+async def stale_progress(person_id: int) -> tuple[int, int]:
+    """
+    (устаревших разборов, всего готовых разборов) для экрана промпта.
+    """
+    done = MeetingNote.filter(person_id=person_id, analysis_status=ANALYSIS_DONE)
+    return await done.filter(is_stale=True).count(), await done.count()
+
+
+async def delete_note(note_id) -> bool:
+    mood_changed = False
+    async with in_transaction():
+        row = await (
+            MeetingNote.filter(id=note_id)
+            .first()
+            .values("person_id", "person__user_id", "created_at")
+        )
+        if row is None:
+            return False
+        person_id = row["person_id"]
+        # Удаление по первичному ключу — максимум одна заметка. Число строк
+        # от delete() не используем: SQLite учитывает в нём и каскадно
+        # удалённые analysis_jobs.
+        await search.unindex_note(note_id)
+        await action_items.forget(note_id)
+        await tags.forget(note_id)
+        await digests.invalidate(person_id, [row["created_at"]])
+        deleted = await MeetingNote.filter(id=note_id).delete()
+        if deleted:
+            await Person.filter(id=person_id).update(
+                notes_count=F("notes_count") - 1
+            )
+            mood_changed = await mood_rollups.refresh(person_id, row["created_at"])
+    people_cache.forget_note(note_id)
+    if deleted:
+        await similar.remove(row["person__user_id"], note_id)
+    if deleted and mood_changed:
+        await mood_charts.evict(person_id)
+    return bool(deleted)
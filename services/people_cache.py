@@ -0,0 +1,127 @@
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from config import (
+    NOTE_OWNER_CACHE_SIZE,
+    PEOPLE_CACHE_SIZE,
+    PEOPLE_CACHE_TTL_SECONDS,
+)
+from database.models import MeetingNote, Person
+from keyboards.people_kb import get_people_keyboard
+from services import metrics
+
+# AICODE-NOTE: Список встреч пользователя и собранная по нему клавиатура
+# нужны почти на каждом шаге навигации, а меняются редко. Держим их в памяти
+# процесса (LRU + TTL) и сбрасываем при любом изменении встреч пользователя
+# (invalidate). TTL ограничивает расхождение, если изменение пришло из
+# другого процесса.
+
+
+class CachedPeople(NamedTuple):
+    expires_at: float
+    people: tuple[Person, ...]
+    # Клавиатура get_people_keyboard (при пустом списке — только «Добавить»).
+    markup: InlineKeyboardMarkup
+
+
+_entries: OrderedDict[int, CachedPeople] = OrderedDict()
+# note_id -> (expires_at, person_id). Заметка не переходит к другой встрече,
+# поэтому сбрасываем только при удалении (forget_note).
+_note_people: OrderedDict[str, tuple[float, int]] = OrderedDict()
+# Растёт при каждой инвалидации: загрузка, начатая до неё, не попадёт в кэш.
+_epoch = 0
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+    "evicted": 0,
+    "note_hits": 0,
+    "note_misses": 0,
+}
+
+
+async def get(user_id: int) -> CachedPeople:
+    cached = _entries.get(user_id)
+    if cached and cached.expires_at > time.monotonic():
+        _entries.move_to_end(user_id)
+        _stats["hits"] += 1
+        return cached
+
+    _stats["misses"] += 1
+    epoch = _epoch
+    # Только поля, нужные спискам и клавиатуре; такие объекты нельзя
+    # сохранить — для изменений встречу нужно загрузить заново.
+    people = tuple(
+        await Person.filter(user_id=user_id)
+        .order_by("id")
+        .only("id", "user_id", "name")
+    )
+    entry = CachedPeople(
+        expires_at=time.monotonic() + PEOPLE_CACHE_TTL_SECONDS,
+        people=people,
+        markup=get_people_keyboard(list(people)),
+    )
+    if epoch == _epoch:
+        _entries[user_id] = entry
+        _entries.move_to_end(user_id)
+        while len(_entries) > PEOPLE_CACHE_SIZE:
+            _entries.popitem(last=False)
+            _stats["evicted"] += 1
+    return entry
+
+
+def invalidate(user_id: int) -> None:
+    global _epoch
+
+    _epoch += 1
+    _entries.pop(user_id, None)
+    _stats["invalidations"] += 1
+
+
+async def note_person_id(note_id) -> int | None:
+    """
+    person_id заметки или None, если заметки нет.
+    """
+    key = str(note_id)
+    cached = _note_people.get(key)
+    if cached and cached[0] > time.monotonic():
+        _note_people.move_to_end(key)
+        _stats["note_hits"] += 1
+        return cached[1]
+
+    _stats["note_misses"] += 1
+    try:
+        person_id = await (
+            MeetingNote.filter(id=note_id).first().values_list("person_id", flat=True)
+        )
+    except (ValueError, TypeError):
+        # Некорректный UUID в callback_data.
+        return None
+    if person_id is None:
+        return None
+
+    _note_people[key] = (time.monotonic() + PEOPLE_CACHE_TTL_SECONDS, person_id)
+    _note_people.move_to_end(key)
+    while len(_note_people) > NOTE_OWNER_CACHE_SIZE:
+        _note_people.popitem(last=False)
+    return person_id
+
+
+def forget_note(note_id) -> None:
+    _note_people.pop(str(note_id), None)
+
+
+def stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_entries),
+        "notes_size": len(_note_people),
+        "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else None,
+    }
+
+
+metrics.register("people_cache", stats)
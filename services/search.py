@@ -0,0 +1,283 @@
+import logging
+import re
+import time
+
+from tortoise import Tortoise
+
+from config import SEARCH_PG_LANGUAGE
+from database.models import MeetingNote
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# AICODE-NOTE: Полнотекстовый индекс заметок — отдельная таблица note_search
+# (id заметки, владелец, текст для поиска), а не колонка meeting_notes:
+# так история и отчёты не читают лишнего, а формат индекса свой у каждой БД.
+#   SQLite — FTS5 с внешним содержимым (note_search_fts), синхронизация
+#     триггерами; владелец — отдельная колонка FTS (u<user_id>), поэтому
+#     выборка «слова пользователя» идёт по индексу, а не фильтром после.
+#   PostgreSQL — колонка tsvector + GIN и индекс по user_id.
+# Индекс обновляет services/notes.py при создании, правке, анализе и
+# удалении заметки. Таблица создаётся и заполняется в init_db.
+
+BACKFILL_BATCH_SIZE = 500
+# Больше слов в запросе не учитываем.
+MAX_QUERY_TERMS = 10
+# Окончания, которые SQLite-поиск отрезает от слов запроса: FTS5 не знает
+# морфологии, а префикс «релиз» найдёт и «релиз», и «релизы». Длинные
+# окончания — раньше коротких.
+_RU_ENDINGS = (
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ов", "ев", "ей", "ой", "ый", "ий", "ая", "яя", "ое", "ее", "ые", "ие",
+    "ам", "ям", "ах", "ях", "ом", "ем", "ую", "юю",
+    "а", "я", "ы", "и", "у", "ю", "е", "о", "ь",
+)
+MIN_STEM_LENGTH = 3
+
+_SQLITE_SCHEMA = """
+CREATE TABLE "note_search" (
+    "rowid" INTEGER PRIMARY KEY,
+    "note_id" CHAR(36) NOT NULL UNIQUE REFERENCES "meeting_notes" ("id") ON DELETE CASCADE,
+    "owner" TEXT NOT NULL,
+    "body" TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE "note_search_fts" USING fts5(
+    owner, body,
+    content='note_search', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER "note_search_ai" AFTER INSERT ON "note_search" BEGIN
+    INSERT INTO note_search_fts (rowid, owner, body)
+    VALUES (new.rowid, new.owner, new.body);
+END;
+CREATE TRIGGER "note_search_ad" AFTER DELETE ON "note_search" BEGIN
+    INSERT INTO note_search_fts (note_search_fts, rowid, owner, body)
+    VALUES ('delete', old.rowid, old.owner, old.body);
+END;
+CREATE TRIGGER "note_search_au" AFTER UPDATE ON "note_search" BEGIN
+    INSERT INTO note_search_fts (note_search_fts, rowid, owner, body)
+    VALUES ('delete', old.rowid, old.owner, old.body);
+    INSERT INTO note_search_fts (rowid, owner, body)
+    VALUES (new.rowid, new.owner, new.body);
+END;
+"""
+
+_POSTGRES_SCHEMA = """
+CREATE TABLE "note_search" (
+    "note_id" UUID PRIMARY KEY REFERENCES "meeting_notes" ("id") ON DELETE CASCADE,
+    "user_id" BIGINT NOT NULL,
+    "document" TSVECTOR NOT NULL
+);
+CREATE INDEX "idx_note_search_document" ON "note_search" USING GIN ("document");
+CREATE INDEX "idx_note_search_user" ON "note_search" ("user_id");
+"""
+
+# Владелец берётся из people в том же запросе: вызывающему коду не нужно
+# загружать встречу.
+_SQLITE_UPSERT = (
+    'INSERT INTO "note_search" ("note_id", "owner", "body") '
+    "SELECT ?, 'u' || \"user_id\", ? FROM \"people\" WHERE \"id\" = ? "
+    'ON CONFLICT ("note_id") DO UPDATE SET "owner" = excluded."owner", '
+    '"body" = excluded."body"'
+)
+_POSTGRES_UPSERT = (
+    'INSERT INTO "note_search" ("note_id", "user_id", "document") '
+    'SELECT $1::uuid, "user_id", to_tsvector($2::regconfig, $3) '
+    'FROM "people" WHERE "id" = $4 '
+    'ON CONFLICT ("note_id") DO UPDATE SET "user_id" = EXCLUDED."user_id", '
+    '"document" = EXCLUDED."document"'
+)
+
+_SQLITE_SEARCH = (
+    'SELECT s."note_id" FROM "note_search_fts" '
+    'JOIN "note_search" s ON s."rowid" = "note_search_fts"."rowid" '
+    'WHERE "note_search_fts" MATCH ? '
+    # Вес колонки owner — 0: она совпадает у всех найденных заметок.
+    'ORDER BY bm25("note_search_fts", 0.0, 1.0) '
+    "LIMIT ? OFFSET ?"
+)
+_POSTGRES_SEARCH = (
+    'SELECT "note_id" FROM "note_search", '
+    "to_tsquery($2::regconfig, $3) query "
+    'WHERE "user_id" = $1 AND "document" @@ query '
+    'ORDER BY ts_rank("document", query) DESC, "note_id" '
+    "LIMIT $4 OFFSET $5"
+)
+
+_stats = {"queries": 0, "indexed": 0, "query_ms_total": 0.0, "query_ms_max": 0.0}
+
+
+def _connection():
+    return Tortoise.get_connection("default")
+
+
+def _is_sqlite(conn) -> bool:
+    return conn.capabilities.dialect == "sqlite"
+
+
+def search_document(raw_text: str | None, analysis: dict | None) -> str:
+    """
+    Текст, по которому ищется заметка: исходный текст, summary, задачи и теги.
+    """
+    analysis = analysis or {}
+    parts = [raw_text or "", str(analysis.get("summary") or "")]
+    parts.extend(str(item) for item in analysis.get("action_items") or [])
+    parts.extend(str(tag) for tag in analysis.get("tags") or [])
+    return "\n".join(part for part in parts if part)
+
+
+def query_terms(query: str) -> list[str]:
+    return re.findall(r"\w+", (query or "").lower())[:MAX_QUERY_TERMS]
+
+
+def _stem(term: str) -> str:
+    for ending in _RU_ENDINGS:
+        if term.endswith(ending) and len(term) - len(ending) >= MIN_STEM_LENGTH:
+            return term[: -len(ending)]
+    return term
+
+
+def _upsert(conn) -> str:
+    return _SQLITE_UPSERT if _is_sqlite(conn) else _POSTGRES_UPSERT
+
+
+def _upsert_values(conn, note_id, person_id: int, raw_text: str, analysis: dict | None) -> list:
+    body = search_document(raw_text, analysis)
+    if _is_sqlite(conn):
+        return [str(note_id), body, person_id]
+    return [str(note_id), SEARCH_PG_LANGUAGE, body, person_id]
+
+
+async def index_note(note_id, person_id: int, raw_text: str, analysis: dict | None) -> None:
+    conn = _connection()
+    await conn.execute_query(
+        _upsert(conn), _upsert_values(conn, note_id, person_id, raw_text, analysis)
+    )
+    _stats["indexed"] += 1
+
+
+async def index_notes(notes: list[MeetingNote]) -> None:
+    """
+    Пачка новых заметок (импорт) — один execute_many вместо запроса на заметку.
+    """
+    conn = _connection()
+    await conn.execute_many(
+        _upsert(conn),
+        [
+            _upsert_values(conn, note.id, note.person_id, note.raw_text, note.ai_summary)
+            for note in notes
+        ],
+    )
+    _stats["indexed"] += len(notes)
+
+
+async def unindex_note(note_id) -> None:
+    # Внешний ключ с ON DELETE CASCADE удалил бы строку и сам, но в SQLite
+    # он работает только с PRAGMA foreign_keys — удаляем явно.
+    conn = _connection()
+    placeholder = "?" if _is_sqlite(conn) else "$1::uuid"
+    await conn.execute_query(
+        f'DELETE FROM "note_search" WHERE "note_id" = {placeholder}', [str(note_id)]
+    )
+
+
+async def search_note_ids(
+    user_id: int,
+    query: str,
+    *,
+    limit: int,
+    offset: int = 0,
+) -> list[str]:
+    """
+    id заметок пользователя по убыванию релевантности. Нужны все слова
+    запроса; каждое ищется как префикс, в SQLite — без окончания
+    («релизы» найдёт «релиз»), в PostgreSQL — по основе слова.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    conn = _connection()
+    started = time.monotonic()
+    if _is_sqlite(conn):
+        words = " AND ".join(f'"{_stem(term)}"*' for term in terms)
+        match = f'owner : "u{user_id}" AND body : ({words})'
+        rows = await conn.execute_query_dict(_SQLITE_SEARCH, [match, limit, offset])
+    else:
+        tsquery = " & ".join(f"'{term}':*" for term in terms)
+        rows = await conn.execute_query_dict(
+            _POSTGRES_SEARCH,
+            [user_id, SEARCH_PG_LANGUAGE, tsquery, limit, offset],
+        )
+
+    elapsed_ms = (time.monotonic() - started) * 1000
+    _stats["queries"] += 1
+    _stats["query_ms_total"] += elapsed_ms
+    _stats["query_ms_max"] = max(_stats["query_ms_max"], elapsed_ms)
+    return [str(row["note_id"]) for row in rows]
+
+
+async def _table_exists(conn) -> bool:
+    if _is_sqlite(conn):
+        rows = await conn.execute_query_dict(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'note_search'"
+        )
+        return bool(rows)
+    rows = await conn.execute_query_dict(
+        "SELECT to_regclass('note_search') IS NOT NULL AS present"
+    )
+    return bool(rows and rows[0]["present"])
+
+
+async def _backfill(conn) -> int:
+    indexed = 0
+    last_id = None
+    while True:
+        query = MeetingNote.all().order_by("id").limit(BACKFILL_BATCH_SIZE)
+        if last_id is not None:
+            query = query.filter(id__gt=last_id)
+        rows = await query.values("id", "person_id", "raw_text", "ai_summary")
+        if not rows:
+            return indexed
+        await conn.execute_many(
+            _upsert(conn),
+            [
+                _upsert_values(
+                    conn, row["id"], row["person_id"], row["raw_text"], row["ai_summary"]
+                )
+                for row in rows
+            ],
+        )
+        indexed += len(rows)
+        last_id = rows[-1]["id"]
+
+
+async def ensure_search_index() -> None:
+    """
+    Создаёт индекс, если его нет, и заполняет по существующим заметкам.
+    """
+    conn = _connection()
+    if await _table_exists(conn):
+        return
+    await conn.execute_script(_SQLITE_SCHEMA if _is_sqlite(conn) else _POSTGRES_SCHEMA)
+    started = time.monotonic()
+    indexed = await _backfill(conn)
+    if indexed:
+        logger.info(
+            "Search index built for %s notes in %.1fs",
+            indexed,
+            time.monotonic() - started,
+        )
+
+
+def stats() -> dict:
+    queries = _stats["queries"]
+    return {
+        "queries": queries,
+        "indexed": _stats["indexed"],
+        "query_ms_avg": round(_stats["query_ms_total"] / queries, 1) if queries else None,
+        "query_ms_max": round(_stats["query_ms_max"], 1),
+    }
+
+
+metrics.register("search", stats)
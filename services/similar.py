@@ -0,0 +1,433 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from config import SIMILAR_DIM, SIMILAR_INDEX_DIR, SIMILAR_OPEN_INDEXES
+from database.models import MeetingNote
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# AICODE-NOTE: «Похожие заметки» без сети и внешних сервисов. Вектор заметки —
+# хешированные признаки текста (основы слов и пары соседних основ, вес
+# 1 + log(tf), знак от хеша): это случайная проекция разреженного TF-вектора
+# в SIMILAR_DIM измерений, длина вектора 1, косинус — скалярное произведение.
+# У пользователя один файл индекса (ids заметок + матрица float32), открытый
+# через np.memmap; топ-k — одно умножение матрицы на вектор. services/notes.py
+# обновляет индекс после записи заметки, а если файла ещё нет — первый
+# поиск собирает его из БД. Индекс — производные данные: сломанный файл
+# удаляется и пересобирается. Файлом владеет один процесс — supervisor.py
+# закрепляет пользователя за воркером.
+
+TOP_K = 5
+# Ниже этого косинуса заметки не считаются похожими.
+MIN_SCORE = 0.15
+# Основа слова — первые STEM_LENGTH букв: «выгорание» и «выгоранием» совпадут.
+STEM_LENGTH = 6
+BIGRAM_WEIGHT = 0.5
+REBUILD_BATCH_SIZE = 1000
+
+# Файл индекса: заголовок из HEADER_WORDS uint32 (magic, версия формата,
+# размерность, заметок, ёмкость), id заметок (ёмкость × 16 байт UUID),
+# векторы (ёмкость × SIMILAR_DIM float32). Место под новые строки
+# резервируется удвоением; удалённая строка — нулевые id и вектор.
+MAGIC = 0x53494D31
+FORMAT_VERSION = 1
+HEADER_WORDS = 16
+HEADER_BYTES = HEADER_WORDS * 4
+MIN_CAPACITY = 256
+# Удалённые строки вычищаются, когда их больше половины и не меньше этого.
+COMPACT_MIN_DEAD = 256
+
+_H_COUNT = 3
+_H_CAPACITY = 4
+_EMPTY_ID = bytes(16)
+_SIGN_BIT = 1 << 31
+
+_WORD_RE = re.compile(r"[^\W\d_]{2,}")
+_STOPWORDS = frozenset(
+    """
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за
+    бы по только ее её мне было вот от меня еще ещё нет о из ему теперь когда
+    даже ну ли если уже или ни быть был него до вас опять уж вам ведь там
+    потом себя ничего ей может они тут где есть надо ней для мы тебя их чем
+    была сам чтоб без будто чего раз тоже себе под будет тогда кто этот того
+    потому этого какой совсем ним здесь этом один почти мой тем чтобы нее
+    сейчас были куда зачем всех никогда можно при об другой хоть после над
+    больше тот через эти нас про всего них какая много разве эту моя свою
+    этой перед иногда лучше чуть том нельзя такой им более всегда конечно
+    всю между это очень
+    the an and or of to in on for is are was were be it this that with as
+    at by from we he she they not but
+    """.split()
+)
+
+_indexes: OrderedDict[int, "_Index"] = OrderedDict()
+_locks: dict[int, asyncio.Lock] = {}
+_stats = {
+    "queries": 0,
+    "query_ms_max": 0.0,
+    "indexed": 0,
+    "removed": 0,
+    "rebuilds": 0,
+    "dropped": 0,
+}
+
+
+def _uuid(value) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Вектор текста длины 1 (нулевой — в тексте нет слов).
+    """
+    stems = [
+        word[:STEM_LENGTH]
+        for word in _WORD_RE.findall((text or "").lower())
+        if word not in _STOPWORDS
+    ]
+    features = (
+        (Counter(stems), 1.0),
+        (Counter(f"{a} {b}" for a, b in zip(stems, stems[1:])), BIGRAM_WEIGHT),
+    )
+    hashes = []
+    weights = []
+    for counts, weight in features:
+        for feature, count in counts.items():
+            feature_hash = zlib.crc32(feature.encode("utf-8"))
+            value = weight * (1 + math.log(count))
+            hashes.append(feature_hash)
+            weights.append(value if feature_hash & _SIGN_BIT else -value)
+
+    vector = np.zeros(SIMILAR_DIM, dtype=np.float32)
+    if hashes:
+        buckets = np.array(hashes, dtype=np.uint32) % SIMILAR_DIM
+        np.add.at(vector, buckets, np.array(weights, dtype=np.float32))
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+    return vector
+
+
+def embed_many(texts: list[str]) -> np.ndarray:
+    matrix = np.zeros((len(texts), SIMILAR_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        matrix[row] = embed(text)
+    return matrix
+
+
+def _index_path(user_id: int) -> Path:
+    # Смена формата или размерности — другой каталог, старые файлы не читаются.
+    return Path(SIMILAR_INDEX_DIR) / f"v{FORMAT_VERSION}-d{SIMILAR_DIM}" / f"{user_id}.idx"
+
+
+def _write_file(path: Path, ids: bytes, vectors: np.ndarray, capacity: int) -> None:
+    """
+    Пишет индекс целиком во временный файл и подменяет им path.
+    ids — по 16 байт на строку vectors.
+    """
+    header = np.zeros(HEADER_WORDS, dtype="<u4")
+    header[:5] = (MAGIC, FORMAT_VERSION, SIMILAR_DIM, len(vectors), capacity)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as file:
+        file.write(header.tobytes())
+        file.write(ids)
+        file.seek(HEADER_BYTES + capacity * 16)
+        file.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+        file.truncate(HEADER_BYTES + capacity * (16 + SIMILAR_DIM * 4))
+    os.replace(tmp, path)
+
+
+class _Index:
+    """
+    Открытый файл индекса пользователя. Методы блокирующие — вызываются
+    через asyncio.to_thread под замком пользователя.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._open()
+
+    def _open(self) -> None:
+        header = np.fromfile(self.path, dtype="<u4", count=HEADER_WORDS)
+        if len(header) < HEADER_WORDS or tuple(header[:3]) != (
+            MAGIC,
+            FORMAT_VERSION,
+            SIMILAR_DIM,
+        ):
+            raise ValueError(f"{self.path} is not a similar notes index")
+        count, capacity = int(header[_H_COUNT]), int(header[_H_CAPACITY])
+        # memmap в режиме r+ молча дополняет короткий файл нулями — обрезанный
+        # файл (диск кончился при записи) отбрасываем сами.
+        if count > capacity or self.path.stat().st_size < (
+            HEADER_BYTES + capacity * (16 + SIMILAR_DIM * 4)
+        ):
+            raise ValueError(f"{self.path} is corrupted")
+
+        self.header = np.memmap(self.path, dtype="<u4", mode="r+", shape=(HEADER_WORDS,))
+        self.ids = np.memmap(
+            self.path, dtype="V16", mode="r+", offset=HEADER_BYTES, shape=(capacity,)
+        )
+        self.vectors = np.memmap(
+            self.path,
+            dtype="<f4",
+            mode="r+",
+            offset=HEADER_BYTES + capacity * 16,
+            shape=(capacity, SIMILAR_DIM),
+        )
+        raw = self.ids[:count].tobytes()
+        self.note_ids: list[uuid.UUID | None] = [
+            None if raw[i:i + 16] == _EMPTY_ID else uuid.UUID(bytes=raw[i:i + 16])
+            for i in range(0, len(raw), 16)
+        ]
+        self.rows = {note_id: row for row, note_id in enumerate(self.note_ids) if note_id}
+        self.dead = len(self.note_ids) - len(self.rows)
+
+    def _rewrite(self, extra: int) -> None:
+        """
+        Переписывает файл без удалённых строк, с местом ещё под extra строк.
+        """
+        live = np.array(
+            [row for row, note_id in enumerate(self.note_ids) if note_id], dtype=np.int64
+        )
+        capacity = max(MIN_CAPACITY, 2 * (len(live) + extra))
+        _write_file(self.path, self.ids[live].tobytes(), self.vectors[live], capacity)
+        self._open()
+
+    def put(self, note_ids: list[uuid.UUID], matrix: np.ndarray) -> None:
+        new = []
+        for position, note_id in enumerate(note_ids):
+            row = self.rows.get(note_id)
+            if row is None:
+                new.append(position)
+            else:
+                self.vectors[row] = matrix[position]
+        if not new:
+            return
+
+        if len(self.note_ids) + len(new) > len(self.ids):
+            self._rewrite(len(new))
+        start = len(self.note_ids)
+        end = start + len(new)
+        self.vectors[start:end] = matrix[new]
+        self.ids[start:end] = np.frombuffer(
+            b"".join(note_ids[position].bytes for position in new), dtype="V16"
+        )
+        # Счётчик — последним: строка без id в индекс не попадает.
+        self.header[_H_COUNT] = end
+        for row, position in enumerate(new, start=start):
+            self.note_ids.append(note_ids[position])
+            self.rows[note_ids[position]] = row
+
+    def remove(self, note_id: uuid.UUID) -> bool:
+        row = self.rows.pop(note_id, None)
+        if row is None:
+            return False
+        self.vectors[row] = 0
+        self.ids[row] = np.void(_EMPTY_ID)
+        self.note_ids[row] = None
+        self.dead += 1
+        if self.dead >= COMPACT_MIN_DEAD and self.dead * 2 > len(self.note_ids):
+            self._rewrite(0)
+        return True
+
+    def top(self, note_id: uuid.UUID, k: int) -> list[tuple[uuid.UUID, float]]:
+        """
+        k ближайших по косинусу заметок (без самой note_id), лучшие первыми.
+        """
+        row = self.rows[note_id]
+        count = len(self.note_ids)
+        k = min(k, count - 1)
+        if k <= 0:
+            return []
+        scores = np.asarray(self.vectors[:count] @ self.vectors[row])
+        scores[row] = -1.0
+        best = np.argpartition(scores, -k)[-k:]
+        best = best[np.argsort(scores[best])[::-1]]
+        return [
+            (self.note_ids[i], float(scores[i]))
+            for i in best
+            if scores[i] >= MIN_SCORE and self.note_ids[i] is not None
+        ]
+
+    def flush(self) -> None:
+        self.header.flush()
+        self.ids.flush()
+        self.vectors.flush()
+
+
+def _lock(user_id: int) -> asyncio.Lock:
+    return _locks.setdefault(user_id, asyncio.Lock())
+
+
+def _drop(user_id: int, error: Exception) -> None:
+    """
+    Индекс не читается или не пишется — удаляем файл, следующий поиск
+    соберёт его из БД.
+    """
+    logger.warning("Similar notes index for user %s dropped: %s", user_id, error)
+    _indexes.pop(user_id, None)
+    _index_path(user_id).unlink(missing_ok=True)
+    _stats["dropped"] += 1
+
+
+async def _get_index(user_id: int) -> _Index | None:
+    """
+    Открытый индекс пользователя; None — файла нет.
+    """
+    index = _indexes.get(user_id)
+    if index is not None:
+        _indexes.move_to_end(user_id)
+        return index
+
+    path = _index_path(user_id)
+    if not path.exists():
+        return None
+    try:
+        index = await asyncio.to_thread(_Index, path)
+    except (OSError, ValueError) as e:
+        _drop(user_id, e)
+        return None
+
+    _indexes[user_id] = index
+    while len(_indexes) > SIMILAR_OPEN_INDEXES:
+        _, evicted = _indexes.popitem(last=False)
+        evicted.flush()
+    return index
+
+
+async def _rebuild(user_id: int) -> int:
+    note_ids = []
+    chunks = []
+    last_id = None
+    while True:
+        query = MeetingNote.filter(person__user_id=user_id).order_by("id")
+        if last_id is not None:
+            query = query.filter(id__gt=last_id)
+        rows = await query.limit(REBUILD_BATCH_SIZE).values_list("id", "raw_text")
+        if not rows:
+            break
+        chunks.append(await asyncio.to_thread(embed_many, [text for _, text in rows]))
+        note_ids.extend(_uuid(note_id) for note_id, _ in rows)
+        last_id = rows[-1][0]
+
+    vectors = (
+        np.concatenate(chunks) if chunks else np.zeros((0, SIMILAR_DIM), dtype=np.float32)
+    )
+    _indexes.pop(user_id, None)
+    await asyncio.to_thread(
+        _write_file,
+        _index_path(user_id),
+        b"".join(note_id.bytes for note_id in note_ids),
+        vectors,
+        max(MIN_CAPACITY, 2 * len(note_ids)),
+    )
+    _stats["rebuilds"] += 1
+    return len(note_ids)
+
+
+async def rebuild(user_id: int) -> int:
+    """
+    Собирает индекс пользователя заново по заметкам в БД. Возвращает число
+    заметок в индексе.
+    """
+    async with _lock(user_id):
+        return await _rebuild(user_id)
+
+
+async def update(user_id: int, notes: list[tuple]) -> None:
+    """
+    notes — пары (id заметки, текст): заметки созданы или их текст изменился.
+    Вызывает services/notes.py после транзакции. Индекса ещё нет — ничего не
+    делаем, его соберёт первый поиск.
+    """
+    if not notes:
+        return
+    async with _lock(user_id):
+        index = await _get_index(user_id)
+        if index is None:
+            return
+        matrix = await asyncio.to_thread(embed_many, [text for _, text in notes])
+        try:
+            await asyncio.to_thread(
+                index.put, [_uuid(note_id) for note_id, _ in notes], matrix
+            )
+        except (OSError, ValueError) as e:
+            _drop(user_id, e)
+            return
+    _stats["indexed"] += len(notes)
+
+
+async def remove(user_id: int, note_id) -> None:
+    async with _lock(user_id):
+        index = await _get_index(user_id)
+        if index is None:
+            return
+        try:
+            removed = await asyncio.to_thread(index.remove, _uuid(note_id))
+        except (OSError, ValueError) as e:
+            _drop(user_id, e)
+            return
+    if removed:
+        _stats["removed"] += 1
+
+
+async def similar_notes(user_id: int, note_id, k: int = TOP_K) -> list[tuple[uuid.UUID, float]]:
+    """
+    Похожие заметки пользователя по всем встречам: (id, косинус), лучшие
+    первыми. Заметка должна принадлежать пользователю.
+    """
+    note_id = _uuid(note_id)
+    started = time.perf_counter()
+    async with _lock(user_id):
+        index = await _get_index(user_id)
+        if index is None:
+            await _rebuild(user_id)
+            index = await _get_index(user_id)
+            if index is None:
+                return []
+        try:
+            if note_id not in index.rows:
+                # Заметку записали, пока файла не было, — дописываем её.
+                text = await (
+                    MeetingNote.filter(id=note_id).first().values_list("raw_text", flat=True)
+                )
+                if text is None:
+                    return []
+                await asyncio.to_thread(index.put, [note_id], embed_many([text]))
+            result = await asyncio.to_thread(index.top, note_id, k)
+        except (OSError, ValueError) as e:
+            _drop(user_id, e)
+            return []
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _stats["queries"] += 1
+    _stats["query_ms_max"] = max(_stats["query_ms_max"], round(elapsed_ms, 1))
+    return result
+
+
+def close() -> None:
+    """
+    Сбрасывает открытые индексы на диск (при остановке бота).
+    """
+    for index in _indexes.values():
+        index.flush()
+    _indexes.clear()
+
+
+def stats() -> dict:
+    return {**_stats, "open": len(_indexes)}
+
+
+metrics.register("similar", stats)
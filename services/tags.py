@@ -0,0 +1,202 @@
+from tortoise.expressions import F
+from tortoise.functions import Count
+from tortoise.transactions import in_transaction
+
+from database.models import MeetingNote, NoteTag, Tag
+from services import metrics
+
+# AICODE-NOTE: Хештеги разбора хранятся и в ai_summary["tags"] (для показа
+# и поиска), и строками tags/note_tags — для списка тегов со счётчиками и
+# заметок по тегу без разбора JSON. sync вызывается в транзакции записи
+# разбора (services/notes.apply_analysis) и меняет Tag.notes_count только на
+# разницу старых и новых тегов заметки.
+
+TAG_MAX_LENGTH = 64
+MAX_NOTE_TAGS = 10
+REBUILD_BATCH_SIZE = 500
+
+_stats = {"synced_notes": 0, "links_added": 0, "links_removed": 0}
+
+
+def normalize_tag(raw) -> str | None:
+    """
+    «#Выгорание», «выгорание» и «# выгорание» — один тег «выгорание».
+    """
+    text = "_".join(str(raw or "").strip().lstrip("#").lower().split())
+    name = "".join(ch if (ch.isalnum() or ch in "_-") else "_" for ch in text)
+    name = name.strip("_-")[:TAG_MAX_LENGTH]
+    return name or None
+
+
+def note_tags(meeting_tag: str, llm_tags) -> list[str]:
+    """
+    Теги заметки для ai_summary: тег встречи и хештеги от LLM,
+    нормализованные, без повторов, не больше MAX_NOTE_TAGS.
+    """
+    names: list[str] = []
+    for raw in [meeting_tag, *(llm_tags or [])]:
+        name = normalize_tag(raw)
+        if name and name not in names:
+            names.append(name)
+    return [f"#{name}" for name in names[:MAX_NOTE_TAGS]]
+
+
+def _names(tags) -> set[str]:
+    return {name for name in map(normalize_tag, tags or []) if name}
+
+
+async def _tag_ids(user_id: int, names: set[str]) -> dict[str, int]:
+    if not names:
+        return {}
+    ids = dict(
+        await Tag.filter(user_id=user_id, name__in=list(names)).values_list("name", "id")
+    )
+    missing = names - ids.keys()
+    if missing:
+        # Тег мог появиться в параллельной транзакции — конфликт не ошибка.
+        await Tag.bulk_create(
+            [Tag(user_id=user_id, name=name) for name in missing],
+            ignore_conflicts=True,
+        )
+        ids.update(
+            await Tag.filter(user_id=user_id, name__in=list(missing)).values_list(
+                "name", "id"
+            )
+        )
+    return ids
+
+
+async def _shift_counts(tag_ids, delta: int) -> None:
+    if tag_ids:
+        await Tag.filter(id__in=list(tag_ids)).update(notes_count=F("notes_count") + delta)
+
+
+async def sync(note: MeetingNote, tags) -> None:
+    """
+    Приводит связи заметки к тегам разбора. note.person должен быть
+    загружен. Вызывается внутри транзакции записи разбора.
+    """
+    new_ids = set((await _tag_ids(note.person.user_id, _names(tags))).values())
+    old_ids = set(
+        await NoteTag.filter(note_id=note.id).values_list("tag_id", flat=True)
+    )
+
+    removed = old_ids - new_ids
+    added = new_ids - old_ids
+    if removed:
+        await NoteTag.filter(note_id=note.id, tag_id__in=list(removed)).delete()
+        await _shift_counts(removed, -1)
+    if added:
+        await NoteTag.bulk_create(
+            [
+                NoteTag(note_id=note.id, tag_id=tag_id, created_at=note.created_at)
+                for tag_id in added
+            ]
+        )
+        await _shift_counts(added, 1)
+    _stats["synced_notes"] += 1
+    _stats["links_added"] += len(added)
+    _stats["links_removed"] += len(removed)
+
+
+async def forget(note_id) -> None:
+    """
+    Заметку удаляют: убираем связи и уменьшаем счётчики её тегов.
+    """
+    tag_ids = await NoteTag.filter(note_id=note_id).values_list("tag_id", flat=True)
+    if not tag_ids:
+        return
+    await NoteTag.filter(note_id=note_id).delete()
+    await _shift_counts(tag_ids, -1)
+    _stats["links_removed"] += len(tag_ids)
+
+
+async def user_tags(user_id: int, *, limit: int, offset: int = 0) -> list[dict]:
+    """
+    Теги пользователя, у которых есть заметки: частые — первыми.
+    """
+    return await (
+        Tag.filter(user_id=user_id, notes_count__gt=0)
+        .order_by("-notes_count", "name")
+        .offset(offset)
+        .limit(limit)
+        .values("id", "name", "notes_count")
+    )
+
+
+async def get_user_tag(user_id: int, tag_id: int) -> Tag | None:
+    return await Tag.get_or_none(id=tag_id, user_id=user_id)
+
+
+async def tag_note_ids(tag_id: int, *, limit: int, offset: int = 0) -> list[str]:
+    """
+    id заметок тега от новых к старым (индекс idx_note_tags_tag_created).
+    """
+    note_ids = await (
+        NoteTag.filter(tag_id=tag_id)
+        .order_by("-created_at", "-note_id")
+        .offset(offset)
+        .limit(limit)
+        .values_list("note_id", flat=True)
+    )
+    return [str(note_id) for note_id in note_ids]
+
+
+async def rebuild() -> int:
+    """
+    Пересобирает связи по ai_summary всех заметок и пересчитывает счётчики
+    (для базы, где разборы были до таблиц тегов, и для починки). Возвращает
+    число связей.
+    """
+    total = 0
+    last_id = None
+    while True:
+        query = MeetingNote.filter(ai_summary__isnull=False).order_by("id")
+        if last_id is not None:
+            query = query.filter(id__gt=last_id)
+        rows = await query.limit(REBUILD_BATCH_SIZE).values(
+            "id", "person__user_id", "created_at", "ai_summary"
+        )
+        if not rows:
+            break
+
+        row_names = [_names((row["ai_summary"] or {}).get("tags")) for row in rows]
+        wanted: dict[int, set[str]] = {}
+        for row, names in zip(rows, row_names):
+            wanted.setdefault(row["person__user_id"], set()).update(names)
+        ids = {
+            user_id: await _tag_ids(user_id, names) for user_id, names in wanted.items()
+        }
+
+        links = []
+        for row, names in zip(rows, row_names):
+            user_ids = ids[row["person__user_id"]]
+            links.extend(
+                NoteTag(note_id=row["id"], tag_id=user_ids[name], created_at=row["created_at"])
+                for name in names
+            )
+        async with in_transaction():
+            await NoteTag.filter(note_id__in=[row["id"] for row in rows]).delete()
+            if links:
+                await NoteTag.bulk_create(links)
+        total += len(links)
+        last_id = rows[-1]["id"]
+
+    # Починка — единственное место, где счётчики считаются группировкой.
+    counts = dict(
+        await NoteTag.annotate(count=Count("id"))
+        .group_by("tag_id")
+        .values_list("tag_id", "count")
+    )
+    async with in_transaction():
+        await Tag.all().update(notes_count=0)
+        for tag_id, count in counts.items():
+            await Tag.filter(id=tag_id).update(notes_count=count)
+    return total
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+metrics.register("tags", stats)
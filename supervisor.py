@@ -0,0 +1,359 @@
+"""
+Несколько процессов бота на одном хосте.
+
+    python supervisor.py
+
+Supervisor получает апдейты (long polling или вебхук — по BOT_MODE) и
+раздаёт их SUPERVISOR_WORKERS процессам bot.py. Каждый воркер — обычный
+bot.py в режиме вебхука на 127.0.0.1:SUPERVISOR_BASE_PORT+i. Воркер
+выбирается консистентным хешем от id пользователя, поэтому FSM-диалог и
+кэши пользователя живут в одном процессе. Упавший воркер перезапускается,
+апдейты для него ждут в очереди.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError
+from aiohttp import web
+
+from config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    SUPERVISOR_BASE_PORT,
+    SUPERVISOR_MAX_QUEUE,
+    SUPERVISOR_REPORT_SECONDS,
+    SUPERVISOR_WORKERS,
+    WEBHOOK_DRAIN_SECONDS,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from utils.hash_ring import HashRing
+from webhook import SECRET_HEADER
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+logger = logging.getLogger("supervisor")
+
+BOT_SCRIPT = Path(__file__).with_name("bot.py")
+POLL_TIMEOUT_SECONDS = 25
+
+
+def routing_key(update: dict) -> int:
+    """
+    id пользователя из апдейта (message.from, callback_query.from,
+    poll_answer.user, ...); без пользователя — id чата или update_id.
+    """
+    for field, event in update.items():
+        if not isinstance(event, dict):
+            continue
+        for user_field in ("from", "user"):
+            user = event.get(user_field)
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+class WorkerProcess:
+    def __init__(self, index: int, secret: str):
+        self.index = index
+        self.port = SUPERVISOR_BASE_PORT + index
+        self.url = f"http://127.0.0.1:{self.port}{WEBHOOK_PATH}"
+        self._secret = secret
+        self.process: asyncio.subprocess.Process | None = None
+        # Сырые апдейты (JSON) в порядке поступления.
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue()
+        self.delivered = 0
+        self.dropped = 0
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        env = {
+            **os.environ,
+            "BOT_MODE": "webhook",
+            # Вебхук в Telegram регистрирует supervisor, а не воркер.
+            "WEBHOOK_URL": "",
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(self.port),
+            "WEBHOOK_SECRET": self._secret,
+            "WORKER_ID": str(self.index),
+        }
+        # Своя сессия: Ctrl+C в терминале получает только supervisor, а
+        # воркеры останавливаются им по порядку (после раздачи очередей).
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, str(BOT_SCRIPT), env=env, start_new_session=True
+        )
+        logger.info("Worker %s started (pid %s)", self.index, self.process.pid)
+
+    async def send_loop(self, session: aiohttp.ClientSession) -> None:
+        """
+        Доставляет апдейты по одному, сохраняя порядок. Пока воркер
+        недоступен или занят (503), повторяет тот же апдейт.
+        """
+        headers = {SECRET_HEADER: self._secret, "Content-Type": "application/json"}
+        while True:
+            payload = await self.queue.get()
+            delay = 0.2
+            while True:
+                try:
+                    async with session.post(self.url, data=payload, headers=headers) as resp:
+                        status = resp.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    status = None
+
+                if status == 200:
+                    self.delivered += 1
+                    break
+                if status in (400, 401):
+                    self.dropped += 1
+                    logger.error("Worker %s rejected update (%s)", self.index, status)
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2)
+            self.queue.task_done()
+
+    async def fetch_health(self, session: aiohttp.ClientSession) -> dict | None:
+        try:
+            async with session.get(
+                f"http://127.0.0.1:{self.port}/healthz",
+                timeout=aiohttp.ClientTimeout(total=1),
+            ) as resp:
+                return await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "pid": self.process.pid if self.process else None,
+            "port": self.port,
+            "alive": self.alive,
+            "queued": self.queue.qsize(),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "restarts": self.restarts,
+        }
+
+
+class Supervisor:
+    def __init__(self, workers: int = SUPERVISOR_WORKERS):
+        # Секрет между supervisor и воркерами; свой на каждый запуск.
+        internal_secret = secrets.token_urlsafe(32)
+        self.workers = [WorkerProcess(i, internal_secret) for i in range(workers)]
+        self._ring = HashRing(range(workers))
+        self._stopping = False
+        self._tasks: list[asyncio.Task] = []
+        self._session: aiohttp.ClientSession | None = None
+
+    def worker_for(self, update: dict) -> WorkerProcess:
+        return self.workers[self._ring.node_for(routing_key(update))]
+
+    def _queues_full(self) -> bool:
+        return any(w.queue.qsize() >= SUPERVISOR_MAX_QUEUE for w in self.workers)
+
+    async def _watch(self, worker: WorkerProcess) -> None:
+        backoff = 1.0
+        while not self._stopping:
+            await worker.start()
+            started = time.monotonic()
+            code = await worker.process.wait()
+            if self._stopping:
+                return
+            worker.restarts += 1
+            if time.monotonic() - started > 60:
+                backoff = 1.0
+            logger.warning(
+                "Worker %s exited with %s, restarting in %.0fs",
+                worker.index,
+                code,
+                backoff,
+            )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    async def _poll(self, bot: Bot, allowed_updates: list[str]) -> None:
+        offset = None
+        backoff = 1.0
+        try:
+            while True:
+                # Воркеры не успевают — не забираем новые апдейты, они
+                # подождут в Telegram.
+                while self._queues_full():
+                    await asyncio.sleep(0.1)
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset,
+                        timeout=POLL_TIMEOUT_SECONDS,
+                        allowed_updates=allowed_updates,
+                    )
+                except (TelegramAPIError, TelegramNetworkError) as e:
+                    logger.warning("getUpdates failed: %s", e)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30)
+                    continue
+                backoff = 1.0
+                for update in updates:
+                    raw = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+                    self.worker_for(raw).queue.put_nowait(json.dumps(raw).encode())
+                    offset = update.update_id + 1
+        finally:
+            if offset is not None:
+                # Подтверждаем полученное, иначе после рестарта оно придёт снова.
+                try:
+                    await bot.get_updates(offset=offset, timeout=0, limit=1)
+                except (TelegramAPIError, TelegramNetworkError):
+                    pass
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+            return web.Response(status=401)
+        if self._stopping:
+            return web.Response(status=503)
+
+        payload = await request.read()
+        try:
+            update = json.loads(payload)
+        except ValueError:
+            return web.Response(status=400)
+
+        worker = self.worker_for(update)
+        if worker.queue.qsize() >= SUPERVISOR_MAX_QUEUE:
+            # Telegram повторит доставку позже.
+            return web.Response(status=503)
+        worker.queue.put_nowait(payload)
+        return web.Response()
+
+    async def stats(self) -> dict:
+        health = await asyncio.gather(
+            *(w.fetch_health(self._session) for w in self.workers)
+        )
+        return {
+            "workers": [
+                {**w.stats(), "in_flight": (h or {}).get("in_flight")}
+                for w, h in zip(self.workers, health)
+            ]
+        }
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(await self.stats())
+
+    async def _report_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISOR_REPORT_SECONDS)
+            logger.info(
+                "Workers: %s",
+                ", ".join(
+                    f"#{w.index} queued={w.queue.qsize()} delivered={w.delivered} "
+                    f"restarts={w.restarts}{'' if w.alive else ' DOWN'}"
+                    for w in self.workers
+                ),
+            )
+
+    async def run(self, stop_event: asyncio.Event | None = None) -> None:
+        if stop_event is None:
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                loop.add_signal_handler(sig, stop_event.set)
+
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        bot = Bot(token=BOT_TOKEN)
+
+        app = web.Application()
+        app.router.add_get("/healthz", self.handle_health)
+        if BOT_MODE == "webhook":
+            app.router.add_post(WEBHOOK_PATH, self.handle_webhook)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+        watchers = [asyncio.create_task(self._watch(w)) for w in self.workers]
+        self._tasks = [
+            asyncio.create_task(w.send_loop(self._session)) for w in self.workers
+        ]
+        self._tasks.append(asyncio.create_task(self._report_loop()))
+
+        # AICODE-NOTE: Локальный импорт — список типов апдейтов берём из
+        # роутеров бота, остальное supervisor'у от бота не нужно.
+        from bot import setup_dispatcher
+
+        allowed_updates = setup_dispatcher().resolve_used_update_types()
+        ingress: asyncio.Task | None = None
+        if BOT_MODE == "webhook":
+            if WEBHOOK_URL:
+                await bot.set_webhook(
+                    WEBHOOK_URL + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=allowed_updates,
+                )
+        else:
+            ingress = asyncio.create_task(self._poll(bot, allowed_updates))
+        logger.info(
+            "Supervisor: %s workers, %s ingress, status on %s:%s/healthz",
+            len(self.workers),
+            BOT_MODE,
+            WEBHOOK_HOST,
+            WEBHOOK_PORT,
+        )
+
+        try:
+            await stop_event.wait()
+        finally:
+            logger.info("Stopping supervisor...")
+            self._stopping = True
+            if ingress:
+                ingress.cancel()
+                await asyncio.gather(ingress, return_exceptions=True)
+
+            # Дораздаём принятые апдейты, пока воркеры живы.
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(w.queue.join() for w in self.workers)),
+                    WEBHOOK_DRAIN_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Dropping %s undelivered updates",
+                    sum(w.queue.qsize() for w in self.workers),
+                )
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+            # Воркеры сами дожидаются своих хендлеров (webhook.py) по SIGTERM.
+            for worker in self.workers:
+                if worker.alive:
+                    worker.process.terminate()
+            await asyncio.wait(watchers, timeout=WEBHOOK_DRAIN_SECONDS + 10)
+            for worker in self.workers:
+                if worker.alive:
+                    logger.warning("Killing worker %s", worker.index)
+                    worker.process.kill()
+            await asyncio.gather(*watchers, return_exceptions=True)
+
+            await runner.cleanup()
+            await self._session.close()
+            await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(Supervisor().run())
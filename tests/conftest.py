@@ -0,0 +1,31 @@
+import asyncio
+import inspect
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Конфиг читается при импорте: задаём окружение до импорта модулей бота.
+# Тестам не нужны ни Telegram, ни OpenAI, ни файлы рабочего каталога.
+_TMP = Path(tempfile.mkdtemp(prefix="vibe-tests-"))
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+os.environ.setdefault("SIMILAR_INDEX_DIR", str(_TMP / "similar"))
+os.environ.setdefault("CHART_CACHE_DIR", str(_TMP / "charts"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def pytest_pyfunc_call(pyfuncitem):
+    """
+    async def test_* выполняются в своём цикле событий — без pytest-asyncio.
+    """
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    arguments = {
+        name: pyfuncitem.funcargs[name]
+        for name in pyfuncitem._fixtureinfo.argnames
+    }
+    asyncio.run(pyfuncitem.obj(**arguments))
+    return True
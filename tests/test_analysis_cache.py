@@ -0,0 +1,18 @@
+from services.analysis_cache import make_key, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text("  Текст  \r\nвторая строка   \r\n\n") == "Текст\nвторая строка"
+    # NFD «й» (и + кратка) и NFC «й» — один и тот же текст.
+    assert normalize_text("\u0438\u0306") == normalize_text("\u0439")
+    assert normalize_text(None) == ""
+
+
+def test_key_ignores_formatting_but_not_prompt_or_model():
+    key = make_key("Текст\n", "prompt", "gpt")
+
+    assert make_key("Текст  \r\n", "prompt", "gpt") == key
+    assert make_key("Текст", "prompt 2", "gpt") != key
+    assert make_key("Текст", "prompt", "gpt-2") != key
+    # Разделитель частей: сдвиг границы между ними меняет ключ.
+    assert make_key("ab", "c", "gpt") != make_key("a", "bc", "gpt")
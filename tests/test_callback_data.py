@@ -0,0 +1,27 @@
+import uuid
+
+import pytest
+
+from utils.callback_data import pack_uuid, unpack_uuid
+
+
+def test_pack_roundtrip():
+    value = uuid.uuid4()
+
+    packed = pack_uuid(value)
+
+    assert len(packed) == 22
+    assert unpack_uuid(packed) == value
+    assert pack_uuid(str(value)) == packed
+
+
+def test_unpack_accepts_full_uuid_from_old_buttons():
+    value = uuid.uuid4()
+
+    assert unpack_uuid(str(value)) == value
+
+
+@pytest.mark.parametrize("value", ["", "short", "!" * 22, "not-a-uuid-" * 3])
+def test_unpack_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        unpack_uuid(value)
@@ -0,0 +1,74 @@
+import contextlib
+from datetime import date, datetime, timezone
+
+from database.db import close_db, init_db
+from database.models import DigestPartial, MeetingNote, Person, User
+from services import digests, notes
+
+LONG_TEXT = "Обсудили релиз и сроки тестирования. " * 2000
+
+
+@contextlib.asynccontextmanager
+async def database():
+    await init_db()
+    try:
+        yield
+    finally:
+        await close_db()
+
+
+def test_source_text_uses_summary_only_for_analyzed_long_notes():
+    analysis = {"summary": "Итог"}
+
+    assert digests.source_text(LONG_TEXT, analysis, notes.ANALYSIS_DONE) == "Итог"
+    assert digests.source_text(LONG_TEXT, None, notes.ANALYSIS_PENDING) == LONG_TEXT
+    assert digests.source_text(LONG_TEXT, analysis, notes.ANALYSIS_FAILED) == LONG_TEXT
+    assert digests.source_text("коротко", analysis, notes.ANALYSIS_DONE) == "коротко"
+
+
+def test_utc_week():
+    moment = datetime(2024, 3, 10, 23, 30, tzinfo=timezone.utc)
+
+    assert digests._utc_week(moment) == date(2024, 3, 4)
+    assert digests._week_bounds(date(2024, 3, 4))[1] == datetime(
+        2024, 3, 11, tzinfo=timezone.utc
+    )
+
+
+async def _partial_for(note: MeetingNote) -> None:
+    await DigestPartial.create(
+        person_id=note.person_id,
+        week_start=digests._utc_week(note.created_at),
+        notes_count=1,
+        fingerprint="test",
+        summary={"summary": "по сырому тексту"},
+    )
+
+
+async def _analyze(note: MeetingNote) -> None:
+    note = await MeetingNote.get(id=note.id).prefetch_related("person")
+    await notes.apply_analysis(note, {"mood": 6, "summary": "Итог", "action_items": []})
+
+
+async def test_analysis_of_long_note_invalidates_its_week():
+    async with database():
+        user = await User.create(id=1)
+        person = await Person.create(user=user, name="Bob")
+        note = await notes.create_note(person, LONG_TEXT)
+        await _partial_for(note)
+
+        await _analyze(note)
+
+        assert await DigestPartial.filter(person=person).count() == 0
+
+
+async def test_analysis_of_short_note_keeps_its_week():
+    async with database():
+        user = await User.create(id=1)
+        person = await Person.create(user=user, name="Bob")
+        note = await notes.create_note(person, "коротко")
+        await _partial_for(note)
+
+        await _analyze(note)
+
+        assert await DigestPartial.filter(person=person).count() == 1
@@ -0,0 +1,36 @@
+import pytest
+
+from utils.hash_ring import HashRing
+
+
+def test_needs_nodes():
+    with pytest.raises(ValueError):
+        HashRing([])
+
+
+def test_key_always_maps_to_the_same_node():
+    ring = HashRing([0, 1, 2])
+    again = HashRing([0, 1, 2])
+
+    assert all(ring.node_for(key) == again.node_for(key) for key in range(1000))
+
+
+def test_keys_are_spread_over_nodes():
+    ring = HashRing([0, 1, 2, 3])
+
+    counts = {node: 0 for node in range(4)}
+    for key in range(10000):
+        counts[ring.node_for(key)] += 1
+
+    assert all(1500 < count < 3500 for count in counts.values())
+
+
+def test_adding_a_node_moves_few_keys():
+    before = HashRing([0, 1, 2, 3])
+    after = HashRing([0, 1, 2, 3, 4])
+
+    moved = [key for key in range(10000) if before.node_for(key) != after.node_for(key)]
+
+    # В идеале переезжает 1/5 ключей — и только на новый узел.
+    assert len(moved) < 10000 * 0.3
+    assert all(after.node_for(key) == 4 for key in moved)
@@ -0,0 +1,121 @@
+import contextlib
+from datetime import datetime, timedelta, timezone
+
+from database.db import close_db, init_db
+from database.models import MeetingNote, Person, User
+from handlers.notes import HISTORY_PAGE_SIZE, _fetch_history_notes, _legacy_page_cursor
+from keyboards.history_kb import CURSOR_AT, CURSOR_NEWER, CURSOR_OLDER
+from utils.callback_data import pack_uuid
+
+START = datetime(2024, 3, 4, 9, 0, tzinfo=timezone.utc)
+
+
+@contextlib.asynccontextmanager
+async def database():
+    await init_db()
+    try:
+        yield
+    finally:
+        await close_db()
+
+
+async def _person_with_notes(count: int) -> tuple[int, list]:
+    """
+    Возвращает id встречи и id заметок от новых к старым. Заметки идут
+    парами с одинаковым created_at — порядок внутри пары решает id.
+    """
+    user = await User.create(id=1)
+    person = await Person.create(user=user, name="Bob")
+    for i in range(count):
+        note = await MeetingNote.create(person=person, raw_text=f"note {i}")
+        await MeetingNote.filter(id=note.id).update(
+            created_at=START + timedelta(hours=i // 2)
+        )
+    ordered = await (
+        MeetingNote.filter(person=person)
+        .order_by("-created_at", "-id")
+        .values_list("id", flat=True)
+    )
+    return person.id, ordered
+
+
+def _ids(notes: list[dict]) -> list:
+    return [note["id"] for note in notes]
+
+
+async def test_first_page():
+    async with database():
+        person_id, ordered = await _person_with_notes(HISTORY_PAGE_SIZE + 2)
+
+        notes, page, has_newer, has_older = await _fetch_history_notes(person_id, 0, None)
+
+        assert _ids(notes) == ordered[:HISTORY_PAGE_SIZE]
+        assert (page, has_newer, has_older) == (0, False, True)
+
+
+async def test_walk_older_then_newer_visits_every_note_once():
+    async with database():
+        person_id, ordered = await _person_with_notes(HISTORY_PAGE_SIZE * 3 + 2)
+
+        pages = []
+        notes, page, _, has_older = await _fetch_history_notes(person_id, 0, None)
+        pages.append(_ids(notes))
+        while has_older:
+            cursor = CURSOR_OLDER + pack_uuid(notes[-1]["id"])
+            notes, page, _, has_older = await _fetch_history_notes(
+                person_id, page + 1, cursor
+            )
+            pages.append(_ids(notes))
+
+        assert [note_id for ids in pages for note_id in ids] == ordered
+        assert page == 3
+
+        has_newer = True
+        back = [pages[-1]]
+        while has_newer:
+            cursor = CURSOR_NEWER + pack_uuid(notes[0]["id"])
+            notes, page, has_newer, has_older = await _fetch_history_notes(
+                person_id, page - 1, cursor
+            )
+            assert has_older
+            back.append(_ids(notes))
+
+        assert page == 0
+        assert back == list(reversed(pages))
+
+
+async def test_cursor_at_starts_with_anchor():
+    async with database():
+        person_id, ordered = await _person_with_notes(HISTORY_PAGE_SIZE * 2)
+
+        notes, page, has_newer, _ = await _fetch_history_notes(
+            person_id, 1, CURSOR_AT + pack_uuid(ordered[3])
+        )
+
+        assert _ids(notes) == ordered[3:3 + HISTORY_PAGE_SIZE]
+        assert (page, has_newer) == (1, True)
+
+
+async def test_deleted_anchor_gives_empty_page_and_bad_cursor_the_first():
+    async with database():
+        person_id, ordered = await _person_with_notes(HISTORY_PAGE_SIZE + 2)
+        await MeetingNote.filter(id=ordered[2]).delete()
+
+        notes, _, _, _ = await _fetch_history_notes(
+            person_id, 1, CURSOR_OLDER + pack_uuid(ordered[2])
+        )
+        assert notes == []
+
+        left = ordered[:2] + ordered[3:]
+        notes, page, _, _ = await _fetch_history_notes(person_id, 4, "o-not-a-uuid")
+        assert (_ids(notes), page) == (left[:HISTORY_PAGE_SIZE], 0)
+
+
+async def test_legacy_page_number_is_turned_into_cursor():
+    async with database():
+        person_id, ordered = await _person_with_notes(HISTORY_PAGE_SIZE * 2 + 1)
+
+        assert await _legacy_page_cursor(person_id, 0) is None
+        cursor = await _legacy_page_cursor(person_id, 2)
+        assert cursor == CURSOR_AT + pack_uuid(ordered[HISTORY_PAGE_SIZE * 2])
+        assert await _legacy_page_cursor(person_id, 3) is None
@@ -0,0 +1,78 @@
+from services.llm import _dedupe, _merge_locally, is_long_note, split_into_chunks
+from utils.tokens import estimate_tokens
+
+
+def _words(text: str) -> list[str]:
+    return text.split()
+
+
+def test_short_text_is_one_chunk():
+    text = "Первый абзац.\n\nВторой абзац."
+
+    assert split_into_chunks(text, max_tokens=100) == ["Первый абзац.\n\nВторой абзац."]
+
+
+def test_chunks_follow_paragraphs_and_fit_the_limit():
+    paragraphs = [f"Абзац {i}: " + "обсудили релиз и сроки. " * 20 for i in range(10)]
+    text = "\n\n".join(paragraphs)
+
+    chunks = split_into_chunks(text, max_tokens=200)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    # Абзацы не рвутся, если помещаются целиком.
+    assert all(chunk.startswith("Абзац") for chunk in chunks)
+    assert _words(" ".join(chunks)) == _words(text)
+
+
+def test_oversized_paragraph_is_split_by_sentences():
+    paragraph = " ".join(f"Предложение номер {i} про задачи." for i in range(200))
+
+    chunks = split_into_chunks(paragraph, max_tokens=100)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert _words(" ".join(chunks)) == _words(paragraph)
+
+
+def test_text_without_sentences_is_split_by_words():
+    text = "слово " * 1000
+
+    chunks = split_into_chunks(text, max_tokens=50)
+
+    assert all(estimate_tokens(chunk) <= 50 for chunk in chunks)
+    assert _words(" ".join(chunks)) == _words(text)
+
+
+def test_is_long_note_uses_threshold():
+    assert not is_long_note("коротко")
+    assert is_long_note("слово " * 10000)
+
+
+def test_merge_locally_weights_mood_by_chunk_size():
+    partials = [
+        {"mood": 2, "mood_text": "тяжело", "summary": "Начало.", "positive": None},
+        {"mood": 8, "mood_text": "бодро", "summary": "Конец.", "negative": "Сроки."},
+    ]
+
+    merged = _merge_locally(partials, weights=[1, 3])
+
+    assert merged["mood"] == round((2 * 1 + 8 * 3) / 4)
+    assert merged["mood_text"] == "бодро"
+    assert merged["summary"] == "Начало. Конец."
+    assert merged["positive"] is None
+    assert merged["negative"] == "Сроки."
+
+
+def test_merge_locally_skips_missing_moods():
+    merged = _merge_locally([{"mood": None}, {"mood": 6}], weights=[10, 1])
+
+    assert merged["mood"] == 6
+    assert _merge_locally([{}], weights=[1])["mood"] is None
+
+
+def test_dedupe_ignores_case_and_spacing():
+    items = ["Сделать отчёт", "сделать  отчёт", "", "Созвон", "Сделать отчёт "]
+
+    assert _dedupe(items) == ["Сделать отчёт", "Созвон"]
@@ -0,0 +1,184 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from services import llm_gateway
+from services.llm_gateway import (
+    CircuitBreaker,
+    LLMError,
+    LLMGateway,
+    LLMUnavailableError,
+    TokenBucket,
+)
+
+
+def _open_breaker(breaker: CircuitBreaker) -> None:
+    """
+    Переводит breaker в open с уже истёкшим reset_timeout — следующий
+    запрос станет пробным.
+    """
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker._opened_at = time.monotonic() - breaker.reset_timeout - 1
+
+
+def _connection_error() -> openai.APIConnectionError:
+    # Запрос нужен только для сообщения об ошибке.
+    return openai.APIConnectionError(request=None)
+
+
+async def test_token_bucket_takes_from_capacity_without_waiting():
+    bucket = TokenBucket(60)
+
+    await bucket.acquire(60)
+
+    assert bucket.state()["available"] == pytest.approx(0, abs=0.1)
+    assert bucket.waits == 0
+
+
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(6000, capacity=1)
+    await bucket.acquire(1)
+
+    started = time.monotonic()
+    await bucket.acquire(1)
+
+    assert bucket.waits == 1
+    # 100 единиц в секунду — одна единица за ~10 мс.
+    assert time.monotonic() - started < 0.5
+
+
+def test_token_bucket_adjust_can_go_negative_but_not_over_capacity():
+    bucket = TokenBucket(60)
+
+    bucket.adjust(100)
+    assert bucket.state()["available"] < 0
+
+    bucket.adjust(-1000)
+    assert bucket.state()["available"] == bucket.capacity
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 1
+    with pytest.raises(LLMUnavailableError) as error:
+        breaker.check()
+    assert 0 < error.value.retry_after <= 30
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_lets_one_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    _open_breaker(breaker)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.check() is True
+    with pytest.raises(LLMUnavailableError):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.check() is False
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    _open_breaker(breaker)
+    breaker.check()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 2
+
+
+async def test_gateway_retries_retryable_errors(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_RETRY_MAX_SECONDS", 0)
+    gateway = LLMGateway(max_retries=2)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _connection_error()
+        return "ok"
+
+    assert await gateway.call(flaky, estimated_tokens=10) == "ok"
+    assert len(calls) == 3
+    assert gateway.stats["retries"] == 2
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_gateway_does_not_retry_other_errors():
+    gateway = LLMGateway()
+    calls = []
+
+    async def broken():
+        calls.append(1)
+        raise ValueError("bad response")
+
+    with pytest.raises(LLMError):
+        await gateway.call(broken, estimated_tokens=10)
+    assert len(calls) == 1
+    assert gateway.breaker.snapshot()["consecutive_failures"] == 0
+
+
+async def test_cancelled_probe_waiting_for_slot_is_released():
+    gateway = LLMGateway(requests_per_minute=60, tokens_per_minute=1000, max_concurrency=1)
+    _open_breaker(gateway.breaker)
+    await gateway._semaphore.acquire()
+
+    async def answer():
+        return "ok"
+
+    probe = asyncio.create_task(gateway.call(answer, estimated_tokens=100))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    gateway._semaphore.release()
+
+    assert gateway.breaker._probe_in_flight is False
+    assert gateway.requests.state()["available"] == pytest.approx(60, abs=0.1)
+    assert gateway.tokens.state()["available"] == pytest.approx(1000, abs=0.1)
+    assert gateway.snapshot()["in_flight"] == 0
+    # Следующий запрос — снова пробный, а не LLMUnavailableError.
+    assert await gateway.call(answer, estimated_tokens=100) == "ok"
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_cancelled_call_does_not_release_someone_elses_probe():
+    gateway = LLMGateway(max_concurrency=1)
+    await gateway._semaphore.acquire()
+
+    async def answer():
+        return "ok"
+
+    waiting = asyncio.create_task(gateway.call(answer, estimated_tokens=10))
+    await asyncio.sleep(0.01)
+    # Пока запрос ждал слот, breaker открылся и ушёл в half_open с пробой.
+    _open_breaker(gateway.breaker)
+    assert gateway.breaker.check() is True
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert gateway.breaker._probe_in_flight is True
@@ -0,0 +1,41 @@
+from datetime import date, datetime, timedelta, timezone
+
+from services.mood_rollups import MoodStats, _from_moods, _merge, week_start
+
+START = datetime(2024, 3, 4, 9, 0, tzinfo=timezone.utc)
+
+
+def _rows(moods: list[int]) -> list[tuple[int, datetime]]:
+    return [(mood, START + timedelta(hours=12 * i)) for i, mood in enumerate(moods)]
+
+
+def test_from_moods():
+    stats = _from_moods(_rows([5, 2, 9, 4]))
+
+    assert stats == MoodStats(4, 20, 2, 9, 4, START + timedelta(hours=36))
+    assert stats.mean == 5
+    assert _from_moods([]) is None
+
+
+def test_merging_parts_equals_aggregating_all_rows():
+    rows = _rows([3, 8, 5, 9, 2, 6, 7, 4, 10, 1])
+    parts = [_from_moods(rows[:3]), _from_moods(rows[3:4]), _from_moods(rows[4:])]
+
+    assert _merge(parts) == _from_moods(rows)
+
+
+def test_merge_keeps_last_mood_of_latest_part():
+    early = _from_moods(_rows([1, 10]))
+    late = MoodStats(1, 5, 5, 5, 5, START + timedelta(days=30))
+
+    merged = _merge([early, late])
+
+    assert (merged.last_mood, merged.last_at) == (5, late.last_at)
+    assert (merged.min_mood, merged.max_mood) == (1, 10)
+    assert _merge([]) is None
+
+
+def test_week_start_is_monday():
+    assert week_start(date(2024, 3, 4)) == date(2024, 3, 4)
+    assert week_start(date(2024, 3, 10)) == date(2024, 3, 4)
+    assert week_start(date(2024, 3, 11)) == date(2024, 3, 11)
@@ -0,0 +1,58 @@
+import json
+
+from utils.partial_json import parse_partial_json
+
+
+def test_complete_object():
+    assert parse_partial_json('{"mood": 7, "summary": "ok"}') == {"mood": 7, "summary": "ok"}
+
+
+def test_not_an_object():
+    assert parse_partial_json("") == {}
+    assert parse_partial_json("[1, 2]") == {}
+    assert parse_partial_json("Ответ: {") == {}
+
+
+def test_unfinished_string_is_shown():
+    assert parse_partial_json('{"mood": 7, "summary": "Обсудили ре') == {
+        "mood": 7,
+        "summary": "Обсудили ре",
+    }
+
+
+def test_dangling_escape_is_dropped():
+    assert parse_partial_json('{"summary": "строка\\') == {"summary": "строка"}
+
+
+def test_unfinished_number_and_literal_are_dropped():
+    # "1" может оказаться началом "10".
+    assert parse_partial_json('{"summary": "s", "mood": 1') == {"summary": "s"}
+    assert parse_partial_json('{"summary": "s", "done": tr') == {"summary": "s"}
+
+
+def test_key_without_value_is_dropped():
+    assert parse_partial_json('{"mood": 5, "summ') == {"mood": 5}
+    assert parse_partial_json('{"mood": 5, "summary":') == {"mood": 5}
+
+
+def test_unfinished_list():
+    assert parse_partial_json('{"action_items": ["Отчёт", "Созв') == {
+        "action_items": ["Отчёт", "Созв"],
+    }
+
+
+def test_every_prefix_parses_to_a_dict():
+    full = json.dumps(
+        {
+            "mood": 8,
+            "mood_text": "бодро",
+            "summary": 'Цитата: "релиз {в пятницу}", запятые, скобки ]',
+            "action_items": ["Отчёт", "Созвон"],
+            "tags": ["#релиз"],
+        },
+        ensure_ascii=False,
+    )
+
+    for end in range(len(full) + 1):
+        assert isinstance(parse_partial_json(full[:end]), dict)
+    assert parse_partial_json(full) == json.loads(full)
@@ -0,0 +1,187 @@
+import asyncio
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from middlewares.scheduler import UpdateScheduler
+
+USER = User(id=1, is_bot=False, first_name="U")
+
+
+class _Session(BaseSession):
+    """
+    Сессия без сети: запоминает вызовы Bot API.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls.append(method)
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=1,
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def _bot() -> Bot:
+    return Bot("42:TEST", session=_Session())
+
+
+def _message(bot: Bot, text: str) -> Update:
+    message = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=USER.id, type="private"),
+        from_user=USER,
+        text=text,
+    )
+    return Update(update_id=1, message=message.as_(bot))
+
+
+def _callback(bot: Bot) -> Update:
+    query = CallbackQuery(id="1", from_user=USER, chat_instance="c", data="x")
+    return Update(update_id=1, callback_query=query.as_(bot))
+
+
+def _scheduler(**kwargs) -> UpdateScheduler:
+    options = {
+        "max_concurrency": 4,
+        "user_queue_limit": 1,
+        "max_waiting": 100,
+        "defer_seconds": 2,
+    }
+    return UpdateScheduler(**{**options, **kwargs})
+
+
+async def test_updates_of_one_user_run_in_order():
+    bot = _bot()
+    scheduler = _scheduler(user_queue_limit=3)
+    done = []
+
+    async def handler(event, data):
+        await asyncio.sleep(0.01)
+        done.append(event.message.text)
+
+    await asyncio.gather(
+        *(
+            scheduler(handler, _message(bot, str(i)), {"event_from_user": USER})
+            for i in range(8)
+        )
+    )
+
+    assert done == [str(i) for i in range(8)]
+    assert scheduler.stats()["shed_user"] == 0
+    assert scheduler.stats()["busy_users"] == 0
+
+
+async def test_fresh_message_does_not_overtake_deferred_one():
+    bot = _bot()
+    scheduler = _scheduler()
+    done = []
+    fresh = []
+
+    def run(text):
+        return asyncio.create_task(
+            scheduler(handler, _message(bot, text), {"event_from_user": USER})
+        )
+
+    async def handler(event, data):
+        await asyncio.sleep(0.02)
+        if event.message.text == "part 1":
+            # Приходит ровно тогда, когда место «part 1» освобождается, —
+            # раньше, чем отложенная «part 2» успевает проснуться.
+            asyncio.get_running_loop().call_soon(lambda: fresh.append(run("part 3")))
+        done.append(event.message.text)
+
+    first = run("part 1")
+    await asyncio.sleep(0)
+    deferred = run("part 2")
+    await asyncio.gather(first, deferred)
+    await asyncio.gather(*fresh)
+
+    assert done == ["part 1", "part 2", "part 3"]
+    assert scheduler.stats()["shed_user"] == 0
+    assert scheduler.stats()["busy_users"] == 0
+
+
+async def test_cancelled_waiter_passes_its_slot_on():
+    bot = _bot()
+    scheduler = _scheduler()
+    done = []
+
+    async def handler(event, data):
+        await asyncio.sleep(0.02)
+        done.append(event.message.text)
+
+    tasks = [
+        asyncio.create_task(
+            scheduler(handler, _message(bot, text), {"event_from_user": USER})
+        )
+        for text in ("a", "b", "c")
+    ]
+    await asyncio.sleep(0.01)
+    tasks[1].cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert done == ["a", "c"]
+    assert scheduler.stats()["busy_users"] == 0
+
+
+async def test_full_lane_sheds_after_defer_timeout_and_callbacks_at_once():
+    bot = _bot()
+    scheduler = _scheduler(defer_seconds=0.05)
+
+    async def slow(event, data):
+        await asyncio.sleep(0.2)
+
+    busy = asyncio.create_task(
+        scheduler(slow, _message(bot, "busy"), {"event_from_user": USER})
+    )
+    await asyncio.sleep(0)
+    await scheduler(slow, _callback(bot), {"event_from_user": USER})
+    await scheduler(slow, _message(bot, "late"), {"event_from_user": USER})
+    await busy
+
+    calls = bot.session.calls
+    assert [type(call) for call in calls] == [AnswerCallbackQuery, SendMessage]
+    assert calls[1].text.startswith("⏳")
+    assert scheduler.stats()["shed_user"] == 2
+    assert scheduler.stats()["busy_users"] == 0
+
+
+async def test_global_limit_sheds():
+    bot = _bot()
+    scheduler = _scheduler(max_concurrency=1, max_waiting=1)
+    other = User(id=2, is_bot=False, first_name="V")
+
+    async def slow(event, data):
+        await asyncio.sleep(0.05)
+
+    running = asyncio.create_task(
+        scheduler(slow, _message(bot, "1"), {"event_from_user": USER})
+    )
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(
+        scheduler(slow, _message(bot, "2"), {"event_from_user": other})
+    )
+    await asyncio.sleep(0)
+    await scheduler(slow, _callback(bot), {"event_from_user": other})
+    await asyncio.gather(running, waiting)
+
+    assert scheduler.stats()["shed_global"] == 1
+    assert scheduler.stats()["processed"] == 2
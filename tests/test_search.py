@@ -0,0 +1,46 @@
+import pytest
+
+from services.search import MAX_QUERY_TERMS, _stem, query_terms, search_document
+
+
+@pytest.mark.parametrize(
+    "term, stem",
+    [
+        ("релизы", "релиз"),
+        ("релизами", "релиз"),
+        ("релиз", "релиз"),
+        ("задачей", "задач"),
+        ("новыми", "нов"),
+        # Основа короче MIN_STEM_LENGTH — слово не трогаем.
+        ("она", "она"),
+        ("их", "их"),
+        ("release", "release"),
+    ],
+)
+def test_stem(term, stem):
+    assert _stem(term) == stem
+
+
+def test_longer_endings_win():
+    # «иями», а не «и» / «ями».
+    assert _stem("историями") == "истор"
+
+
+def test_query_terms_lowercases_and_drops_punctuation():
+    assert query_terms("Релиз, СРОКИ — v2!") == ["релиз", "сроки", "v2"]
+    assert query_terms("") == []
+    assert query_terms(None) == []
+
+
+def test_query_terms_are_limited():
+    assert len(query_terms(" ".join(f"w{i}" for i in range(50)))) == MAX_QUERY_TERMS
+
+
+def test_search_document_includes_analysis():
+    document = search_document(
+        "Текст",
+        {"summary": "Итог", "action_items": ["Отчёт"], "tags": ["релиз"]},
+    )
+
+    assert document.split("\n") == ["Текст", "Итог", "Отчёт", "релиз"]
+    assert search_document(None, None) == ""
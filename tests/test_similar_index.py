@@ -0,0 +1,139 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from config import SIMILAR_DIM
+from services import similar
+from services.similar import (
+    COMPACT_MIN_DEAD,
+    FORMAT_VERSION,
+    HEADER_BYTES,
+    MAGIC,
+    MIN_CAPACITY,
+    _Index,
+    _write_file,
+    embed,
+    embed_many,
+)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "1.idx"
+    _write_file(path, b"", np.zeros((0, SIMILAR_DIM), dtype=np.float32), MIN_CAPACITY)
+    return path
+
+
+def _notes(count: int) -> tuple[list[uuid.UUID], list[str]]:
+    topics = ["релиз сроки тестирование", "отпуск график замена", "зарплата премия пересмотр"]
+    ids = [uuid.uuid4() for _ in range(count)]
+    texts = [f"{topics[i % len(topics)]} заметка {i}" for i in range(count)]
+    return ids, texts
+
+
+def test_embed_is_unit_length_and_deterministic():
+    vector = embed("Обсудили релиз и сроки тестирования")
+
+    assert vector.shape == (SIMILAR_DIM,)
+    assert np.linalg.norm(vector) == pytest.approx(1, abs=1e-5)
+    assert np.array_equal(vector, embed("Обсудили релиз и сроки тестирования"))
+    assert not embed("и в на 123").any()
+
+
+def test_embed_ranks_shared_words_higher():
+    base = embed("релиз переносится, сроки тестирования горят")
+    close = embed("сроки релиза и тестирования")
+    far = embed("отпуск в августе, нужна замена")
+
+    assert base @ close > base @ far
+
+
+def test_file_header(path):
+    header = np.fromfile(path, dtype="<u4", count=5)
+
+    assert tuple(header) == (MAGIC, FORMAT_VERSION, SIMILAR_DIM, 0, MIN_CAPACITY)
+    assert path.stat().st_size == HEADER_BYTES + MIN_CAPACITY * (16 + SIMILAR_DIM * 4)
+
+
+def test_put_top_and_reopen(path):
+    ids, texts = _notes(9)
+    index = _Index(path)
+    index.put(ids, embed_many(texts))
+
+    top = index.top(ids[0], 3)
+
+    # Ближе всех — заметки на ту же тему.
+    assert {note_id for note_id, _ in top[:2]} == {ids[3], ids[6]}
+    assert all(a[1] >= b[1] for a, b in zip(top, top[1:]))
+    assert ids[0] not in [note_id for note_id, _ in top]
+
+    index.flush()
+    reopened = _Index(path)
+    assert reopened.note_ids == ids
+    assert reopened.top(ids[0], 3) == top
+
+
+def test_put_existing_note_updates_vector(path):
+    ids, texts = _notes(3)
+    index = _Index(path)
+    index.put(ids, embed_many(texts))
+
+    index.put([ids[0]], embed_many(["совсем другой текст про отпуск"]))
+
+    assert len(index.note_ids) == 3
+    assert np.array_equal(index.vectors[0], embed("совсем другой текст про отпуск"))
+
+
+def test_put_grows_the_file(path):
+    ids, texts = _notes(MIN_CAPACITY + 10)
+    index = _Index(path)
+
+    index.put(ids, embed_many(texts))
+
+    assert len(index.ids) >= MIN_CAPACITY + 10
+    assert _Index(path).note_ids == ids
+
+
+def test_remove_and_compaction(path):
+    ids, texts = _notes(COMPACT_MIN_DEAD * 2 + 2)
+    index = _Index(path)
+    index.put(ids, embed_many(texts))
+
+    assert index.remove(ids[0]) is True
+    assert index.remove(ids[0]) is False
+    assert ids[0] not in [note_id for note_id, _ in index.top(ids[3], 10)]
+    assert _Index(path).note_ids[0] is None
+
+    removed = ids[1:COMPACT_MIN_DEAD + 2]
+    for note_id in removed:
+        index.remove(note_id)
+
+    # Больше половины строк удалено — файл переписан без них.
+    assert index.dead == 0
+    assert index.note_ids == ids[COMPACT_MIN_DEAD + 2:]
+    assert _Index(path).note_ids == index.note_ids
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / "bad.idx"
+    path.write_bytes(b"not an index" * 100)
+
+    with pytest.raises(ValueError):
+        _Index(path)
+
+
+def test_rejects_truncated_file(path):
+    with open(path, "r+b") as file:
+        file.truncate(HEADER_BYTES + 100)
+
+    with pytest.raises(ValueError):
+        _Index(path)
+
+
+def test_index_path_depends_on_format(monkeypatch, tmp_path):
+    monkeypatch.setattr(similar, "SIMILAR_INDEX_DIR", str(tmp_path))
+
+    assert similar._index_path(7) == (
+        tmp_path / f"v{FORMAT_VERSION}-d{SIMILAR_DIM}" / "7.idx"
+    )
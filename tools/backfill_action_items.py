@@ -0,0 +1,38 @@
+"""
+Пересборка таблицы action_items по разборам всех заметок.
+
+    python -m tools.backfill_action_items
+
+Нужна один раз после обновления на базе с разобранными заметками (дальше
+задачи ведёт services/notes.py) и для починки. Отметки «сделано»
+сохраняются, если текст задачи не изменился.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from database.db import close_db, init_db
+from services import action_items
+
+
+async def run(args: argparse.Namespace) -> None:
+    await init_db()
+    try:
+        started = time.monotonic()
+        count = await action_items.rebuild()
+        print(f"{count} action items rebuilt in {time.monotonic() - started:.1f}s")
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild action items table")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""
+Пересборка агрегатов настроения (таблица mood_rollups) по всем заметкам.
+
+    python -m tools.backfill_rollups [--person-id 42]
+
+Нужна один раз после обновления на базе с заметками (дальше агрегаты
+ведёт services/notes.py) и для починки, если агрегаты разошлись с заметками.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from database.db import close_db, init_db
+from services import mood_rollups
+
+
+async def run(args: argparse.Namespace) -> None:
+    await init_db()
+    try:
+        started = time.monotonic()
+        counted = await mood_rollups.rebuild(args.person_id)
+        print(f"Rollups rebuilt from {counted} notes in {time.monotonic() - started:.1f}s")
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild mood rollups")
+    parser.add_argument("--person-id", type=int, help="только одна встреча")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
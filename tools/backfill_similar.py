@@ -0,0 +1,55 @@
+"""
+Пересборка индексов похожих заметок (SIMILAR_INDEX_DIR) по заметкам в БД.
+
+    python -m tools.backfill_similar [--user USER_ID]
+
+Не обязательна: индекса пользователя нет — его соберёт первый поиск
+похожих. Нужна, чтобы собрать индексы заранее, и для починки индекса,
+разошедшегося с БД (например, после восстановления базы из бэкапа).
+Запускать при остановленном боте: файлом индекса владеет процесс бота.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from database.db import close_db, init_db
+from database.models import Person
+from services import similar
+
+
+async def run(args: argparse.Namespace) -> None:
+    await init_db()
+    try:
+        if args.user is not None:
+            user_ids = [args.user]
+        else:
+            user_ids = await (
+                Person.filter(notes_count__gt=0)
+                .distinct()
+                .order_by("user_id")
+                .values_list("user_id", flat=True)
+            )
+        started = time.monotonic()
+        total = 0
+        for user_id in user_ids:
+            total += await similar.rebuild(user_id)
+        print(
+            f"{total} notes indexed for {len(user_ids)} users "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild similar notes indexes")
+    parser.add_argument("--user", type=int, help="only this Telegram user id")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Пересборка связей заметок с тегами (tags, note_tags) и счётчиков тегов.
+
+    python -m tools.backfill_tags
+
+Нужна один раз после обновления на базе с разобранными заметками (дальше
+теги ведёт services/notes.py) и для починки счётчиков. Теги берутся из
+ai_summary; у разборов, сделанных до хранения хештегов LLM, там только тег
+встречи — полные теги появятся после повторного разбора.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from database.db import close_db, init_db
+from services import tags
+
+
+async def run(args: argparse.Namespace) -> None:
+    await init_db()
+    try:
+        started = time.monotonic()
+        count = await tags.rebuild()
+        print(f"{count} note tags rebuilt in {time.monotonic() - started:.1f}s")
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild note tags")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
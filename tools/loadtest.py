@@ -0,0 +1,318 @@
+"""
+Офлайн нагрузочный тест бота: без Telegram и без OpenAI.
+
+    python -m tools.loadtest --users 200 --notes 3 --concurrency 50
+
+Поднимает Dispatcher так же, как bot.py (setup_dispatcher), кормит его
+синтетическими Update через feed_update, исходящие вызовы Bot API отвечает
+локальная фейковая сессия, а AsyncOpenAI смотрит в tools/openai_stub.py.
+В конце печатает пропускную способность и p50/p95/p99 по хендлерам.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.enums import ParseMode
+from aiogram.methods import TelegramMethod
+from aiogram.types import (
+    CallbackQuery,
+    Chat,
+    Message,
+    TelegramObject,
+    Update,
+    User,
+)
+
+from tools.openai_stub import StubConfig, start_stub
+
+FIRST_USER_ID = 10_000_000
+
+
+class FakeSession(BaseSession):
+    """
+    Отвечает на вызовы Bot API локально: send* возвращают Message,
+    остальное — True. Можно добавить искусственную задержку.
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        super().__init__()
+        self.latency = latency_ms / 1000
+        self.calls: dict[str, int] = defaultdict(int)
+        self._message_ids = itertools.count(1)
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[Any],
+        timeout: int | None = None,
+    ) -> Any:
+        name = type(method).__name__
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if name.startswith("Send"):
+            chat_id = getattr(method, "chat_id", 0)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+class LatencyMiddleware(BaseMiddleware):
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> User:
+        return User(
+            id=user_id,
+            is_bot=False,
+            first_name=f"Load{user_id}",
+            username=f"load{user_id}",
+        )
+
+    def message(self, user_id: int, text: str) -> Update:
+        return Update(
+            update_id=next(self._update_ids),
+            message=Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=user_id, type="private"),
+                from_user=self._user(user_id),
+                text=text,
+            ),
+        )
+
+    def callback(self, user_id: int, data: str) -> Update:
+        return Update(
+            update_id=next(self._update_ids),
+            callback_query=CallbackQuery(
+                id=str(next(self._callback_ids)),
+                from_user=self._user(user_id),
+                chat_instance="loadtest",
+                data=data,
+                message=Message(
+                    message_id=next(self._message_ids),
+                    date=datetime.now(),
+                    chat=Chat(id=user_id, type="private"),
+                    text="…",
+                ),
+            ),
+        )
+
+
+async def _user_scenario(
+    dp: Dispatcher,
+    bot: Bot,
+    factory: UpdateFactory,
+    user_id: int,
+    notes: int,
+    update_latencies: list[float],
+) -> None:
+    from database.models import Person
+
+    async def feed(update: Update) -> None:
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        update_latencies.append(time.perf_counter() - started)
+
+    await feed(factory.message(user_id, "/start"))
+    await feed(factory.message(user_id, "/add_person"))
+    await feed(factory.message(user_id, f"Команда {user_id}"))
+    await feed(factory.message(user_id, "📅 Встречи"))
+
+    person = await Person.filter(user_id=user_id).first()
+    if not person:
+        return
+
+    await feed(factory.callback(user_id, f"person_select:{person.id}"))
+    for note_no in range(notes):
+        await feed(factory.callback(user_id, f"add_note:{person.id}"))
+        await feed(factory.message(
+            user_id,
+            f"Заметка {note_no} от {user_id}: обсудили релиз, риски и отпуск.",
+        ))
+        await feed(factory.callback(user_id, f"history:{person.id}"))
+    await feed(factory.message(user_id, "/my_team"))
+
+
+async def _wait_queue_drained(timeout: float) -> float | None:
+    from services import analysis_queue
+
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        stats = await analysis_queue.queue_stats()
+        if stats["pending"] == 0 and stats["running"] == 0:
+            return time.perf_counter() - started
+        await asyncio.sleep(0.2)
+    return None
+
+
+def _print_report(
+    *,
+    wall: float,
+    update_latencies: list[float],
+    middleware: LatencyMiddleware,
+    drain: float | None,
+    stub: StubConfig,
+    session: FakeSession,
+    service_metrics: dict,
+) -> None:
+    total = len(update_latencies)
+    print(f"\nUpdates: {total} in {wall:.2f}s -> {total / wall:.1f} updates/s")
+    print(
+        f"Update latency p50/p95/p99: "
+        f"{percentile(update_latencies, 50) * 1000:.1f} / "
+        f"{percentile(update_latencies, 95) * 1000:.1f} / "
+        f"{percentile(update_latencies, 99) * 1000:.1f} ms"
+    )
+
+    print(f"\n{'handler':<34}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, samples in sorted(middleware.samples.items()):
+        print(
+            f"{name:<34}{len(samples):>8}"
+            f"{percentile(samples, 50) * 1000:>10.1f}"
+            f"{percentile(samples, 95) * 1000:>10.1f}"
+            f"{percentile(samples, 99) * 1000:>10.1f}"
+        )
+
+    print(
+        "\nAnalysis queue drained in "
+        + (f"{drain:.2f}s" if drain is not None else "— (timeout)")
+    )
+    print(f"OpenAI stub: {dict(stub.stats)}")
+    print(f"Bot API calls: {dict(session.calls)}")
+    for source, values in service_metrics.items():
+        print(f"{source}: {values}")
+
+
+async def run(args: argparse.Namespace) -> None:
+    stub = StubConfig(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_latency_ms / 3,
+        error_rate=args.llm_error_rate,
+    )
+    stub_runner, stub_url = await start_stub(stub)
+
+    # AICODE-NOTE: Конфиг читается при импорте, поэтому окружение задаём
+    # до импорта модулей бота.
+    os.environ["BOT_TOKEN"] = "123456:LOADTEST"
+    os.environ["OPENAI_API_KEY"] = "sk-loadtest"
+    os.environ["OPENAI_BASE_URL"] = stub_url
+    os.environ["DATABASE_URL"] = args.db_url
+
+    from bot import setup_dispatcher
+    from database.db import close_db, init_db
+    from services import analysis_queue, metrics
+
+    session = FakeSession(latency_ms=args.bot_latency_ms)
+    bot = Bot(
+        token=os.environ["BOT_TOKEN"],
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    dp = setup_dispatcher()
+    # Внутренние middleware корневого роутера применяются ко всем вложенным.
+    middleware = LatencyMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+
+    await init_db()
+    await analysis_queue.start_workers(bot)
+
+    factory = UpdateFactory()
+    update_latencies: list[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(user_id: int) -> None:
+        async with semaphore:
+            await _user_scenario(
+                dp, bot, factory, user_id, args.notes, update_latencies
+            )
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            limited(FIRST_USER_ID + n) for n in range(args.users)
+        ))
+        wall = time.perf_counter() - started
+        drain = await _wait_queue_drained(args.drain_timeout)
+
+        _print_report(
+            wall=wall,
+            update_latencies=update_latencies,
+            middleware=middleware,
+            drain=drain,
+            stub=stub,
+            session=session,
+            service_metrics=await metrics.collect(),
+        )
+    finally:
+        await analysis_queue.stop_workers()
+        await dp.storage.close()
+        await close_db()
+        await stub_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline bot load test")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--notes", type=int, default=2, help="заметок на пользователя")
+    parser.add_argument("--concurrency", type=int, default=50, help="пользователей одновременно")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--bot-latency-ms", type=float, default=0)
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
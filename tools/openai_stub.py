@@ -0,0 +1,168 @@
+"""
+Локальная заглушка OpenAI Chat Completions для нагрузочных тестов.
+
+    python -m tools.openai_stub --port 8089 --latency-ms 300 --error-rate 0.05
+
+Отвечает валидным JSON-разбором заметки с настраиваемой задержкой и долей
+ошибок (429 с Retry-After или 500). Поддерживает stream=True (SSE).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+STUB_ANALYSIS = {
+    "mood": 6,
+    "mood_text": "Спокойное",
+    "summary": "Обсудили текущие задачи и планы на неделю.",
+    "action_items": ["Подготовить план релиза", "Созвониться с дизайнером"],
+    "positive": "Закрыли долгий баг",
+    "negative": None,
+    "tags": ["#loadtest"],
+}
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        jitter_ms: float = 100,
+        error_rate: float = 0.0,
+        stream_chunk_chars: int = 16,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stats = {"requests": 0, "errors": 0, "streams": 0}
+
+
+def _latency(config: StubConfig) -> float:
+    delay = random.gauss(config.latency_ms, config.jitter_ms)
+    return max(0.0, delay) / 1000
+
+
+def _error_response() -> web.Response:
+    if random.random() < 0.5:
+        return web.json_response(
+            {"error": {"message": "Rate limit (stub)", "type": "rate_limit"}},
+            status=429,
+            headers={"retry-after": "1"},
+        )
+    return web.json_response(
+        {"error": {"message": "Internal error (stub)", "type": "server_error"}},
+        status=500,
+    )
+
+
+async def _stream(request: web.Request, model: str, content: str, config: StubConfig):
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    step = config.stream_chunk_chars
+    # Задержка до первого токена — половина общей, остальное — по чанкам.
+    total_delay = _latency(config)
+    await asyncio.sleep(total_delay / 2)
+    pieces = [content[i:i + step] for i in range(0, len(content), step)]
+    for piece in pieces:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [
+                {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+            ],
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await asyncio.sleep(total_delay / 2 / len(pieces))
+
+    usage_chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [],
+        "usage": {"prompt_tokens": 300, "completion_tokens": 120, "total_tokens": 420},
+    }
+    await response.write(f"data: {json.dumps(usage_chunk)}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    config: StubConfig = request.app["stub_config"]
+    config.stats["requests"] += 1
+    payload = await request.json()
+    model = payload.get("model", "stub")
+
+    if random.random() < config.error_rate:
+        config.stats["errors"] += 1
+        await asyncio.sleep(_latency(config) / 4)
+        return _error_response()
+
+    content = json.dumps(STUB_ANALYSIS, ensure_ascii=False)
+    if payload.get("stream"):
+        config.stats["streams"] += 1
+        return await _stream(request, model, content, config)
+
+    await asyncio.sleep(_latency(config))
+    return web.json_response({
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 300, "completion_tokens": 120, "total_tokens": 420},
+    })
+
+
+def create_app(config: StubConfig) -> web.Application:
+    app = web.Application()
+    app["stub_config"] = config
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+async def start_stub(config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+    """
+    Запускает заглушку в текущем event loop. Возвращает (runner, base_url).
+    port=0 — свободный порт.
+    """
+    runner = web.AppRunner(create_app(config), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate)
+    web.run_app(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import base64
+import uuid
+
+# AICODE-NOTE: callback_data в Telegram ограничена 64 байтами, поэтому UUID
+# заметок в кнопках пишем компактно: 22 символа base64url вместо 36.
+
+
+def pack_uuid(value) -> str:
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(str(value))
+    return base64.urlsafe_b64encode(value.bytes).decode("ascii").rstrip("=")
+
+
+def unpack_uuid(value: str) -> uuid.UUID:
+    """
+    Принимает и компактную форму (22 символа), и обычную (36) — в старых
+    сообщениях остались кнопки с полным UUID. ValueError, если не UUID.
+    """
+    if len(value) == 22:
+        try:
+            return uuid.UUID(bytes=base64.urlsafe_b64decode(value + "=="))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Bad packed UUID: {value}") from e
+    return uuid.UUID(value)
@@ -0,0 +1,73 @@
+import os
+from datetime import date
+
+# AICODE-NOTE: Функции модуля выполняются в отдельном процессе
+# (services/mood_charts.py, ProcessPoolExecutor со spawn), поэтому модуль
+# не импортирует ни конфиг, ни БД, а matplotlib — только внутри функции:
+# основной процесс бота его не загружает.
+
+
+def warm_up() -> None:
+    """
+    Импортирует matplotlib в процессе пула заранее: первый график не ждёт
+    запуска процесса и загрузки библиотеки.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure  # noqa: F401
+
+
+def render_mood_chart(
+    path: str,
+    title: str,
+    days: list[tuple[date, float, int, int]],
+    weeks: list[tuple[date, float]],
+) -> None:
+    """
+    Рисует PNG: среднее по дням с полосой min–max и среднее по неделям.
+    days — (день, среднее, минимум, максимум), weeks — (понедельник, среднее).
+    Файл пишется атомарно: сначала во временный, затем переименование.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib.dates import DateFormatter
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 4), dpi=100)
+    ax = fig.subplots()
+
+    day_dates = [row[0] for row in days]
+    # Разброс за день — вертикальная полоса: видна и у одиночных дней.
+    ax.vlines(
+        day_dates,
+        [row[2] for row in days],
+        [row[3] for row in days],
+        linewidth=4,
+        alpha=0.25,
+        label="мин–макс за день",
+    )
+    ax.plot(day_dates, [row[1] for row in days], "o-", markersize=3, label="день")
+    if weeks:
+        ax.plot(
+            [row[0] for row in weeks],
+            [row[1] for row in weeks],
+            "s-",
+            linewidth=2.5,
+            markersize=5,
+            label="неделя (с понедельника)",
+        )
+
+    ax.set_title(title)
+    ax.set_ylim(0.5, 10.5)
+    ax.set_yticks(range(1, 11))
+    ax.grid(alpha=0.3)
+    ax.xaxis.set_major_formatter(DateFormatter("%d.%m"))
+    ax.legend(loc="lower left", fontsize="small")
+    fig.autofmt_xdate()
+    fig.tight_layout()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format="png")
+    os.replace(tmp_path, path)
@@ -0,0 +1,29 @@
+import bisect
+import hashlib
+from typing import Hashable, Sequence
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Консистентное хеширование: ключ всегда попадает на один и тот же узел,
+    а при изменении числа узлов переезжает лишь ~1/N ключей.
+    """
+
+    def __init__(self, nodes: Sequence[Hashable], replicas: int = 160):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: Hashable) -> Hashable:
+        index = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._nodes[index]
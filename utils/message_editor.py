@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from config import STREAM_EDIT_INTERVAL_SECONDS
+
+
+class ThrottledEditor:
+    """
+    Правит одно сообщение бота не чаще, чем раз в min_interval секунд
+    (Telegram ограничивает частоту правок). Обновления внутри окна
+    пропускаются — важно только последнее состояние, force=True шлёт сразу.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        min_interval: float = STREAM_EDIT_INTERVAL_SECONDS,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.min_interval = min_interval
+        self.edits = 0
+        self._last_text: str | None = None
+        self._next_allowed = 0.0
+        self._gone = False
+
+    async def update(
+        self,
+        text: str,
+        reply_markup: InlineKeyboardMarkup | None = None,
+        *,
+        force: bool = False,
+    ) -> bool:
+        """
+        Возвращает False, если сообщение больше нельзя править (удалено).
+        """
+        if self._gone:
+            return False
+        if text == self._last_text:
+            return True
+
+        now = time.monotonic()
+        if now < self._next_allowed:
+            if not force:
+                return True
+            await asyncio.sleep(self._next_allowed - now)
+
+        try:
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                reply_markup=reply_markup,
+            )
+        except TelegramRetryAfter as e:
+            self._next_allowed = time.monotonic() + e.retry_after
+            if force:
+                return await self.update(text, reply_markup, force=True)
+            return True
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                self._last_text = text
+                return True
+            self._gone = True
+            return False
+
+        self.edits += 1
+        self._last_text = text
+        self._next_allowed = time.monotonic() + self.min_interval
+        return True
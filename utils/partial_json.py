@@ -0,0 +1,82 @@
+import json
+
+
+def _scan(buf: str) -> tuple[list[str], bool, bool, list[int]]:
+    """
+    Проходит по префиксу JSON и возвращает:
+    (стек закрывающих скобок, внутри строки?, висит ли escape,
+    позиции "безопасных" обрезок — после запятых и открывающих скобок).
+    """
+    closers: list[str] = []
+    cut_points: list[int] = []
+    in_string = False
+    escaped = False
+
+    for i, ch in enumerate(buf):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch == "{":
+            closers.append("}")
+            cut_points.append(i + 1)
+        elif ch == "[":
+            closers.append("]")
+            cut_points.append(i + 1)
+        elif ch in "}]":
+            if closers:
+                closers.pop()
+        elif ch == ",":
+            cut_points.append(i)
+
+    return closers, in_string, escaped, cut_points
+
+
+def _try_close(prefix: str, *, is_tail: bool = False) -> dict | None:
+    closers, in_string, escaped, _ = _scan(prefix)
+    candidate = prefix
+    if in_string:
+        if escaped:
+            candidate = candidate[:-1]
+        candidate += '"'
+    candidate = candidate.rstrip()
+    if candidate.endswith(":"):
+        return None
+    # Хвост потока может оборваться посреди числа или литерала ("1" из "10",
+    # "tr" из "true") — такое значение не показываем.
+    if is_tail and not in_string and candidate[-1] not in '"{}[],':
+        return None
+    try:
+        value = json.loads(candidate + "".join(reversed(closers)))
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def parse_partial_json(buf: str) -> dict:
+    """
+    Разбирает незавершённый JSON-объект (поток от LLM) и возвращает всё,
+    что уже можно показать: завершённые поля и недописанную строку.
+    Недописанные числа/ключи отбрасываются до последней запятой.
+    """
+    buf = buf.strip()
+    if not buf.startswith("{"):
+        return {}
+
+    value = _try_close(buf, is_tail=True)
+    if value is not None:
+        return value
+
+    _, _, _, cut_points = _scan(buf)
+    for cut in reversed(cut_points):
+        value = _try_close(buf[:cut])
+        if value is not None:
+            return value
+    return {}
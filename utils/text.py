@@ -0,0 +1,30 @@
+SNIPPET_LENGTH = 28
+
+
+def make_snippet(text: str, max_len: int = SNIPPET_LENGTH) -> str:
+    """
+    Однострочное начало текста для кнопок и списков.
+    """
+    # Нормализуем пробелы только в начале текста: длина заметки не важна.
+    one_line = " ".join((text or "")[: max_len * 4].split())
+    if len(one_line) <= max_len:
+        return one_line
+    return one_line[: max_len - 1] + "…"
+
+
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+SPARK_GAP = "·"
+
+
+def sparkline(values: list[float | None], low: float = 1, high: float = 10) -> str:
+    """
+    Текстовый график: по символу на значение, None — пропуск.
+    """
+    chars = []
+    for value in values:
+        if value is None:
+            chars.append(SPARK_GAP)
+            continue
+        share = (min(max(value, low), high) - low) / (high - low)
+        chars.append(SPARK_BARS[round(share * (len(SPARK_BARS) - 1))])
+    return "".join(chars)
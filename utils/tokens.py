@@ -0,0 +1,26 @@
+import math
+import re
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Средняя длина токена в символах для разных алфавитов (BPE-токенизаторы
+# OpenAI режут кириллицу заметно мельче латиницы).
+_CHARS_PER_TOKEN_LATIN = 4.0
+_CHARS_PER_TOKEN_OTHER = 2.7
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Локальная оценка числа токенов без токенизатора и сети.
+    Точность ~±20%, этого достаточно для лимитов и нарезки текста.
+    """
+    total = 0
+    for piece in _WORD_RE.findall(text or ""):
+        if not piece[0].isalnum() and piece[0] != "_":
+            total += 1
+            continue
+        per_token = (
+            _CHARS_PER_TOKEN_LATIN if piece.isascii() else _CHARS_PER_TOKEN_OTHER
+        )
+        total += math.ceil(len(piece) / per_token)
+    return total
@@ -0,0 +1,177 @@
+import asyncio
+import hmac
+import logging
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import (
+    WEBHOOK_DRAIN_SECONDS,
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_IN_FLIGHT,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Сколько запрос ждёт свободного слота, прежде чем ответить 503.
+SLOT_WAIT_SECONDS = 5
+
+
+class WebhookHandler:
+    """
+    Принимает апдейты от Telegram (или от прокси/supervisor) и обрабатывает
+    их фоновыми задачами: HTTP-ответ уходит сразу, не дожидаясь хендлера.
+
+    AICODE-NOTE: Одновременно выполняется не больше max_in_flight апдейтов.
+    Когда слотов нет, запрос ждёт SLOT_WAIT_SECONDS и получает 503 —
+    Telegram повторит доставку позже, а мы не копим задачи без предела.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        *,
+        secret: str,
+        max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self._secret = secret
+        self._max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set[asyncio.Task] = set()
+        self._closing = False
+        self._stats = {
+            "received": 0,
+            "unauthorized": 0,
+            "rejected_busy": 0,
+            "errors": 0,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self._secret.encode()):
+            self._stats["unauthorized"] += 1
+            return web.Response(status=401)
+
+        if self._closing:
+            return web.Response(status=503)
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), SLOT_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            self._stats["rejected_busy"] += 1
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(
+                await request.json(),
+                context={"bot": self.bot},
+            )
+        except Exception as e:
+            self._slots.release()
+            logger.warning("Malformed webhook payload: %s", e)
+            return web.Response(status=400)
+
+        self._stats["received"] += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self._stats["errors"] += 1
+            logger.exception("Update %s failed", update.update_id)
+        finally:
+            self._slots.release()
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_SECONDS) -> None:
+        """
+        Перестаёт принимать апдейты и ждёт незавершённые хендлеры.
+        """
+        self._closing = True
+        if not self._tasks:
+            return
+        logger.info("Draining %s in-flight updates", len(self._tasks))
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("Cancelled %s updates after drain timeout", len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": len(self._tasks),
+            "max_in_flight": self._max_in_flight,
+        }
+
+
+def build_app(handler: WebhookHandler, path: str = WEBHOOK_PATH) -> web.Application:
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(handler.stats())
+
+    app = web.Application()
+    app.router.add_post(path, handler.handle)
+    app.router.add_get("/healthz", health)
+    return app
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    *,
+    host: str = WEBHOOK_HOST,
+    port: int = WEBHOOK_PORT,
+    stop_event: asyncio.Event | None = None,
+) -> None:
+    """
+    Держит HTTP-сервер до SIGTERM/SIGINT (или stop_event), затем дожидается
+    незавершённых апдейтов. Закрытие БД и воркеров — на вызывающем (bot.py).
+    """
+    handler = WebhookHandler(dp, bot, secret=WEBHOOK_SECRET)
+    metrics.register("webhook", handler.stats)
+
+    runner = web.AppRunner(build_app(handler))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Webhook server listening on %s:%s%s", host, port, WEBHOOK_PATH)
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(WEBHOOK_MAX_IN_FLIGHT, 100),
+        )
+        logger.info("Webhook registered at %s", WEBHOOK_URL + WEBHOOK_PATH)
+
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await stop_event.wait()
+        logger.info("Stopping webhook server...")
+    finally:
+        # Вебхук в Telegram не удаляем: пока бот перезапускается, апдейты
+        # копятся на стороне Telegram и придут после старта.
+        await handler.drain()
+        await runner.cleanup()
+        await bot.session.close()